@@ -5,75 +5,99 @@ Includes class for buyer negotiators in the marketplace.
 from api.models.buyer import Buyer
 from api.models.bid import Bid
 from api.models.ticket import Ticket
-from typing import List
+from typing import List, Optional, Tuple
 from api.core.sub_market import SubMarket
-from configs import MAX_ROUNDS, PROMPTS_DIR
-import os
-import re
+from api.core.agents.history import ConversationHistory, estimate_tokens
+from api.core.agents.offer_protocol import ACCEPT, OFFER, WALK, Offer, same_price
+from api.core.agents.prompt_registry import PromptTemplate, prompt_registry
+from api.core.agents.strategies import NegotiationStrategy, strategy_for
+from configs import MAX_ROUNDS
 import logging
-# from api.services.openrouter_client import call_openrouter_with_prompt
-from api.services.gpt_service import call_gpt
 
 class BuyerNegotiator:
     """
     Represents a buyer agent in the marketplace.
     """
 
-    def __init__(self, bid: Bid, SubMarket: SubMarket) -> None:
+    def __init__(self, bid: Bid, SubMarket: SubMarket, strategy: Optional[NegotiationStrategy] = None) -> None:
         self.bid = bid
+        # Buyer prompts pack only with other buyer prompts, never with a seller's
+        self.batch_key = "buyer"
         self.Buyer = Buyer.get_buyer_by_id(bid.buyer_id)
+        self.strategy = strategy or strategy_for(bid.sensitivity_to_price, SubMarket)
 
         # Track negotiation state
         self.conversation_history: List[dict] = []
         self.current_offer = None
+        # This side's own most recent offer
+        self.last_offer: Optional[float] = None
         self.num_rounds = 1
         self.max_rounds = MAX_ROUNDS
         self.submarket = SubMarket
         self.resolved = False
+        self.walked = False
+        # Compacted view of conversation_history used to build prompts
+        self.history = ConversationHistory()
+        # (submarket template, template with this bid's details bound, its size in tokens)
+        self._prompt_templates: Optional[Tuple[PromptTemplate, PromptTemplate, int]] = None
         
         # Setup logger with bid context
         self.logger = logging.getLogger(f"{__name__}.{bid.bid_id}")
         if not self.logger.handlers:
             logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        self.logger.info(f"BuyerNegotiator initialized for bid_id={bid.bid_id}, buyer_id={bid.buyer_id}")
+        self.logger.info(f"BuyerNegotiator initialized for bid_id={bid.bid_id}, buyer_id={bid.buyer_id}, strategy={self.strategy.name}")
 
     def construct_prompt(self) -> str:
         """
         Constructs the prompt for the buyer negotiator from template.
         """
-        # Load template
-        template_path = os.path.join(PROMPTS_DIR, "buyer_negotiation.txt")
-        with open(template_path, "r") as f:
-            template = f.read()
-        
-        # Format with values
-        prompt = template.format(
-            num_tickets=self.bid.num_tickets,
-            bid_price=self.bid.price,
-            max_price=self.bid.max_price,
-            allowed_groups=', '.join(self.bid.allowed_groups) if self.bid.allowed_groups else 'All Groups',
-            reference_values=self.submarket.get_reference_values(),
-            sensitivity_to_price=self.bid.sensitivity_to_price,
-            conversation_history=self.conversation_history,
-            max_rounds=self.max_rounds
-        )
-        
+        template = prompt_registry.for_submarket("buyer_negotiation", self.submarket)
+        if self._prompt_templates is None or self._prompt_templates[0] is not template:
+            # Bind everything but the conversation once per template version
+            bound = template.partial(
+                num_tickets=self.bid.num_tickets,
+                bid_price=self.bid.price,
+                max_price=self.bid.max_price,
+                allowed_groups=', '.join(self.bid.allowed_groups) if self.bid.allowed_groups else 'All Groups',
+                sensitivity_to_price=self.bid.sensitivity_to_price,
+                max_rounds=self.max_rounds
+            )
+            self._prompt_templates = (template, bound, estimate_tokens(bound.render(conversation_history="")))
+
+        _, bound, static_tokens = self._prompt_templates
+        prompt = bound.render(conversation_history=self.history.render(static_tokens))
+        self.logger.debug(f"Buyer prompt tokens for round {self.num_rounds}: {self.history.last_tokens_before} uncompacted, {self.history.last_tokens_after} sent")
         return prompt
     
-    def _offer_accepted(self, message: str) -> bool:
+    def strategy_bounds(self) -> Tuple[float, float]:
+        """
+        Returns the (opening, reserve) prices rule-based strategies concede between.
+        """
+        return self.bid.price, self.bid.max_price
+
+    def offer_message(self, price: float) -> str:
+        return f"I can offer ${price:.2f} per ticket."
+
+    def accept_message(self, price: float) -> str:
+        return f"Thank you for your patience! I agree to purchase your ticket at {price:.2f}"
+
+    def _offer_accepted(self, offer: Offer) -> bool:
         """
-        Checks if the buyer accepted the seller's offer.
+        Checks if a turn accepts the price currently on the table.
         """
-        price = self._extract_price_from_message(message)
-        if price == self.current_offer:
-            return True
-        return False
+        return offer.action == ACCEPT or (offer.action == OFFER and same_price(offer.price, self.current_offer))
     
     def is_resolved(self) -> bool:
         """
         Checks if the negotiation has been resolved.
         """
         return self.resolved
+
+    def has_walked(self) -> bool:
+        """
+        Checks if either side walked away from the negotiation.
+        """
+        return self.walked
     
     def get_conversation_history(self) -> List[dict]:
         """
@@ -81,81 +105,72 @@ class BuyerNegotiator:
         """
         return self.conversation_history
 
+    def _record(self, side: str, offer: Offer) -> None:
+        self.conversation_history.append(f'Round {self.num_rounds} - {side}: {offer.message}')
+        self.history.add(self.num_rounds, side, offer.message, offer.price)
     
-    def _extract_price_from_message(self, message: str) -> float:
-        """
-        Extract the last numeric amount from the message and return it as int.
-        Supports thousands separators and optional decimals. Returns -1 if none found.
-        """
-        pattern = re.compile(r'(?P<num>-?(?:\d{1,3}(?:,\d{3})*|\d+)(?:\.\d{1,2})?)')
-        last = None
-        for m in pattern.finditer(message):
-            last = m
-        if not last:
-            return -1
-
-        num_str = last.group('num').replace(',', '')
-        try:
-            # Cast via float to handle decimals; int() truncates toward zero.
-            return float(num_str)
-        except ValueError:
-            return -1
-    
-    def process_seller_response(self, message: str) -> str:
+    def process_seller_response(self, offer: Offer) -> None:
         """
-        Processes the seller's message and decides on next action.
+        Processes the seller's turn.
         """
-        self.logger.info(f"Buyer processing seller response for bid_id={self.bid.bid_id}: {message[:100]}...")
-        
-        if self._offer_accepted(message):
+        self.logger.info(f"Buyer processing seller {offer.action} for bid_id={self.bid.bid_id}: price={offer.price}, {offer.message[:100]}")
+
+        if self.resolved:
+            # This side already accepted the seller's previous price
+            return None
+
+        if self._offer_accepted(offer):
             self.resolved = True
-            self.logger.info(f"Buyer found ACCEPTED offer in seller message for bid_id={self.bid.bid_id}")
-        
+            # Settle on the price the seller accepted, which may predate this round's offer
+            if offer.price is not None:
+                self.current_offer = offer.price
+            self._record('Seller', offer)
+            self.logger.info(f"Buyer found ACCEPTED offer from seller for bid_id={self.bid.bid_id}, price=${self.current_offer}")
+
+        elif offer.action == WALK:
+            self.walked = True
+            self._record('Seller', offer)
+            self.logger.info(f"Seller walked away from bid_id={self.bid.bid_id}")
+
         else:
-            seller_price = self._extract_price_from_message(message)
-            if seller_price == -1:
-                self.logger.error(f"Could not extract price from seller's message for bid_id={self.bid.bid_id}: {message}")
-                raise ValueError("Could not extract price from seller's message.")
-            
-            # change self.current_offer to seller price
-            elif seller_price == self.current_offer:
-                self.resolved = True
-                self.logger.info(f"Buyer found matching offer for bid_id={self.bid.bid_id}, price=${seller_price}")
-            else:
-                self.current_offer = seller_price
-                self.conversation_history.append(f'Round {self.num_rounds} - Seller: {message}')
-                self.num_rounds += 1
-                self.logger.info(f"Buyer received new offer for bid_id={self.bid.bid_id}, round={self.num_rounds-1}, price=${seller_price}")
+            self.current_offer = offer.price
+            self._record('Seller', offer)
+            self.num_rounds += 1
+            self.logger.info(f"Buyer received new offer for bid_id={self.bid.bid_id}, round={self.num_rounds-1}, price=${offer.price}")
 
         return None
     
-    def negotiate(self) -> str:
+    def negotiate(self) -> Offer:
         """
-        Decides on the next action based on current offer and bid constraints.
+        Decides on the next turn based on the current offer and the buyer's constraints.
         """
         self.logger.info(f"Buyer starting negotiation round {self.num_rounds} for bid_id={self.bid.bid_id}")
         
-        prompt = self.construct_prompt()
-        self.logger.debug(f"Buyer prompt constructed for bid_id={self.bid.bid_id}, round={self.num_rounds}")
-        
-        model_response = call_gpt(prompt)
-        self.logger.info(f"Buyer received LLM response for bid_id={self.bid.bid_id}: {model_response[:100]}...")
+        offer = self.strategy.respond(self)
+        self.logger.info(f"Buyer received {self.strategy.name} turn for bid_id={self.bid.bid_id}: {offer.action} at {offer.price}")
+
+        if offer.action == ACCEPT and self.current_offer is None:
+            # Nothing is on the table yet, so treat it as an opening offer
+            price = offer.price if offer.price is not None else self.strategy_bounds()[0]
+            offer = Offer(OFFER, price, offer.message)
 
-        if self._offer_accepted(model_response):
+        if self._offer_accepted(offer):
+            offer = Offer(ACCEPT, self.current_offer, offer.message or self.accept_message(self.current_offer))
             self.resolved = True
+            self._record('Buyer', offer)
             self.logger.info(f"Buyer ACCEPTED offer for bid_id={self.bid.bid_id}, final_price={self.current_offer}")
-            return model_response
-        
+
+        elif offer.action == WALK:
+            self.walked = True
+            self._record('Buyer', offer)
+            self.logger.info(f"Buyer walked away from bid_id={self.bid.bid_id}")
+
         else:
-            offered_price = self._extract_price_from_message(model_response)
-            if offered_price == -1:
-                self.logger.error(f"Could not extract price from buyer's message for bid_id={self.bid.bid_id}: {model_response}")
-                raise ValueError("Could not extract price from buyer's message.")
-            
-            self.current_offer = offered_price
-            self.conversation_history.append(f'Round {self.num_rounds} - Buyer: {model_response}')
-            self.logger.info(f"Buyer made offer for bid_id={self.bid.bid_id}, round={self.num_rounds}, price=${offered_price}")
+            if not offer.message:
+                offer = offer._replace(message=self.offer_message(offer.price))
+            self.current_offer = offer.price
+            self.last_offer = offer.price
+            self._record('Buyer', offer)
+            self.logger.info(f"Buyer made offer for bid_id={self.bid.bid_id}, round={self.num_rounds}, price=${offer.price}")
         
-        return model_response
-
-       
\ No newline at end of file
+        return offer
@@ -0,0 +1,124 @@
+"""
+Includes the conversation history manager for negotiation prompts.
+
+Pasting every message of a negotiation into every prompt makes prompt
+size grow with each round. The manager keeps the most recent turns
+verbatim and condenses older ones into an offer ladder (round, side,
+price), shrinking both further if the prompt would exceed its token
+budget. Token counts are estimated at ~4 characters per token.
+"""
+
+import math
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from configs import HISTORY_KEEP_TURNS, PROMPT_TOKEN_BUDGET
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class Turn(NamedTuple):
+    round: int
+    side: str
+    message: str
+    price: Optional[float]
+
+    def line(self) -> str:
+        return f"Round {self.round} - {self.side}: {self.message}"
+
+
+class _HistoryStats:
+    """
+    Process-wide prompt size counters, before and after compaction.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.compacted = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def record(self, before: int, after: int, compacted: bool) -> None:
+        with self._lock:
+            self.prompts += 1
+            self.compacted += compacted
+            self.tokens_before += before
+            self.tokens_after += after
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prompts": self.prompts,
+                "compacted": self.compacted,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "avg_tokens_before": self.tokens_before / self.prompts if self.prompts else 0.0,
+                "avg_tokens_after": self.tokens_after / self.prompts if self.prompts else 0.0,
+            }
+
+
+history_stats = _HistoryStats()
+
+
+class ConversationHistory:
+    """
+    One agent's view of a negotiation, rendered for its prompt.
+    """
+
+    def __init__(self, keep_turns: int = HISTORY_KEEP_TURNS, token_budget: int = PROMPT_TOKEN_BUDGET) -> None:
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.turns: List[Turn] = []
+        # Size of the history pasted as a raw list of lines, for reporting
+        self._raw_chars = 2
+        self.last_tokens_before = 0
+        self.last_tokens_after = 0
+
+    def add(self, round: int, side: str, message: str, price: Optional[float] = None) -> None:
+        turn = Turn(round, side, message, price)
+        self.turns.append(turn)
+        self._raw_chars += len(repr(turn.line())) + (2 if len(self.turns) > 1 else 0)
+
+    @staticmethod
+    def _rung(turn: Turn) -> str:
+        price = f"${turn.price:.2f}" if turn.price is not None else "no price"
+        return f"R{turn.round} {turn.side} {price}"
+
+    def _compose(self, ladder: List[Turn], verbatim: List[Turn], truncated: bool) -> str:
+        lines = []
+        if ladder or truncated:
+            rungs = (["..."] if truncated else []) + [self._rung(turn) for turn in ladder]
+            lines.append("Earlier offers (price per ticket): " + "; ".join(rungs))
+        lines.extend(turn.line() for turn in verbatim)
+        return "\n".join(lines)
+
+    def render(self, prompt_tokens: int = 0) -> str:
+        """
+        Returns the history text for a prompt whose other parts take
+        prompt_tokens, fitting the whole prompt into the token budget where
+        possible. The most recent turn is always kept verbatim.
+        """
+        budget = max(0, self.token_budget - prompt_tokens)
+        keep = min(self.keep_turns, len(self.turns))
+        split = len(self.turns) - keep
+        text = self._compose(self.turns[:split], self.turns[split:], False)
+
+        # Condense more turns into the ladder, then drop the oldest rungs
+        while estimate_tokens(text) > budget and keep > 1:
+            keep -= 1
+            split = len(self.turns) - keep
+            text = self._compose(self.turns[:split], self.turns[split:], False)
+        start = 0
+        while estimate_tokens(text) > budget and start < split:
+            start += 1
+            text = self._compose(self.turns[start:split], self.turns[split:], True)
+
+        self.last_tokens_before = prompt_tokens + math.ceil(self._raw_chars / CHARS_PER_TOKEN)
+        self.last_tokens_after = prompt_tokens + estimate_tokens(text)
+        history_stats.record(self.last_tokens_before, self.last_tokens_after, split > 0)
+        return text
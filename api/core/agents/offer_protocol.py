@@ -0,0 +1,133 @@
+"""
+Includes the structured offer protocol negotiator agents speak.
+
+Every turn is an Offer: an action ("offer", "accept" or "walk"), the
+price per ticket it refers to and the sentence shown in the transcript.
+LLM turns are requested as JSON matching OFFER_SCHEMA and validated
+here; parse failures are counted per model.
+"""
+
+import json
+import re
+import threading
+from typing import Any, Dict, NamedTuple, Optional
+
+OFFER = "offer"
+ACCEPT = "accept"
+WALK = "walk"
+ACTIONS = (OFFER, ACCEPT, WALK)
+
+OFFER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "action": {"type": "string", "enum": list(ACTIONS)},
+        "price": {"type": ["number", "null"]},
+        "message": {"type": "string"},
+    },
+    "required": ["action", "price", "message"],
+    "additionalProperties": False,
+}
+
+# Structured output request understood by OpenAI-compatible chat APIs
+OFFER_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "negotiation_turn", "strict": True, "schema": OFFER_SCHEMA},
+}
+
+# Two prices closer than this are the same offer
+PRICE_TOLERANCE = 0.005
+
+_fence = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class OfferParseError(ValueError):
+    """
+    Raised when a turn is not a valid Offer.
+    """
+
+
+class Offer(NamedTuple):
+    action: str
+    price: Optional[float]
+    message: str = ""
+
+    def to_json(self) -> str:
+        return json.dumps(self._asdict())
+
+
+def same_price(a: Optional[float], b: Optional[float]) -> bool:
+    return a is not None and b is not None and abs(a - b) < PRICE_TOLERANCE
+
+
+def parse_offer(text: Optional[str]) -> Offer:
+    """
+    Parses and validates a JSON turn. Offers must carry a positive price;
+    accepts may leave it to the agent, which fills in the price accepted.
+    """
+    if not text:
+        raise OfferParseError("empty response")
+    try:
+        data = json.loads(_fence.sub("", text.strip()))
+    except json.JSONDecodeError as e:
+        raise OfferParseError(f"not valid JSON ({e.msg})")
+    if not isinstance(data, dict):
+        raise OfferParseError("expected a JSON object")
+
+    action = data.get("action")
+    if action not in ACTIONS:
+        raise OfferParseError(f"action must be one of {', '.join(ACTIONS)}")
+
+    price = data.get("price")
+    if price is not None:
+        if isinstance(price, str):
+            try:
+                price = float(price.replace("$", "").replace(",", ""))
+            except ValueError:
+                raise OfferParseError("price must be a number")
+        if isinstance(price, bool) or not isinstance(price, (int, float)) or price <= 0:
+            raise OfferParseError("price must be a positive number")
+        price = float(price)
+    if action == OFFER and price is None:
+        raise OfferParseError("an offer needs a price")
+
+    message = data.get("message")
+    if not isinstance(message, str):
+        message = ""
+    return Offer(action, price, message.strip())
+
+
+def repair_prompt(prompt: str, response: Optional[str], error: OfferParseError) -> str:
+    """
+    Builds a follow-up prompt asking the model to fix a malformed turn.
+    """
+    return (
+        f"{prompt}\n\nYour previous reply could not be used ({error}):\n{response}\n\n"
+        'Reply again with ONLY a JSON object of the form {"action": "offer" | "accept" | "walk", '
+        '"price": <price per ticket as a number, or null>, "message": "<one sentence>"}.'
+    )
+
+
+class _ParseStats:
+    """
+    Per-model counts of LLM turns and how many needed repairing.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, model: str, event: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(model, {"turns": 0, "parse_failures": 0, "repaired": 0, "fallbacks": 0})
+            counts[event] += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                # Share of turns whose first reply was unusable
+                model: dict(counts, failure_rate=(counts["repaired"] + counts["fallbacks"]) / counts["turns"] if counts["turns"] else 0.0)
+                for model, counts in self._counts.items()
+            }
+
+
+parse_stats = _ParseStats()
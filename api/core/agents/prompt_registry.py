@@ -0,0 +1,159 @@
+"""
+Includes the registry of precompiled negotiation prompt templates.
+
+Every template in PROMPTS_DIR is read once and split into literal text
+and replacement fields. Fields that do not change during a negotiation
+can be bound ahead of time (partial), leaving only the dynamic fields,
+e.g. the conversation history, to fill in on each round. Templates are
+reloaded when their file changes on disk.
+"""
+
+import os
+import threading
+import time
+import weakref
+from string import Formatter
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from configs import PROMPT_STAT_INTERVAL, PROMPTS_DIR
+
+_formatter = Formatter()
+
+
+class _Field(NamedTuple):
+    name: str
+    conversion: Optional[str]
+    spec: str
+
+
+Segment = Union[str, _Field]
+
+
+class PromptTemplate:
+    """
+    A template compiled into literal and field segments. Renders to the
+    same text as str.format on the original template.
+    """
+
+    def __init__(self, segments: List[Segment]) -> None:
+        self.segments = segments
+        self.fields = {segment.name.split(".")[0].split("[")[0] for segment in segments if isinstance(segment, _Field)}
+
+    @classmethod
+    def compile(cls, text: str) -> "PromptTemplate":
+        segments: List[Segment] = []
+        for literal, name, spec, conversion in _formatter.parse(text):
+            if literal:
+                segments.append(literal)
+            if name is not None:
+                if not name or name.isdigit():
+                    raise ValueError("Prompt templates only support named fields")
+                segments.append(_Field(name, conversion, spec or ""))
+        return cls(cls._merge(segments))
+
+    @staticmethod
+    def _merge(segments: List[Segment]) -> List[Segment]:
+        merged: List[Segment] = []
+        for segment in segments:
+            if isinstance(segment, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += segment
+            else:
+                merged.append(segment)
+        return merged
+
+    @staticmethod
+    def _format(field: _Field, values: Dict[str, Any]) -> str:
+        value, _ = _formatter.get_field(field.name, (), values)
+        if field.conversion:
+            value = _formatter.convert_field(value, field.conversion)
+        return format(value, field.spec)
+
+    def partial(self, **values: Any) -> "PromptTemplate":
+        """
+        Returns a template with the given fields filled in and the rest left open.
+        """
+        segments: List[Segment] = []
+        for segment in self.segments:
+            if isinstance(segment, _Field) and segment.name.split(".")[0].split("[")[0] in values:
+                segments.append(self._format(segment, values))
+            else:
+                segments.append(segment)
+        return PromptTemplate(self._merge(segments))
+
+    def render(self, **values: Any) -> str:
+        return "".join(
+            segment if isinstance(segment, str) else self._format(segment, values)
+            for segment in self.segments
+        )
+
+
+class PromptRegistry:
+    """
+    Loads the templates of a directory once and serves compiled, optionally
+    submarket-bound, versions of them.
+    """
+
+    def __init__(self, directory: str = PROMPTS_DIR, stat_interval: float = PROMPT_STAT_INTERVAL) -> None:
+        self.directory = directory
+        self.stat_interval = stat_interval
+        self._lock = threading.Lock()
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._versions: Dict[str, Tuple[int, int]] = {}
+        self._checked_at: Optional[float] = None
+        # Per-submarket templates with the submarket's reference values bound
+        self._bound: "weakref.WeakKeyDictionary[Any, Dict[str, Tuple[PromptTemplate, PromptTemplate]]]" = weakref.WeakKeyDictionary()
+
+    def _scan(self) -> None:
+        """
+        Compiles new or changed template files and drops removed ones. Must
+        be called with the lock held.
+        """
+        seen = set()
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".txt"):
+                continue
+            name = filename[:-len(".txt")]
+            path = os.path.join(self.directory, filename)
+            stat = os.stat(path)
+            version = (stat.st_mtime_ns, stat.st_size)
+            seen.add(name)
+            if self._versions.get(name) != version:
+                with open(path, "r") as f:
+                    self._templates[name] = PromptTemplate.compile(f.read())
+                self._versions[name] = version
+        for name in set(self._templates) - seen:
+            del self._templates[name]
+            del self._versions[name]
+
+    def get(self, name: str) -> PromptTemplate:
+        """
+        Returns the compiled template PROMPTS_DIR/<name>.txt.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is None or now - self._checked_at >= self.stat_interval:
+                self._scan()
+                self._checked_at = now
+            template = self._templates.get(name)
+        if template is None:
+            raise ValueError(f"Prompt template '{name}' not found in {self.directory}")
+        return template
+
+    def for_submarket(self, name: str, submarket) -> PromptTemplate:
+        """
+        Returns the template with the submarket's reference values bound,
+        computed once per submarket and template version.
+        """
+        template = self.get(name)
+        with self._lock:
+            bound = self._bound.setdefault(submarket, {})
+            cached = bound.get(name)
+            if cached is not None and cached[0] is template:
+                return cached[1]
+        prefix = template.partial(reference_values=submarket.get_reference_values())
+        with self._lock:
+            bound[name] = (template, prefix)
+        return prefix
+
+
+prompt_registry = PromptRegistry()
@@ -4,13 +4,13 @@ Includes class for seller negotiators in the marketplace.
 
 from api.models.seller import Seller
 from api.models.ticket import Ticket
-from typing import List
+from typing import List, Optional, Tuple
 from api.core.sub_market import SubMarket
-from configs import MAX_ROUNDS, PROMPTS_DIR
-# from api.services.openrouter_client import call_openrouter_with_prompt
-from api.services.gpt_service import call_gpt
-import os
-import re
+from api.core.agents.history import ConversationHistory, estimate_tokens
+from api.core.agents.offer_protocol import ACCEPT, OFFER, WALK, Offer, same_price
+from api.core.agents.prompt_registry import PromptTemplate, prompt_registry
+from api.core.agents.strategies import NegotiationStrategy, strategy_for
+from configs import MAX_ROUNDS
 import logging
 
 class SellerNegotiator:
@@ -18,132 +18,159 @@ class SellerNegotiator:
     Represents a seller agent in the marketplace.
     """
 
-    def __init__(self, ticket: Ticket, SubMarket: SubMarket) -> None:
+    def __init__(self, ticket: Ticket, SubMarket: SubMarket, strategy: Optional[NegotiationStrategy] = None) -> None:
         self.ticket = ticket
+        # Seller prompts pack only with other seller prompts, never with a buyer's
+        self.batch_key = "seller"
         self.seller = Seller.get_seller_by_id(self.ticket.seller_id)
+        self.strategy = strategy or strategy_for(ticket.sensitivity, SubMarket)
 
         # Track negotiation state
         self.conversation_history: List[dict] = []
         self.current_offer = None
+        # This side's own most recent offer
+        self.last_offer: Optional[float] = None
         self.num_rounds = 1
         self.max_rounds = MAX_ROUNDS
         self.submarket = SubMarket
         self.resolved = False
+        self.walked = False
+        # Compacted view of conversation_history used to build prompts
+        self.history = ConversationHistory()
+        # (submarket template, template with this ticket's details bound, its size in tokens)
+        self._prompt_templates: Optional[Tuple[PromptTemplate, PromptTemplate, int]] = None
         
         # Setup logger with ticket context
         self.logger = logging.getLogger(f"{__name__}.{ticket.ticket_id}")
         if not self.logger.handlers:
             logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        self.logger.info(f"SellerNegotiator initialized for ticket_id={ticket.ticket_id}, seller_id={ticket.seller_id}")
+        self.logger.info(f"SellerNegotiator initialized for ticket_id={ticket.ticket_id}, seller_id={ticket.seller_id}, strategy={self.strategy.name}")
 
 
     def construct_prompt(self) -> str:
         """
         Constructs the prompt for the seller negotiator from template.
         """
-        # Load template
-        template_path = os.path.join(PROMPTS_DIR, "seller_negotiation.txt")
-        with open(template_path, "r") as f:
-            template = f.read()
-
-        # Format with values
-        prompt = template.format(
-            num_tickets=self.ticket.quantity,
-            list_price=self.ticket.price,
-            min_price=self.ticket.min_price,
-            ticket_group=self.ticket.group_id,
-            sensitivity_to_price=self.ticket.sensitivity,
-            conversation_history=self.conversation_history,
-            reference_values=self.submarket.get_reference_values(),
-            max_rounds=self.max_rounds
-        )
+        template = prompt_registry.for_submarket("seller_negotiation", self.submarket)
+        if self._prompt_templates is None or self._prompt_templates[0] is not template:
+            # Bind everything but the conversation once per template version
+            bound = template.partial(
+                num_tickets=self.ticket.quantity,
+                list_price=self.ticket.price,
+                min_price=self.ticket.min_price,
+                ticket_group=self.ticket.group_id,
+                sensitivity_to_price=self.ticket.sensitivity,
+                max_rounds=self.max_rounds
+            )
+            self._prompt_templates = (template, bound, estimate_tokens(bound.render(conversation_history="")))
 
+        _, bound, static_tokens = self._prompt_templates
+        prompt = bound.render(conversation_history=self.history.render(static_tokens))
+        self.logger.debug(f"Seller prompt tokens for round {self.num_rounds}: {self.history.last_tokens_before} uncompacted, {self.history.last_tokens_after} sent")
         return prompt
     
-    def _offer_accepted(self, message: str) -> bool:
+    def strategy_bounds(self) -> Tuple[float, float]:
         """
-        Checks if the seller accepted the buyer's offer.
+        Returns the (opening, reserve) prices rule-based strategies concede between.
         """
-        price = self._extract_price_from_message(message)
-        if price == self.current_offer:
-            return True
-        return False
+        return self.ticket.price, self.ticket.min_price
+
+    def offer_message(self, price: float) -> str:
+        return f"I can let them go for ${price:.2f} per ticket."
+
+    def accept_message(self, price: float) -> str:
+        return f"Thank you for your patience! I agree to sell my ticket at {price:.2f}"
+
+    def _offer_accepted(self, offer: Offer) -> bool:
+        """
+        Checks if a turn accepts the price currently on the table.
+        """
+        return offer.action == ACCEPT or (offer.action == OFFER and same_price(offer.price, self.current_offer))
     
     def is_resolved(self) -> bool:
         """
         Checks if the negotiation has been resolved.
         """
         return self.resolved
+
+    def has_walked(self) -> bool:
+        """
+        Checks if either side walked away from the negotiation.
+        """
+        return self.walked
     
-    def _extract_price_from_message(self, message: str) -> float:
-        """
-        Extract the last numeric amount from the message and return it as int.
-        Supports thousands separators and optional decimals. Returns -1 if none found.
-        """
-        pattern = re.compile(r'(?P<num>-?(?:\d{1,3}(?:,\d{3})*|\d+)(?:\.\d{1,2})?)')
-        last = None
-        for m in pattern.finditer(message):
-            last = m
-        if not last:
-            return -1
-
-        num_str = last.group('num').replace(',', '')
-        try:
-            # Cast via float to handle decimals; int() truncates toward zero.
-            return float(num_str)
-        except ValueError:
-            return -1
+    def get_conversation_history(self) -> List[dict]:
+        """
+        Returns the shared conversation history.
+        """
+        return self.conversation_history
+
+    def _record(self, side: str, offer: Offer) -> None:
+        self.conversation_history.append(f'Round {self.num_rounds} - {side}: {offer.message}')
+        self.history.add(self.num_rounds, side, offer.message, offer.price)
     
-    def process_buyer_response(self, message: str) -> str:
+    def process_buyer_response(self, offer: Offer) -> None:
         """
-        Processes the buyer's message and decides on next action.
+        Processes the buyer's turn.
         """
-        self.logger.info(f"Seller processing buyer response for ticket_id={self.ticket.ticket_id}: {message[:100]}...")
-        
-        if self._offer_accepted(message):
+        self.logger.info(f"Seller processing buyer {offer.action} for ticket_id={self.ticket.ticket_id}: price={offer.price}, {offer.message[:100]}")
+
+        if self.resolved:
+            # This side already accepted the buyer's previous price
+            return None
+
+        if self._offer_accepted(offer):
             self.resolved = True
-            self.logger.info(f"Seller found ACCEPTED offer in buyer message for ticket_id={self.ticket.ticket_id}")
-            
+            # Settle on the price the buyer accepted, which may predate this round's offer
+            if offer.price is not None:
+                self.current_offer = offer.price
+            self._record('Buyer', offer)
+            self.logger.info(f"Seller found ACCEPTED offer from buyer for ticket_id={self.ticket.ticket_id}, price=${self.current_offer}")
+
+        elif offer.action == WALK:
+            self.walked = True
+            self._record('Buyer', offer)
+            self.logger.info(f"Buyer walked away from ticket_id={self.ticket.ticket_id}")
+
         else:
-            buyer_price = self._extract_price_from_message(message)
-            if buyer_price == -1:
-                self.logger.error(f"Could not extract price from buyer's message for ticket_id={self.ticket.ticket_id}: {message}")
-                raise ValueError("Could not extract price from buyer's message.")
-            elif buyer_price == self.current_offer:
-                self.resolved = True
-                self.logger.info(f"Seller found matching offer for ticket_id={self.ticket.ticket_id}, price=${buyer_price}")
-            else:
-                # change self.current_offer to buyer price
-                self.current_offer = buyer_price
-                self.conversation_history.append(f'Round {self.num_rounds} - Buyer: {message}')
-                self.num_rounds += 1
-                self.logger.info(f"Seller received new offer for ticket_id={self.ticket.ticket_id}, round={self.num_rounds-1}, price=${buyer_price}")
+            self.current_offer = offer.price
+            self._record('Buyer', offer)
+            self.num_rounds += 1
+            self.logger.info(f"Seller received new offer for ticket_id={self.ticket.ticket_id}, round={self.num_rounds-1}, price=${offer.price}")
+
+        return None
     
-    def negotiate(self) -> str:
+    def negotiate(self) -> Offer:
         """
-        Conducts the negotiation process.
+        Decides on the next turn based on the current offer and the seller's constraints.
         """
         self.logger.info(f"Seller starting negotiation round {self.num_rounds} for ticket_id={self.ticket.ticket_id}")
         
-        prompt = self.construct_prompt()
-        self.logger.debug(f"Seller prompt constructed for ticket_id={self.ticket.ticket_id}, round={self.num_rounds}")
-        
-        model_response = call_gpt(prompt)
-        self.logger.info(f"Seller received LLM response for ticket_id={self.ticket.ticket_id}: {model_response[:100]}...")
+        offer = self.strategy.respond(self)
+        self.logger.info(f"Seller received {self.strategy.name} turn for ticket_id={self.ticket.ticket_id}: {offer.action} at {offer.price}")
+
+        if offer.action == ACCEPT and self.current_offer is None:
+            # Nothing is on the table yet, so treat it as an opening offer
+            price = offer.price if offer.price is not None else self.strategy_bounds()[0]
+            offer = Offer(OFFER, price, offer.message)
 
-        if self._offer_accepted(model_response):
+        if self._offer_accepted(offer):
+            offer = Offer(ACCEPT, self.current_offer, offer.message or self.accept_message(self.current_offer))
             self.resolved = True
+            self._record('Seller', offer)
             self.logger.info(f"Seller ACCEPTED offer for ticket_id={self.ticket.ticket_id}, final_price={self.current_offer}")
-            return model_response
-        
+
+        elif offer.action == WALK:
+            self.walked = True
+            self._record('Seller', offer)
+            self.logger.info(f"Seller walked away from ticket_id={self.ticket.ticket_id}")
+
         else:
-            offered_price = self._extract_price_from_message(model_response)
-            if offered_price == -1:
-                self.logger.error(f"Could not extract price from seller's message for ticket_id={self.ticket.ticket_id}: {model_response}")
-                raise ValueError("Could not extract price from seller's message.")
-            
-            self.current_offer = offered_price
-            self.conversation_history.append(f'Round {self.num_rounds} - Seller: {model_response}')
-            self.logger.info(f"Seller made offer for ticket_id={self.ticket.ticket_id}, round={self.num_rounds}, price=${offered_price}")
+            if not offer.message:
+                offer = offer._replace(message=self.offer_message(offer.price))
+            self.current_offer = offer.price
+            self.last_offer = offer.price
+            self._record('Seller', offer)
+            self.logger.info(f"Seller made offer for ticket_id={self.ticket.ticket_id}, round={self.num_rounds}, price=${offer.price}")
         
-        return model_response
\ No newline at end of file
+        return offer
@@ -0,0 +1,179 @@
+"""
+Includes the strategies negotiator agents use to produce their next message.
+
+Strategies return an Offer. The LLM strategy builds the agent's prompt,
+asks the model for a structured turn and repairs malformed replies once.
+The concession strategies are rule-based time-dependent tactics that need
+no LLM call: an agent moves from its opening price towards its reserve
+price as rounds pass, following offer(t) = opening + (reserve - opening) * (t / T) ** (1 / beta).
+A beta below 1 holds firm until late (Boulware), above 1 gives ground
+early (Conceder) and 1 concedes linearly.
+"""
+
+import logging
+from typing import Dict, Optional
+
+from api.core.agents.offer_protocol import (
+    ACCEPT,
+    OFFER,
+    OFFER_RESPONSE_FORMAT,
+    Offer,
+    OfferParseError,
+    parse_offer,
+    parse_stats,
+    repair_prompt,
+)
+from api.services.gpt_service import call_gpt, forget_gpt_response
+from configs import (
+    BOULWARE_BETA,
+    CONCEDER_BETA,
+    CONCESSION_BETAS,
+    DEFAULT_STRATEGY,
+    NEGOTIATION_MODEL,
+    STRATEGY_BY_SENSITIVITY,
+)
+
+
+class NegotiationStrategy:
+    """
+    Decides a negotiator agent's next message.
+
+    Agents expose what a strategy needs: construct_prompt(), num_rounds,
+    max_rounds, current_offer (the opponent's last price, None before the
+    first exchange), last_offer (the agent's own last price), batch_key
+    (its side of the market; only prompts of one side are packed together),
+    strategy_bounds() returning (opening, reserve) prices and offer/accept
+    message builders.
+    """
+
+    name = "base"
+    # True when respond() waits on network I/O, e.g. an LLM call
+    blocking = False
+
+    def respond(self, agent) -> Offer:
+        raise NotImplementedError
+
+
+class LLMStrategy(NegotiationStrategy):
+    """
+    Asks the LLM for the agent's next turn using its prompt template.
+    """
+
+    name = "llm"
+    blocking = True
+
+    def __init__(self, model: str = NEGOTIATION_MODEL) -> None:
+        self.model = model
+        self.logger = logging.getLogger(__name__)
+
+    def _ask(self, prompt: str, batch_key: Optional[str] = None) -> Optional[str]:
+        return call_gpt(prompt, model=self.model, response_format=OFFER_RESPONSE_FORMAT, batch_key=batch_key)
+
+    def _reject(self, prompt: str) -> None:
+        # Keep an unusable reply from being served again from the cache
+        forget_gpt_response(prompt, model=self.model, response_format=OFFER_RESPONSE_FORMAT)
+        parse_stats.record(self.model, "parse_failures")
+
+    def respond(self, agent) -> Offer:
+        prompt = agent.construct_prompt()
+        parse_stats.record(self.model, "turns")
+        batch_key = getattr(agent, "batch_key", None)
+        response = self._ask(prompt, batch_key)
+        try:
+            return parse_offer(response)
+        except OfferParseError as e:
+            self._reject(prompt)
+            self.logger.warning(f"Malformed {self.model} turn ({e}), asking for a repair")
+            prompt = repair_prompt(prompt, response, e)
+
+        try:
+            offer = parse_offer(self._ask(prompt, batch_key))
+        except OfferParseError as e:
+            self._reject(prompt)
+            # Hold the previous offer rather than aborting the negotiation
+            parse_stats.record(self.model, "fallbacks")
+            price = agent.last_offer if agent.last_offer is not None else agent.strategy_bounds()[0]
+            self.logger.warning(f"Repair failed ({e}), holding offer at {price}")
+            return Offer(OFFER, price, agent.offer_message(price))
+        parse_stats.record(self.model, "repaired")
+        return offer
+
+
+class ConcessionStrategy(NegotiationStrategy):
+    """
+    Time-dependent concession between the agent's opening and reserve prices.
+    """
+
+    name = "concession"
+
+    def __init__(self, beta: float) -> None:
+        if beta <= 0:
+            raise ValueError("beta must be positive")
+        self.beta = beta
+
+    def target_price(self, agent) -> float:
+        opening, reserve = agent.strategy_bounds()
+        if agent.max_rounds > 1:
+            progress = min(1.0, max(0.0, (agent.num_rounds - 1) / (agent.max_rounds - 1)))
+        else:
+            progress = 1.0
+        return round(opening + (reserve - opening) * progress ** (1.0 / self.beta), 2)
+
+    def respond(self, agent) -> Offer:
+        target = self.target_price(agent)
+        opening, reserve = agent.strategy_bounds()
+        opponent_price = agent.current_offer
+        if opponent_price is not None:
+            # Accept as soon as the opponent's price is at least as good as our own next offer
+            conceding_up = reserve >= opening
+            if (opponent_price <= target) if conceding_up else (opponent_price >= target):
+                return Offer(ACCEPT, opponent_price, agent.accept_message(opponent_price))
+        return Offer(OFFER, target, agent.offer_message(target))
+
+
+_llm_strategy = LLMStrategy()
+_strategies: Dict[str, NegotiationStrategy] = {
+    "llm": _llm_strategy,
+    "boulware": ConcessionStrategy(BOULWARE_BETA),
+    "conceder": ConcessionStrategy(CONCEDER_BETA),
+    "linear": ConcessionStrategy(1.0),
+}
+
+# Names get_strategy accepts, for validating requests before a negotiation starts
+STRATEGY_NAMES = tuple(sorted(_strategies)) + ("concession",)
+
+
+def check_strategy(name: Optional[str]) -> Optional[str]:
+    """
+    Returns name if it is None or a known strategy, else raises ValueError.
+    """
+    if name is not None and name not in STRATEGY_NAMES:
+        raise ValueError(f"Unknown negotiation strategy {name!r}, expected one of {', '.join(STRATEGY_NAMES)}")
+    return name
+
+
+def get_strategy(name: str, sensitivity: Optional[str] = None) -> NegotiationStrategy:
+    """
+    Returns the strategy registered under name. "concession" picks the
+    concession curve from the agent's price sensitivity (CONCESSION_BETAS).
+    """
+    if name == "concession":
+        beta = CONCESSION_BETAS.get(sensitivity or "", 1.0)
+        key = f"concession:{beta}"
+        if key not in _strategies:
+            _strategies[key] = ConcessionStrategy(beta)
+        return _strategies[key]
+    check_strategy(name)
+    return _strategies[name]
+
+
+def strategy_for(sensitivity: Optional[str], submarket=None) -> NegotiationStrategy:
+    """
+    Picks an agent's strategy: the submarket's strategy if it sets one,
+    otherwise the one configured for the sensitivity class, otherwise
+    DEFAULT_STRATEGY.
+    """
+    name = getattr(submarket, "strategy", None)
+    if name is None:
+        name = STRATEGY_BY_SENSITIVITY.get(sensitivity or "", DEFAULT_STRATEGY)
+    return get_strategy(name, sensitivity)
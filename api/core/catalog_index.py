@@ -0,0 +1,221 @@
+"""
+Contains the retrieval index that picks candidate events for a buyer request.
+
+The intent prompt used to carry the whole events and venues catalog.
+CatalogIndex keeps an inverted index from tokens of each event's name
+(artist included), venue name, city and date to the events, so only the
+few events a request mentions go into the prompt. Query tokens that are
+not in the vocabulary are matched to similar ones through a trigram
+index over the vocabulary, which tolerates typos. Any change to the
+events or venues table marks the index stale, and the next search
+rebuilds it.
+"""
+
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from api.services import repository
+from configs import CATALOG_FUZZY_MIN_SIMILARITY, INTENT_CANDIDATE_EVENTS
+
+_TOKEN_RE = re.compile(r"\d{4}-\d{2}-\d{2}|[a-z0-9]+")
+
+# Words of a buyer request that say nothing about which event is meant
+_STOP_WORDS = frozenset("""
+    a an and any at but by for from get i in is it live looking me my need of on or please seat seats
+    show the ticket tickets to want we with
+""".split())
+
+# Weight of a match per field of the event
+_FIELD_WEIGHTS = {
+    "artist": 4.0,
+    "name": 3.0,
+    "venue": 2.0,
+    "city": 1.5,
+    "date": 1.0,
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOP_WORDS]
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _date_tokens(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        return tokenize(value)
+    return [
+        date.date().isoformat(),
+        str(date.year),
+        date.strftime("%B").lower(),
+        date.strftime("%b").lower(),
+        date.strftime("%A").lower(),
+    ]
+
+
+class CatalogIndex:
+    """
+    Token and trigram index over the events catalog, rebuilt on change.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._attach_lock = threading.Lock()
+        self._attached = False
+        self._stale = True
+
+        # token -> {event_id: field weight}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        # trigram -> vocabulary tokens containing it
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._events: Dict[str, dict] = {}
+        self._venues: Dict[str, dict] = {}
+        self._by_date: List[str] = []
+
+        self.builds = 0
+        self.searches = 0
+        self.fallbacks = 0
+        self.build_seconds = 0.0
+
+    def _ensure_attached(self) -> None:
+        if self._attached:
+            return
+        with self._attach_lock:
+            if not self._attached:
+                repository.events.add_listener(self._on_change)
+                repository.venues.add_listener(self._on_change)
+                self._attached = True
+
+    def _on_change(self, old_row: Optional[dict], new_row: Optional[dict]) -> None:
+        self._stale = True
+
+    def _fields(self, event: dict) -> Dict[str, List[str]]:
+        venue = self._venues.get(event.get("venue_id"), {})
+        name = event.get("name", "")
+        return {
+            # Names read "Artist - Tour", the artist is what buyers ask for
+            "artist": tokenize(name.split(" - ")[0]) if " - " in name else [],
+            "name": tokenize(name),
+            "venue": tokenize(venue.get("name", "")) + tokenize(event.get("venue_id", "")),
+            "city": tokenize(venue.get("city", "")),
+            "date": _date_tokens(event.get("date")),
+        }
+
+    def _rebuild(self) -> None:
+        started = time.monotonic()
+        # Cleared first, so changes arriving during the build mark it stale again
+        self._stale = False
+        self._venues = {venue["venue_id"]: venue for venue in repository.venues.all()}
+        self._events = {event["event_id"]: event for event in repository.events.all()}
+
+        postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for event_id, event in self._events.items():
+            for field, tokens in self._fields(event).items():
+                weight = _FIELD_WEIGHTS[field]
+                for token in tokens:
+                    postings[token][event_id] = max(postings[token].get(event_id, 0.0), weight)
+        grams: Dict[str, Set[str]] = defaultdict(set)
+        for token in postings:
+            for gram in trigrams(token):
+                grams[gram].add(token)
+
+        self._postings = dict(postings)
+        self._trigrams = dict(grams)
+        self._by_date = sorted(self._events, key=lambda event_id: self._events[event_id].get("date") or "")
+        self.builds += 1
+        self.build_seconds += time.monotonic() - started
+
+    def _ensure_fresh(self) -> None:
+        self._ensure_attached()
+        repository.events.refresh()
+        repository.venues.refresh()
+        if self._stale:
+            self._rebuild()
+
+    def _similar(self, token: str) -> List[Tuple[str, float]]:
+        """
+        Vocabulary tokens whose trigram overlap with token is high enough.
+        """
+        grams = trigrams(token)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self._trigrams.get(gram, ()):
+                shared[candidate] += 1
+        similar = []
+        for candidate, count in shared.items():
+            similarity = count / (len(grams) + len(trigrams(candidate)) - count)
+            if similarity >= CATALOG_FUZZY_MIN_SIMILARITY:
+                similar.append((candidate, similarity))
+        return similar
+
+    def _search_locked(self, text: str, limit: int) -> List[Tuple[str, float]]:
+        # Called with _lock held, so the ids returned are in _events
+        self._ensure_fresh()
+        self.searches += 1
+        total = len(self._events) or 1
+        scores: Dict[str, float] = defaultdict(float)
+        for token in set(tokenize(text)):
+            if token in self._postings:
+                matches = [(token, 1.0)]
+            elif len(token) >= 4:
+                matches = self._similar(token)
+            else:
+                continue
+            for match, similarity in matches:
+                postings = self._postings[match]
+                idf = math.log(1 + total / len(postings))
+                for event_id, weight in postings.items():
+                    scores[event_id] += similarity * weight * idf
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return ranked[:limit]
+
+    def search(self, text: str, limit: int = INTENT_CANDIDATE_EVENTS) -> List[Tuple[str, float]]:
+        """
+        Returns up to limit (event_id, score) pairs matching text, best first.
+        """
+        with self._lock:
+            return self._search_locked(text, limit)
+
+    def candidates(self, text: str, limit: int = INTENT_CANDIDATE_EVENTS) -> Tuple[List[dict], List[dict]]:
+        """
+        Returns the events matching text and their venues. When nothing
+        matches, the earliest events are returned so the model still sees
+        what is on offer.
+        """
+        with self._lock:
+            event_ids = [event_id for event_id, _ in self._search_locked(text, limit)]
+            if not event_ids:
+                self.fallbacks += 1
+                event_ids = self._by_date[:limit]
+            events = [self._events[event_id] for event_id in event_ids]
+            venue_ids = dict.fromkeys(event.get("venue_id") for event in events)
+            venues = [self._venues[venue_id] for venue_id in venue_ids if venue_id in self._venues]
+        return events, venues
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "events": len(self._events),
+                "venues": len(self._venues),
+                "tokens": len(self._postings),
+                "trigrams": len(self._trigrams),
+                "builds": self.builds,
+                "avg_build_seconds": self.build_seconds / self.builds if self.builds else 0.0,
+                "searches": self.searches,
+                "fallbacks": self.fallbacks,
+            }
+
+
+catalog_index = CatalogIndex()
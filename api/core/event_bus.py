@@ -0,0 +1,173 @@
+"""
+Contains the in-process pub/sub bus for live negotiation events.
+
+Negotiations publish events (start, offer, counter, accept, walk, end)
+from whichever thread they run on, tagged with topics such as
+"bid:<bid_id>". Subscribers live on an asyncio event loop and read
+events through a bounded buffer. A subscriber that falls behind loses
+its oldest offers and counters first; accept, walk and end events are
+kept. The next event it reads carries a count of what was dropped.
+Publishing to topics nobody subscribed to costs a dict lookup.
+
+Negotiations running in worker processes publish to their own process's
+bus, which relays every event back to the process that submitted the job
+(see set_relay and api.core.workers); that process republishes it.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set
+
+from configs import EVENT_BUS_QUEUE_SIZE
+
+# Events a slow subscriber never loses
+TERMINAL_EVENTS = frozenset({"accept", "walk", "end"})
+
+
+class Subscription:
+    """
+    Async iterator over the events published to a set of topics.
+    """
+
+    def __init__(self, bus: "EventBus", topics: List[str], maxsize: int) -> None:
+        self.bus = bus
+        self.topics = topics
+        self.maxsize = maxsize
+        self.loop = asyncio.get_running_loop()
+        self.dropped = 0
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def _push(self, event: Dict[str, Any]) -> None:
+        # Runs on the subscriber's loop
+        if self._closed:
+            return
+        if len(self._buffer) >= self.maxsize:
+            victim = next((i for i, old in enumerate(self._buffer) if old["type"] not in TERMINAL_EVENTS), None)
+            if victim is None and event["type"] not in TERMINAL_EVENTS:
+                # Only terminal events buffered, so the new event is the one to lose
+                self.dropped += 1
+                self.bus._count("dropped")
+                return
+            if victim is not None:
+                del self._buffer[victim]
+                self.dropped += 1
+                self.bus._count("dropped")
+            # else a terminal event arrived on a buffer of terminal events: grow past maxsize
+        self._buffer.append(event)
+        self._ready.set()
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        while not self._buffer:
+            if self._closed:
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        event = self._buffer.popleft()
+        if self.dropped:
+            event = {**event, "dropped": self.dropped}
+            self.dropped = 0
+        return event
+
+    def close(self) -> None:
+        """
+        Stops receiving; events already buffered can still be read.
+        """
+        self.bus._unsubscribe(self)
+        self._closed = True
+        self._ready.set()
+
+    async def __aenter__(self) -> "Subscription":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class EventBus:
+    """
+    Routes published events to the subscriptions of their topics.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._counts = {"published": 0, "delivered": 0, "dropped": 0, "relayed": 0}
+        self._relay: Optional[Callable[[List[str], Dict[str, Any]], None]] = None
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[name] += amount
+
+    def subscribe(self, topics: Iterable[str], maxsize: int = EVENT_BUS_QUEUE_SIZE) -> Subscription:
+        """
+        Subscribes the running event loop to topics.
+        """
+        subscription = Subscription(self, list(topics), maxsize)
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscriptions.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[topic]
+
+    def set_relay(self, relay: Optional[Callable[[List[str], Dict[str, Any]], None]]) -> None:
+        """
+        Hands every published event, with its topics, to relay as well, or
+        stops doing so when relay is None.
+        """
+        self._relay = relay
+
+    def has_subscribers(self, topics: Iterable[str]) -> bool:
+        return self._relay is not None or any(topic in self._subscriptions for topic in topics)
+
+    def publish(self, topics: Iterable[str], event: Dict[str, Any]) -> None:
+        """
+        Delivers event to every subscription of any of topics, at most once
+        each. Safe to call from any thread.
+        """
+        topics = list(topics)
+        if not self.has_subscribers(topics):
+            return
+        # Relayed events keep the time they were first published
+        event = {"ts": time.time(), **event}
+        relay = self._relay
+        if relay is not None:
+            relay(topics, event)
+            self._count("relayed")
+        with self._lock:
+            targets: Set[Subscription] = set()
+            for topic in topics:
+                targets.update(self._subscriptions.get(topic, ()))
+            self._counts["published"] += 1
+            self._counts["delivered"] += len(targets)
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._push, event)
+            except RuntimeError:
+                # The subscriber's loop is gone
+                self._unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                self._counts,
+                topics=len(self._subscriptions),
+                subscriptions=len({s for subs in self._subscriptions.values() for s in subs}),
+            )
+
+
+negotiation_bus = EventBus()
@@ -0,0 +1,421 @@
+"""
+Contains the deterministic fast path for buyer intent extraction.
+
+Many buyer requests spell out everything a bid needs in predictable
+phrasing ("2 tickets to The Weeknd, offer $150, up to $200"). The
+IntentParser reads the event (through the catalog index), the number of
+tickets, the opening offer, the price ceiling, seat groups and price
+sensitivity with rules, and gives every field a confidence. When each
+field is confidently present the bid is built directly and the LLM call
+is skipped; anything ambiguous falls back to the LLM. Optional fields
+that are not mentioned take their defaults with full confidence.
+"""
+
+import calendar
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from api.core.catalog_index import catalog_index, tokenize
+from api.services import repository
+from configs import INTENT_FAST_PATH_MIN_CONFIDENCE
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+_COUNT = r"(\d+|" + "|".join(_NUMBER_WORDS) + r")"
+
+# "2 tickets", "two floor tickets"; never a dollar amount
+_TICKETS_RE = re.compile(r"(?<![$\d.,])\b" + _COUNT + r"\s+(?:[a-z]+\s+){0,2}?tickets?\b")
+_ONE_TICKET_RE = re.compile(r"\b(?:a|an|single)\s+ticket\b")
+_PAIR_RE = re.compile(r"\b(?:a )?pair of\b")
+_COUPLE_RE = re.compile(r"\bcouple (?:of )?tickets\b")
+_PEOPLE_RE = re.compile(r"\bfor\s+" + _COUNT + r"\s+(?:people|persons|adults|of us)\b")
+
+_AMOUNT = r"\$\s*(\d[\d,]*(?:\.\d+)?)|(\d[\d,]*(?:\.\d+)?)\s*(?:dollars|usd|bucks)\b"
+_AMOUNT_RE = re.compile(_AMOUNT)
+_RANGE_RE = re.compile(
+    r"(?:between\s+)?\$\s*(\d[\d,]*(?:\.\d+)?)\s*(?:-|to|and)\s*\$?\s*(\d[\d,]*(?:\.\d+)?)"
+)
+
+# Words just before an amount that say which price it is
+_MAX_CUES = re.compile(
+    r"\b(?:up to|max|maximum|at most|no more than|not more than|under|below|budget|limit|"
+    r"cap|ceiling|top out|willing to pay|most)\b"
+)
+_PRICE_CUES = re.compile(r"\b(?:offer|offering|start|starting|open|opening|bid|begin|around)\b")
+_CUE_WINDOW = 30
+# Words around an amount that make it a total or a per-ticket price, which
+# the bid's fields do not say; "2 x $150" and "2 tickets at $150" likewise
+_QUALIFIERS = re.compile(
+    r"\b(?:total|in all|altogether|combined|each|per|apiece|a piece|"
+    r"for (?:both|the pair|the two|the lot|all|" + _COUNT[1:-1] + r"))\b"
+)
+# "$150k", "2 grand": the amount is not the number read
+_SCALED = re.compile(r"\d\s*(?:k|m|mm|mil|thousand|grand|million)\b")
+_MULTIPLIER = re.compile(r"(?:\b" + _COUNT + r"\s*(?:x|\*|@)|\btickets?\s+(?:[a-z']+\s+){0,4}?(?:at|for|@))\s*$")
+
+_SECTION_RE = re.compile(r"\bsection\s+([a-z0-9]+)\b")
+# Seat words that, when no seating group matches them, make the seat choice unclear
+_SEAT_WORDS = frozenset({"balcony", "mezzanine", "orchestra", "pit", "vip", "box", "row", "front"})
+# A negation and the few words it covers, e.g. "not floor", "except the upper bowl"
+_NEGATION_RE = re.compile(r"\b(?:not|no|except|avoid|without|excluding|never|don'?t want)\b((?:\W+[a-z0-9]+){1,3})")
+
+# Dates a request can name, to compare with the event's
+_YEAR_RE = re.compile(r"(?<![$\d,.])\b(20\d\d)\b")
+_ISO_DATE_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+# "may" and "march" read as other words too often to count
+_MONTHS = {
+    name.lower(): month
+    for month in range(1, 13)
+    for name in {calendar.month_name[month], calendar.month_abbr[month]}
+    if name.lower() not in ("may", "mar", "march")
+}
+_MONTH_RE = re.compile(r"\b(" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\b")
+
+_HIGH_SENSITIVITY = re.compile(r"\b(?:tight budget|cheap|cheapest|bargain|best deal)\b")
+_LOW_SENSITIVITY = re.compile(r"\b(?:any price|whatever it takes|money is no object|don'?t mind paying)\b")
+
+
+class Guess(NamedTuple):
+    value: Any
+    confidence: float
+
+
+class ParsedIntent(NamedTuple):
+    event: Guess
+    num_tickets: Guess
+    price: Guess
+    max_price: Guess
+    allowed_groups: Guess
+    sensitivity: Guess
+
+    def unsure(self, min_confidence: float = INTENT_FAST_PATH_MIN_CONFIDENCE) -> List[str]:
+        """
+        Fields missing or below min_confidence.
+        """
+        return [
+            field for field, guess in zip(self._fields, self)
+            if guess.value is None or guess.confidence < min_confidence
+        ]
+
+    def to_response(self) -> Dict[str, Any]:
+        """
+        The parse in the shape of the LLM's intent response.
+        """
+        event = self.event.value
+        venue = repository.venues.get(event["venue_id"]) or {}
+        return {
+            "extracted": {
+                "event_name": event["name"],
+                "venue": venue.get("name"),
+                "num_tickets": self.num_tickets.value,
+                "price": self.price.value,
+                "max_price": self.max_price.value,
+                "seat_type": ", ".join(self.allowed_groups.value) or "any",
+                "sensitivity": self.sensitivity.value,
+                "certainty": "definitely",
+            },
+            "missing": [],
+            "question": None,
+            "results": {
+                "event_id": event["event_id"],
+                "num_tickets": self.num_tickets.value,
+                "max_price": self.max_price.value,
+                "price": self.price.value,
+                "allowed_groups": self.allowed_groups.value,
+                "sensitivity_to_price": self.sensitivity.value,
+            },
+            "confidence": {field: guess.confidence for field, guess in zip(self._fields, self)},
+        }
+
+
+def _count(word: str) -> int:
+    return int(word) if word.isdigit() else _NUMBER_WORDS[word]
+
+
+def _amount(value: str) -> float:
+    return float(value.replace(",", ""))
+
+
+def _agree(values: List[Any], confidence: float) -> Guess:
+    distinct = list(dict.fromkeys(values))
+    if not distinct:
+        return Guess(None, 0.0)
+    if len(distinct) > 1:
+        return Guess(distinct[0], 0.4)
+    return Guess(distinct[0], confidence)
+
+
+def parse_event(text: str) -> Guess:
+    """
+    The catalog event text refers to. Confident when the best match is
+    named in the text and clearly ahead of the runner-up.
+    """
+    ranked = catalog_index.search(text, limit=2)
+    if not ranked:
+        return Guess(None, 0.0)
+    event = repository.events.get(ranked[0][0])
+    if event is None:
+        return Guess(None, 0.0)
+    named = bool(set(tokenize(event["name"])) & set(tokenize(text)))
+    confidence = 0.95 if named else 0.6
+    if len(ranked) > 1:
+        confidence *= 1 - ranked[1][1] / ranked[0][1]
+    if not _dates_agree(text.lower(), event):
+        # Named, but on a date this event is not
+        confidence = min(confidence, 0.3)
+    return Guess(event, confidence)
+
+
+def _dates_agree(text: str, event: dict) -> bool:
+    """
+    False when a year, month or ISO date in text contradicts the event's
+    date. Text naming no date agrees with any event.
+    """
+    try:
+        date = datetime.fromisoformat(event.get("date") or "")
+    except ValueError:
+        return True
+    years = {int(year) for year in _YEAR_RE.findall(text)}
+    months = {_MONTHS[month] for month in _MONTH_RE.findall(text)}
+    days = set(_ISO_DATE_RE.findall(text))
+    if days:
+        return date.date().isoformat() in days
+    return (not years or date.year in years) and (not months or date.month in months)
+
+
+def parse_num_tickets(text: str) -> Guess:
+    counts = [_count(match.group(1)) for match in _TICKETS_RE.finditer(text)]
+    counts += [1 for _ in _ONE_TICKET_RE.finditer(text)]
+    counts += [2 for _ in _PAIR_RE.finditer(text)]
+    if counts:
+        guess = _agree(counts, 0.95)
+    else:
+        # "A couple" is not always exactly two
+        counts = [2 for _ in _COUPLE_RE.finditer(text)]
+        counts += [_count(match.group(1)) for match in _PEOPLE_RE.finditer(text)]
+        guess = _agree(counts, 0.7)
+    if guess.value is not None and guess.value < 1:
+        return Guess(guess.value, 0.0)
+    return guess
+
+
+def _qualified(text: str) -> bool:
+    """
+    Whether any amount reads as a total, a per-ticket price or a multiple,
+    or is scaled by a suffix.
+    """
+    if _SCALED.search(text):
+        return True
+    matches = list(_AMOUNT_RE.finditer(text))
+    previous_end = 0
+    for i, match in enumerate(matches):
+        before = text[max(previous_end, match.start() - _CUE_WINDOW):match.start()]
+        previous_end = match.end()
+        next_start = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        after = text[match.end():min(next_start, match.end() + _CUE_WINDOW)]
+        if _QUALIFIERS.search(after) or _QUALIFIERS.search(before[-12:]) or _MULTIPLIER.search(before):
+            return True
+    return False
+
+
+def _label_prices(text: str) -> Tuple[Guess, Guess]:
+    ranges = list(_RANGE_RE.finditer(text))
+    if len(ranges) == 1:
+        low, high = _amount(ranges[0].group(1)), _amount(ranges[0].group(2))
+        if low <= high:
+            return Guess(low, 0.9), Guess(high, 0.9)
+
+    prices: List[float] = []
+    max_prices: List[float] = []
+    unlabelled: List[float] = []
+    previous_end = 0
+    for match in _AMOUNT_RE.finditer(text):
+        value = _amount(match.group(1) or match.group(2))
+        # Cues before the previous amount belong to it
+        context = text[max(previous_end, match.start() - _CUE_WINDOW):match.start()]
+        previous_end = match.end()
+        cues = [(m.end(), "max") for m in _MAX_CUES.finditer(context)]
+        cues += [(m.end(), "price") for m in _PRICE_CUES.finditer(context)]
+        if not cues:
+            unlabelled.append(value)
+        elif max(cues)[1] == "max":
+            max_prices.append(value)
+        else:
+            prices.append(value)
+
+    price, max_price = _agree(prices, 0.95), _agree(max_prices, 0.95)
+    if len(unlabelled) == 1:
+        if price.value is None and max_price.value is not None:
+            price = Guess(unlabelled[0], 0.85)
+        elif max_price.value is None and price.value is not None:
+            max_price = Guess(unlabelled[0], 0.85)
+    elif len(unlabelled) == 2 and price.value is None and max_price.value is None:
+        # Probably offer then ceiling, but that is a guess
+        price, max_price = Guess(min(unlabelled), 0.6), Guess(max(unlabelled), 0.6)
+
+    if price.value is not None and max_price.value is not None and price.value > max_price.value:
+        return Guess(price.value, 0.3), Guess(max_price.value, 0.3)
+    return price, max_price
+
+
+def parse_prices(text: str) -> Tuple[Guess, Guess]:
+    """
+    The opening offer and the price ceiling, told apart by a range
+    ("$150-$200", "between $150 and $200") or by the words before each
+    amount. One unlabelled amount next to a labelled one takes the other
+    role if the two are consistent. Amounts qualified as totals or per
+    ticket, multiplied by a quantity or scaled ("$150k") are never
+    confident.
+    """
+    price, max_price = _label_prices(text)
+    if _qualified(text):
+        return Guess(price.value, min(price.confidence, 0.5)), Guess(max_price.value, min(max_price.confidence, 0.5))
+    return price, max_price
+
+
+def parse_groups(text: str, event: Optional[dict]) -> Guess:
+    """
+    Seating groups of the event's venue named in text, by section or by
+    label words only that group has. No seat words at all means any group.
+    """
+    tokens = set(tokenize(text))
+    venue = repository.venues.get(event["venue_id"]) if event else None
+    groups = venue.get("seating_groups", []) if venue else []
+
+    # Words a negation rules out; a group named among them is unclear
+    negated = {token for match in _NEGATION_RE.finditer(text) for token in tokenize(match.group(1))}
+
+    sections = _SECTION_RE.findall(text)
+    if sections:
+        matched = [g["group_id"] for g in groups if any(s.upper() in g["sections"] for s in sections)]
+        if not matched or set(sections) & negated:
+            return Guess(matched, 0.3)
+        return Guess(matched, 0.95)
+
+    label_counts: Dict[str, int] = defaultdict(int)
+    for group in groups:
+        for token in set(tokenize(group["label"])):
+            label_counts[token] += 1
+    matched = []
+    for group in groups:
+        label = set(tokenize(group["label"]))
+        distinctive = {token for token in label if label_counts[token] == 1}
+        if (label and label <= tokens) or distinctive & tokens:
+            matched.append(group["group_id"])
+    if matched:
+        if any(set(tokenize(g["label"])) & negated for g in groups if g["group_id"] in matched):
+            return Guess(matched, 0.3)
+        return Guess(matched, 0.9)
+    if tokens & _SEAT_WORDS or tokens & set(label_counts):
+        # Seats are asked for but match no group, or only ambiguously
+        return Guess([], 0.5)
+    return Guess([], 1.0)
+
+
+def parse_sensitivity(text: str) -> Guess:
+    high, low = bool(_HIGH_SENSITIVITY.search(text)), bool(_LOW_SENSITIVITY.search(text))
+    if high and low:
+        return Guess("normal", 0.5)
+    if high:
+        return Guess("high", 0.9)
+    if low:
+        return Guess("low", 0.9)
+    return Guess("normal", 1.0)
+
+
+class IntentParser:
+    """
+    Rule-based intent extraction with confidences, and its bypass counters.
+    """
+
+    def __init__(self, min_confidence: float = INTENT_FAST_PATH_MIN_CONFIDENCE) -> None:
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.bypassed = 0
+        self.unsure_fields: Dict[str, int] = defaultdict(int)
+
+    def parse(self, text: str) -> ParsedIntent:
+        lowered = text.lower()
+        event = parse_event(text)
+        price, max_price = parse_prices(lowered)
+        return ParsedIntent(
+            event=event,
+            num_tickets=parse_num_tickets(lowered),
+            price=price,
+            max_price=max_price,
+            allowed_groups=parse_groups(lowered, event.value),
+            sensitivity=parse_sensitivity(lowered),
+        )
+
+    def try_parse(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the intent response when every field is confident, else
+        None so the caller asks the LLM.
+        """
+        parsed = self.parse(text)
+        unsure = parsed.unsure(self.min_confidence)
+        with self._lock:
+            self.attempts += 1
+            if not unsure:
+                self.bypassed += 1
+            for field in unsure:
+                self.unsure_fields[field] += 1
+        return None if unsure else parsed.to_response()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "attempts": self.attempts,
+                "bypassed": self.bypassed,
+                "bypass_rate": self.bypassed / self.attempts if self.attempts else 0.0,
+                "unsure_fields": dict(self.unsure_fields),
+            }
+
+
+intent_parser = IntentParser()
+
+# test
+
+if __name__ == "__main__":
+    # Requests the fast path must leave to the LLM
+    fallbacks = [
+        "2 tickets to The Weeknd at $150, budget is $2,000 total",
+        "2 tickets to The Weeknd, offer $150, up to $200 each",
+        "2 tickets to The Weeknd, offer $150, up to $400 for both",
+        "2 tickets to The Weeknd, offer $150, up to $400 for the pair",
+        "2 tickets to The Weeknd, offer $300 for 2, up to $400",
+        "2 tickets to The Weeknd, offer $150k, up to $200k",
+        "2 tickets to The Weeknd, offer $150, up to $200, not floor",
+        "2 tickets to The Weeknd in december 2026, offer $150, up to $200",
+        "0 tickets to The Weeknd, offer $150, up to $200",
+    ]
+    # Requests it must take, with the bid fields it must read
+    bypasses = [
+        ("2 tickets to The Weeknd, offer $150, up to $200",
+         {"num_tickets": 2, "price": 150.0, "max_price": 200.0, "allowed_groups": []}),
+        ("2 tickets to The Weeknd in december 2025, offer $150, up to $200",
+         {"num_tickets": 2, "price": 150.0, "max_price": 200.0}),
+        ("2 floor tickets to The Weeknd, offer $150, up to $200",
+         {"allowed_groups": ["FLOOR_PREMIUM"]}),
+    ]
+
+    parser = IntentParser()
+    failures = 0
+    for text in fallbacks:
+        if parser.try_parse(text) is not None:
+            failures += 1
+            print(f"FAIL (bypassed): {text}")
+    for text, expected in bypasses:
+        response = parser.try_parse(text)
+        results = response["results"] if response else {}
+        if any(results.get(field) != value for field, value in expected.items()):
+            failures += 1
+            print(f"FAIL (got {results or 'fallback'}): {text}")
+    print(f"{len(fallbacks) + len(bypasses) - failures}/{len(fallbacks) + len(bypasses)} intent checks passed")
+    raise SystemExit(1 if failures else 0)
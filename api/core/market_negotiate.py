@@ -5,7 +5,10 @@ Contains the class to negotiate market transactions between buyers and sellers f
 from configs import SEARCH_RESULTS_JSON
 import json
 from api.core.sub_market import SubMarket
-from api.core.negotiation import Negotiation
+from api.core.negotiation import CONTESTED, INFEASIBLE, SETTLED, Negotiation, screen_pair
+from api.core.scheduler import NegotiationScheduler, get_scheduler
+from api.core.submarket_registry import submarket_registry
+from api.core.workers import WorkerPool, get_worker_pool
 from api.models.event import Event
 from typing import List, Tuple, Optional
 from api.models.bid import Bid
@@ -14,6 +17,7 @@ from api.core.agents.buyer_negotiator import BuyerNegotiator
 from api.core.agents.seller_negotiator import SellerNegotiator
 import asyncio
 import logging
+import time
 
 
 class MarketNegotiator:
@@ -21,9 +25,22 @@ class MarketNegotiator:
     Responsible for negotiating transactions between buyers and sellers based on search results.
     """
 
-    def __init__(self) -> None:
-        self.pairs = self._retrieve_search_results()
+    def __init__(
+        self,
+        scheduler: Optional[NegotiationScheduler] = None,
+        pairs: Optional[List[Tuple[str, str]]] = None,
+        budget: Optional[asyncio.Semaphore] = None,
+        workers: Optional[WorkerPool] = None,
+    ) -> None:
+        self.pairs = pairs if pairs is not None else self._retrieve_search_results()
         self.negotiation_results = []
+        self.scheduler = scheduler or get_scheduler()
+        # Caps pair negotiations in flight across every submarket this negotiator runs
+        self.budget = budget
+        # Worker processes for blocking negotiations, None to run them in threads here
+        self.workers = workers if workers is not None else get_worker_pool()
+        # Per-outcome counts: screening decisions plus how contested pairs ended
+        self.outcome_counts = {SETTLED: 0, INFEASIBLE: 0, CONTESTED: 0, "agreed": 0, "failed": 0}
         
         # Configure logging for negotiation tracking
         self.logger = logging.getLogger(__name__)
@@ -41,19 +58,27 @@ class MarketNegotiator:
         
         return [(result["bid_id"], result["ticket_id"]) for result in results]
     
-    def retrieve_search_resuls_submarket(self, submarket: SubMarket) -> List[Tuple[str, str]]:
+    def retrieve_search_resuls_submarket(self, submarket: SubMarket, pairs: Optional[List[Tuple[str, str]]] = None) -> List[Tuple[str, str]]:
         """
-        Filters search results for a specific submarket.
+        Filters search results (or the given pairs) for a specific submarket.
         Returns a list of (bid_id, ticket_id) tuples relevant to the submarket.
         """
-        filtered_pairs = []
-        submarket_ticket_ids = [ticket.ticket_id for ticket in submarket.tickets]
-        submarket_bid_ids = [bid.bid_id for bid in submarket.bids]
-        for bid_id, ticket_id in self.pairs:
-            if bid_id in submarket_bid_ids and ticket_id in submarket_ticket_ids:
-                filtered_pairs.append((bid_id, ticket_id))
-        return filtered_pairs
+        return [
+            (bid_id, ticket_id)
+            for bid_id, ticket_id in (self.pairs if pairs is None else pairs)
+            if bid_id in submarket.bids_by_id and ticket_id in submarket.tickets_by_id
+        ]
     
+    @staticmethod
+    def _agreement_gap(bid: Optional[Bid], ticket: Optional[Ticket]) -> float:
+        """
+        Relative distance between the opening bid and the list price. Pairs
+        closer to agreement get a smaller value and are scheduled first.
+        """
+        if bid is None or ticket is None or ticket.price <= 0:
+            return float("inf")
+        return max(0.0, ticket.price - bid.price) / ticket.price
+
     async def _negotiate_single_pair(self, bid_id: str, ticket_id: str, submarket: SubMarket) -> Optional[Tuple[str, str, float, int]]:
         """
         Conducts a single negotiation between a bid and ticket.
@@ -61,11 +86,18 @@ class MarketNegotiator:
         """
         self.logger.info(f"Starting negotiation for bid_id={bid_id}, ticket_id={ticket_id}")
         
-        bid = next((b for b in submarket.bids if b.bid_id == bid_id), None)
-        ticket = next((t for t in submarket.tickets if t.ticket_id == ticket_id), None)
+        bid = submarket.bids_by_id.get(bid_id)
+        ticket = submarket.tickets_by_id.get(ticket_id)
         
         if bid and ticket:
             self.logger.info(f"Found valid bid and ticket for {bid_id}-{ticket_id}")
+
+            outcome = screen_pair(bid, ticket)
+            self.outcome_counts[outcome] += 1
+            if outcome == INFEASIBLE:
+                self.logger.info(f"Screened OUT {bid_id}-{ticket_id}: no zone of agreement (max_price={bid.max_price}, min_price={ticket.min_price})")
+                return None
+
             buyer_negotiator = BuyerNegotiator(bid=bid, SubMarket=submarket)
             seller_negotiator = SellerNegotiator(ticket=ticket, SubMarket=submarket)
             
@@ -74,11 +106,28 @@ class MarketNegotiator:
                 seller_negotiator=seller_negotiator,
                 submarket=submarket
             )
+
+            if outcome == SETTLED:
+                agreement = negotiation.resolve()
+                self.logger.info(f"Screened SETTLED {bid_id}-{ticket_id}: price={agreement[2]}, quantity={agreement[3]}")
+                return agreement
+
+            if buyer_negotiator.strategy.blocking or seller_negotiator.strategy.blocking:
+                if self.workers is not None:
+                    def run(deadline: float):
+                        return self.workers.negotiate(bid, ticket, submarket, timeout=deadline - time.monotonic())
+                else:
+                    def run(deadline: float):
+                        negotiation.deadline = deadline
+                        return negotiation.simulate_negotiation()
+
+                # Admitted by the scheduler, then run in the executor to avoid blocking
+                agreement = await self.scheduler.run(run, priority=self._agreement_gap(bid, ticket))
+            else:
+                # Rule-based agents make no LLM calls and finish in microseconds
+                agreement = negotiation.simulate_negotiation()
             
-            # Run in executor to avoid blocking
-            loop = asyncio.get_event_loop()
-            agreement = await loop.run_in_executor(None, negotiation.simulate_negotiation)
-            
+            self.outcome_counts["agreed" if agreement else "failed"] += 1
             if agreement:
                 self.logger.info(f"Negotiation SUCCESS for {bid_id}-{ticket_id}: price={agreement[2]}, quantity={agreement[3]}")
             else:
@@ -89,17 +138,23 @@ class MarketNegotiator:
             self.logger.error(f"Invalid bid or ticket for {bid_id}-{ticket_id}: bid={bid is not None}, ticket={ticket is not None}")
             return None
 
-    async def negotiate_pairs_submarket(self, submarket: SubMarket) -> List[Optional[Tuple[str, str, float, int]]]:
+    async def _negotiate_within_budget(self, bid_id: str, ticket_id: str, submarket: SubMarket) -> Optional[Tuple[str, str, float, int]]:
+        if self.budget is None:
+            return await self._negotiate_single_pair(bid_id, ticket_id, submarket)
+        async with self.budget:
+            return await self._negotiate_single_pair(bid_id, ticket_id, submarket)
+
+    async def negotiate_pairs_submarket(self, submarket: SubMarket, pairs: Optional[List[Tuple[str, str]]] = None) -> List[Optional[Tuple[str, str, float, int]]]:
         """
         Conducts negotiations for all bid-ticket pairs in the specified submarket.
         Returns a list of agreements (bid_id, ticket_id, price, quantity) or None for failed negotiations.
         """
-        filtered_pairs = self.retrieve_search_resuls_submarket(submarket)
+        filtered_pairs = self.retrieve_search_resuls_submarket(submarket, pairs)
         self.logger.info(f"Starting parallel negotiations for {len(filtered_pairs)} bid-ticket pairs")
         
-        # Create tasks for all negotiations to run concurrently
+        # Create tasks for all negotiations; the budget and the scheduler decide how many run at once
         tasks = [
-            self._negotiate_single_pair(bid_id, ticket_id, submarket)
+            self._negotiate_within_budget(bid_id, ticket_id, submarket)
             for bid_id, ticket_id in filtered_pairs
         ]
         
@@ -107,16 +162,20 @@ class MarketNegotiator:
         agreements = await asyncio.gather(*tasks)
         
         successful_negotiations = [a for a in agreements if a is not None]
-        self.logger.info(f"Completed negotiations: {len(successful_negotiations)}/{len(filtered_pairs)} successful")
+        self.logger.info(f"Completed negotiations: {len(successful_negotiations)}/{len(filtered_pairs)} successful, outcomes={self.outcome_counts}")
         
         self.negotiation_results.extend(agreements)
         return agreements
+
+    async def negotiate_submarket(self, event_id: str, group_id: str, strategy: Optional[str] = None) -> List[Optional[Tuple[str, str, float, int]]]:
+        """
+        Negotiates the pairs of a submarket against its shared snapshot.
+        """
+        return await self.negotiate_pairs_submarket(submarket_registry.get(event_id, group_id, strategy))
         
     
 
 if __name__ == "__main__":
     market_negotiator = MarketNegotiator()
-    event = Event.get_event_by_id(event_id="event_001")
-    submarket = SubMarket(event=event, group_id = "FLOOR_PREMIUM")
-    results = asyncio.run(market_negotiator.negotiate_pairs_submarket(submarket))
+    results = asyncio.run(market_negotiator.negotiate_submarket("event_001", "FLOOR_PREMIUM"))
     print(results)
\ No newline at end of file
@@ -0,0 +1,205 @@
+"""
+Contains incrementally maintained price statistics per submarket.
+
+Ticket and bid tables report every row change to MarketStats, which keeps
+a seat-weighted count, sum and quantile sketch per (event_id, group_id):
+tickets weighted by quantity at their price, bids by num_tickets at their
+price. Bids open to any group are kept once per event and merged into
+every group when queried. Nothing is expanded per seat, so a summary costs
+O(groups) however many seats are listed.
+
+The sketch buckets prices on a logarithmic scale (relative accuracy
+MARKET_STATS_RELATIVE_ACCURACY) and remembers the weighted sum inside each
+bucket, so prices that do not share a bucket with another price are
+reported exactly.
+"""
+
+import bisect
+import math
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from api.services import repository
+from configs import MARKET_STATS_RELATIVE_ACCURACY
+
+
+def _cents(price: float) -> int:
+    return round(price * 100)
+
+
+class QuantileSketch:
+    """
+    Weighted quantile sketch over positive prices that supports removal.
+    """
+
+    def __init__(self, relative_accuracy: float = MARKET_STATS_RELATIVE_ACCURACY) -> None:
+        self._log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        # bucket -> [weight, sum of price * weight in cents]
+        self._buckets: Dict[int, List[int]] = {}
+        self._keys: List[int] = []
+        self._zero_weight = 0
+        self.count = 0
+        self.total_cents = 0
+
+    def _bucket(self, cents: int) -> Optional[int]:
+        return math.ceil(math.log(cents) / self._log_gamma) if cents > 0 else None
+
+    def add(self, price: float, weight: int) -> None:
+        """
+        Adds weight seats at price; a negative weight removes them.
+        """
+        if weight == 0:
+            return
+        cents = _cents(price)
+        self.count += weight
+        self.total_cents += cents * weight
+        key = self._bucket(cents)
+        if key is None:
+            self._zero_weight += weight
+            return
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [0, 0]
+            bisect.insort(self._keys, key)
+        bucket[0] += weight
+        bucket[1] += cents * weight
+        if bucket[0] <= 0:
+            del self._buckets[key]
+            self._keys.pop(bisect.bisect_left(self._keys, key))
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        merged = QuantileSketch.__new__(QuantileSketch)
+        merged._log_gamma = self._log_gamma
+        merged._buckets = {key: list(value) for key, value in self._buckets.items()}
+        for key, (weight, cents) in other._buckets.items():
+            bucket = merged._buckets.setdefault(key, [0, 0])
+            bucket[0] += weight
+            bucket[1] += cents
+        merged._keys = sorted(merged._buckets)
+        merged._zero_weight = self._zero_weight + other._zero_weight
+        merged.count = self.count + other.count
+        merged.total_cents = self.total_cents + other.total_cents
+        return merged
+
+    def _value_at(self, rank: int) -> float:
+        """
+        Price of the seat at 0-based rank in price order.
+        """
+        if rank < self._zero_weight:
+            return 0.0
+        seen = self._zero_weight
+        for key in self._keys:
+            weight, cents = self._buckets[key]
+            seen += weight
+            if rank < seen:
+                return cents / weight / 100
+        return self._buckets[self._keys[-1]][1] / self._buckets[self._keys[-1]][0] / 100
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Interpolates between neighbouring seats like numpy's default method.
+        """
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        lower, upper = math.floor(rank), math.ceil(rank)
+        low = self._value_at(lower)
+        if upper == lower:
+            return low
+        return low + (self._value_at(upper) - low) * (rank - lower)
+
+    def mean(self) -> Optional[float]:
+        return self.total_cents / self.count / 100 if self.count > 0 else None
+
+
+class GroupSummary(NamedTuple):
+    group_id: str
+    num_tickets: int
+    avg_ticket_price: Optional[float]
+    median_ticket_price: Optional[float]
+    num_bids: int
+    avg_bid_price: Optional[float]
+    median_bid_price: Optional[float]
+
+
+class MarketStats:
+    """
+    Ticket and bid statistics for every submarket, kept in step with the
+    repository through table listeners attached on first use.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._attach_lock = threading.Lock()
+        self._attached = False
+        self._tickets: Dict[Tuple[str, str], QuantileSketch] = {}
+        self._bids: Dict[Tuple[str, Optional[str]], QuantileSketch] = {}
+
+    def _ensure_attached(self) -> None:
+        if self._attached:
+            return
+        with self._attach_lock:
+            if not self._attached:
+                repository.tickets.add_listener(self._on_ticket)
+                repository.bids.add_listener(self._on_bid)
+                self._attached = True
+
+    @staticmethod
+    def _ticket_entries(row: Optional[dict]) -> List[Tuple[Tuple[str, str], float, int]]:
+        if row is None:
+            return []
+        return [((row["event_id"], row["group_id"]), float(row.get("price") or 0), int(row.get("quantity") or 0))]
+
+    @staticmethod
+    def _bid_entries(row: Optional[dict]) -> List[Tuple[Tuple[str, Optional[str]], float, int]]:
+        if row is None:
+            return []
+        price, weight = float(row.get("price") or 0), int(row.get("num_tickets") or 0)
+        groups = row.get("allowed_groups") or [None]
+        return [((row["event_id"], group_id), price, weight) for group_id in groups]
+
+    @staticmethod
+    def _apply(sketches: Dict, old_entries: List, new_entries: List) -> None:
+        for key, price, weight in old_entries:
+            sketch = sketches.get(key)
+            if sketch is not None:
+                sketch.add(price, -weight)
+                if sketch.count <= 0:
+                    del sketches[key]
+        for key, price, weight in new_entries:
+            if weight > 0:
+                sketches.setdefault(key, QuantileSketch()).add(price, weight)
+
+    def _on_ticket(self, old_row: Optional[dict], new_row: Optional[dict]) -> None:
+        with self._lock:
+            self._apply(self._tickets, self._ticket_entries(old_row), self._ticket_entries(new_row))
+
+    def _on_bid(self, old_row: Optional[dict], new_row: Optional[dict]) -> None:
+        with self._lock:
+            self._apply(self._bids, self._bid_entries(old_row), self._bid_entries(new_row))
+
+    def group_summary(self, event_id: str, group_id: str) -> GroupSummary:
+        """
+        Seat-weighted counts, averages and medians of the tickets listed in
+        a group and of the bids that accept it.
+        """
+        self._ensure_attached()
+        repository.tickets.refresh()
+        repository.bids.refresh()
+        with self._lock:
+            tickets = self._tickets.get((event_id, group_id)) or QuantileSketch()
+            bids = self._bids.get((event_id, group_id)) or QuantileSketch()
+            any_group = self._bids.get((event_id, None))
+            if any_group is not None:
+                bids = bids.merge(any_group)
+            return GroupSummary(
+                group_id,
+                tickets.count, tickets.mean(), tickets.quantile(0.5),
+                bids.count, bids.mean(), bids.quantile(0.5),
+            )
+
+    def event_summary(self, event_id: str, group_ids: List[str]) -> List[GroupSummary]:
+        return [self.group_summary(event_id, group_id) for group_id in group_ids]
+
+
+market_stats = MarketStats()
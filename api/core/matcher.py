@@ -1,3 +1,150 @@
 """
-Responible fo picking candidate sellers for a buyer
-"""
\ No newline at end of file
+Responsible for picking candidate sellers for a buyer.
+
+Replaces the LLM ticket-filtering call with a deterministic ranking: the
+event's listings are filtered on allowed groups, quantity and the bid's
+price ceiling, then scored by seat value for money using the event's
+reference values, all as vectorized NumPy operations. The arrays of each
+event are built once and kept until its listings or the event change.
+"""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from api.services import repository
+from configs import MATCH_TOP_K
+
+
+class TicketMatcher:
+    """
+    Ranks the listings of a single event against bids.
+    """
+
+    def __init__(self, event: dict, tickets: Optional[List[dict]] = None) -> None:
+        self.event = event
+        self.tickets = tickets if tickets is not None else repository.tickets.find("event_id", event["event_id"])
+
+        reference_values = event["reference_values"]
+        group_ids = list(reference_values.keys())
+        group_index = {gid: i for i, gid in enumerate(group_ids)}
+
+        self.group_ids = np.array(group_ids + [""], dtype=object)
+        # Listings in a group the event does not price get the last slot and zero weight
+        self.groups = np.array(
+            [group_index.get(t["group_id"], len(group_ids)) for t in self.tickets], dtype=np.int64
+        )
+        self.prices = np.array([t["price"] for t in self.tickets], dtype=np.float64)
+        self.min_prices = np.array([t["min_price"] for t in self.tickets], dtype=np.float64)
+        self.quantities = np.array([t["quantity"] for t in self.tickets], dtype=np.int64)
+
+        values = np.array(list(reference_values.values()) + [0.0], dtype=np.float64)
+        top_value = values.max() if values.size and values.max() > 0 else 1.0
+        self.group_weights = values / top_value
+
+    def match(self, bid: dict, top_k: int = MATCH_TOP_K) -> List[dict]:
+        """
+        Returns up to top_k listings the bid could buy, best first.
+
+        A listing is a candidate when its group is allowed by the bid (an
+        empty allowed_groups list allows every group), it has at least
+        num_tickets left, and its seller's floor is within the bid's
+        max_price, i.e. a deal is possible. Candidates are ranked by group
+        weight per dollar of list price, ties going to the cheaper listing.
+        """
+        if not self.tickets or top_k <= 0:
+            return []
+
+        mask = (self.quantities >= bid["num_tickets"]) & (self.min_prices <= bid["max_price"])
+        allowed_groups = bid.get("allowed_groups") or []
+        if allowed_groups:
+            mask &= np.isin(self.group_ids[self.groups], allowed_groups)
+
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+
+        prices = self.prices[candidates]
+        scores = self.group_weights[self.groups[candidates]] / np.maximum(prices, 1e-9)
+
+        k = min(top_k, candidates.size)
+        if k < candidates.size:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(candidates.size)
+        order = top[np.lexsort((prices[top], -scores[top]))]
+
+        return [self.tickets[i] for i in candidates[order]]
+
+
+class MatcherCache:
+    """
+    Keeps one TicketMatcher per event, dropped by table listeners when the
+    event or any of its listings changes.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._attach_lock = threading.Lock()
+        self._attached = False
+        self._versions: Dict[str, int] = {}
+        self._matchers: Dict[str, Tuple[int, TicketMatcher]] = {}
+
+        self.builds = 0
+        self.hits = 0
+
+    def _ensure_attached(self) -> None:
+        if self._attached:
+            return
+        with self._attach_lock:
+            if not self._attached:
+                repository.tickets.add_listener(self._on_change)
+                repository.events.add_listener(self._on_change)
+                self._attached = True
+
+    def _on_change(self, old_row: Optional[dict], new_row: Optional[dict]) -> None:
+        with self._lock:
+            for row in (old_row, new_row):
+                if row is not None:
+                    self._versions[row["event_id"]] = self._versions.get(row["event_id"], 0) + 1
+                    self._matchers.pop(row["event_id"], None)
+
+    def get(self, event: dict) -> TicketMatcher:
+        """
+        Returns the matcher of event, building it if the event's listings
+        changed since the last one.
+        """
+        self._ensure_attached()
+        repository.tickets.refresh()
+        repository.events.refresh()
+        event_id = event["event_id"]
+        with self._lock:
+            version = self._versions.get(event_id, 0)
+            cached = self._matchers.get(event_id)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1]
+
+        # Built outside the lock; a change meanwhile bumps the version, so
+        # the matcher is used once but not kept
+        matcher = TicketMatcher(event)
+        with self._lock:
+            self.builds += 1
+            if self._versions.get(event_id, 0) == version:
+                self._matchers[event_id] = (version, matcher)
+        return matcher
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"matchers": len(self._matchers), "builds": self.builds, "hits": self.hits}
+
+
+matcher_cache = MatcherCache()
+
+
+def match_tickets(bid: dict, event: dict, top_k: int = MATCH_TOP_K) -> List[dict]:
+    """
+    Returns the top_k listings of the bid's event that best match the bid.
+    """
+    return matcher_cache.get(event).match(bid, top_k=top_k)
@@ -8,8 +8,47 @@ from api.models.ticket import Ticket
 from typing import List, Optional, Tuple
 from api.core.agents.buyer_negotiator import BuyerNegotiator
 from api.core.agents.seller_negotiator import SellerNegotiator
-from configs import MAX_ROUNDS
+from api.core.agents.offer_protocol import ACCEPT, WALK, Offer
+from api.core.event_bus import negotiation_bus
+from concurrent.futures import ThreadPoolExecutor, wait
+from configs import CONCURRENT_TURNS, MAX_ROUNDS, TURN_EXECUTOR_WORKERS
 import logging
+import time
+
+# Runs the seller's turn while the negotiation's own thread runs the buyer's
+_turn_executor = ThreadPoolExecutor(max_workers=TURN_EXECUTOR_WORKERS, thread_name_prefix="negotiation-turn")
+
+# Screening outcomes for a (bid, ticket) pair
+SETTLED = "settled"
+INFEASIBLE = "infeasible"
+CONTESTED = "contested"
+
+
+def feasible_price_interval(bid: Bid, ticket: Ticket) -> Optional[Tuple[float, float]]:
+    """
+    Returns the zone of agreement (ticket.min_price, bid.max_price), or None
+    if no price satisfies both sides.
+    """
+    low, high = ticket.min_price, bid.max_price
+    if low > high:
+        return None
+    return low, high
+
+
+def screen_pair(bid: Bid, ticket: Ticket) -> str:
+    """
+    Classifies a pair before any LLM call is made:
+    - INFEASIBLE if nothing is left to sell or the zone of agreement is empty
+    - SETTLED if the opening bid already meets the list price
+    - CONTESTED otherwise, i.e. a deal is possible but must be negotiated
+    """
+    if ticket.get_ticket_quantity() <= 0 or bid.get_bid_quantity() <= 0:
+        return INFEASIBLE
+    if feasible_price_interval(bid, ticket) is None:
+        return INFEASIBLE
+    if bid.get_bid_price() >= ticket.get_ticket_price():
+        return SETTLED
+    return CONTESTED
 
 
 class Negotiation:
@@ -21,12 +60,20 @@ class Negotiation:
         self,
         buyer_negotiator: BuyerNegotiator,
         seller_negotiator: SellerNegotiator,
-        submarket: SubMarket
+        submarket: SubMarket,
+        deadline: Optional[float] = None,
+        concurrent_turns: bool = CONCURRENT_TURNS
     ) -> None:
         self.buyer_negotiator = buyer_negotiator
         self.seller_negotiator = seller_negotiator
         self.submarket = submarket
         self.is_resolved = False
+        # time.monotonic() value after which no new round is started
+        self.deadline = deadline
+        # Only worth a second thread when a turn waits on the network
+        self.concurrent_turns = concurrent_turns and (
+            buyer_negotiator.strategy.blocking or seller_negotiator.strategy.blocking
+        )
 
         self.agreement: Optional[Tuple[int, int, float, int]] = None  # (price, quantity)
         self.rounds = 1
@@ -43,6 +90,35 @@ class Negotiation:
         if not self.logger.handlers:
             logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         self.logger.info(f"Negotiation started: {self.negotiation_id}, max_quantity={self.quantity}")
+        # Live event topics: subscribers follow a bid, a ticket or a whole event
+        self.topics = [
+            f"bid:{buyer_negotiator.bid.bid_id}",
+            f"ticket:{seller_negotiator.ticket.ticket_id}",
+            f"event:{submarket.event_id}",
+        ]
+
+    def _publish(self, event_type: str, **fields) -> None:
+        if not negotiation_bus.has_subscribers(self.topics):
+            return
+        negotiation_bus.publish(self.topics, {
+            "type": event_type,
+            "negotiation_id": self.negotiation_id,
+            "bid_id": self.buyer_negotiator.bid.bid_id,
+            "ticket_id": self.seller_negotiator.ticket.ticket_id,
+            "event_id": self.submarket.event_id,
+            "group_id": self.submarket.group_id,
+            "round": self.rounds,
+            **fields,
+        })
+
+    def _publish_turn(self, side: str, offer: Offer) -> None:
+        if offer.action == ACCEPT:
+            event_type = "accept"
+        elif offer.action == WALK:
+            event_type = "walk"
+        else:
+            event_type = "offer" if self.rounds == 1 else "counter"
+        self._publish(event_type, side=side, price=offer.price, message=offer.message)
 
     def resolve(self) -> Optional[Tuple[float, int]]:
         """
@@ -61,15 +137,42 @@ class Negotiation:
             )
             self.agreement = (self.buyer_negotiator.bid.bid_id, self.seller_negotiator.ticket.ticket_id, agreed_price, agreed_quantity)
             self.is_resolved = True
+            self._publish("start", quantity=self.quantity)
+            self._publish("end", agreement=self.agreement, settled=True)
             return self.agreement
         
         else:
             pass
+
+    def _take_turns(self) -> Tuple[Offer, Offer]:
+        """
+        Gets the buyer's and seller's turns for the current round. Neither
+        agent sees the other's message until the responses are processed, so
+        both LLM calls can be in flight at once.
+        """
+        if not self.concurrent_turns:
+            return self.buyer_negotiator.negotiate(), self.seller_negotiator.negotiate()
+
+        seller_future = _turn_executor.submit(self.seller_negotiator.negotiate)
+        try:
+            buyer_response = self.buyer_negotiator.negotiate()
+        except BaseException:
+            # Never leave the seller's turn running behind a failed buyer turn
+            wait([seller_future])
+            raise
+        return buyer_response, seller_future.result()
         
     def simulate_negotiation(self):
         """
-        Simulates an entire negotiation process between buyer and seller.
+        Simulates an entire negotiation process between buyer and seller,
+        publishing its progress to the negotiation event bus.
         """
+        self._publish("start", quantity=self.quantity)
+        agreement = self._simulate()
+        self._publish("end", agreement=agreement)
+        return agreement
+
+    def _simulate(self):
         self.logger.info(f"Starting negotiation simulation for {self.negotiation_id}")
         
         while not self.is_resolved and self.rounds <= self.max_rounds:
@@ -88,10 +191,19 @@ class Negotiation:
                 self.shared_conversation_history = self.buyer_negotiator.get_conversation_history()
                 self.logger.info(f"Negotiation RESOLVED by seller for {self.negotiation_id}: price=${self.seller_negotiator.current_offer}, quantity={self.quantity}")
                 return self.agreement
+
+            if self.buyer_negotiator.has_walked() or self.seller_negotiator.has_walked():
+                self.logger.info(f"Negotiation ended by walk-away for {self.negotiation_id} after round {self.rounds - 1}")
+                break
             
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.logger.warning(f"Negotiation deadline reached for {self.negotiation_id} before round {self.rounds}")
+                break
+
             self.logger.debug(f"Getting responses for round {self.rounds} of {self.negotiation_id}")
-            buyer_response = self.buyer_negotiator.negotiate()
-            seller_response = self.seller_negotiator.negotiate()
+            buyer_response, seller_response = self._take_turns()
+            self._publish_turn("buyer", buyer_response)
+            self._publish_turn("seller", seller_response)
             
             self.logger.debug(f"Processing responses for round {self.rounds} of {self.negotiation_id}")
             self.buyer_negotiator.process_seller_response(seller_response)
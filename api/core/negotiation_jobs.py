@@ -0,0 +1,234 @@
+"""
+Contains the background job runner for orchestrated negotiations.
+
+Starting a negotiation creates a job row in the durable job table and
+returns at once. Jobs run on a dedicated thread with its own event loop,
+independent of the request or websocket that started them, and their
+streamed results are stored as they arrive, one row each in a results
+table, so status and partial results can be read from any process at
+any time. When a
+process on the same host has exited, its queued jobs are picked up again
+on start and its running jobs are marked failed, since their events may
+be partly committed.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from api.core.agents.strategies import check_strategy
+from api.core.orchestrator import EventResult, NegotiationOrchestrator, Result
+from api.services import repository
+from configs import NEGOTIATION_JOB_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def _owner() -> Dict[str, Any]:
+    return {"host": socket.gethostname(), "pid": os.getpid()}
+
+
+def _orphaned(row: dict) -> bool:
+    """
+    Whether the process that owns a job on this host has exited. Jobs
+    owned by other hosts are left to them.
+    """
+    owner = row.get("owner") or {}
+    if owner.get("host") != socket.gethostname():
+        return False
+    if owner.get("pid") == os.getpid():
+        # Not tracked by this process, so left behind by an earlier one with our pid
+        return True
+    try:
+        os.kill(owner["pid"], 0)
+    except ProcessLookupError:
+        return True
+    except (KeyError, TypeError, PermissionError):
+        return False
+    return False
+
+
+def _result_row(result: Result) -> Dict[str, Any]:
+    row = result._asdict()
+    row["type"] = "event" if isinstance(result, EventResult) else "submarket"
+    return row
+
+
+class NegotiationJobRunner:
+    """
+    Runs negotiation jobs on a background event loop, a few at a time.
+    """
+
+    def __init__(self, concurrency: int = NEGOTIATION_JOB_CONCURRENCY) -> None:
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._futures: Dict[str, Future] = {}
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                ready = threading.Event()
+
+                def run() -> None:
+                    self._loop = asyncio.new_event_loop()
+                    asyncio.set_event_loop(self._loop)
+                    self._slots = asyncio.Semaphore(self.concurrency)
+                    ready.set()
+                    self._loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="negotiation-jobs", daemon=True)
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        repository.negotiation_jobs.update(job_id, lambda row: {**row, **fields})
+
+    def _append_result(self, job_id: str, seq: int, result: Result) -> None:
+        row = _result_row(result)
+        repository.negotiation_results.put({**row, "result_id": f"{job_id}:{seq}", "job_id": job_id, "seq": seq})
+
+    @staticmethod
+    def results(job_id: str) -> List[Dict[str, Any]]:
+        """
+        A job's results stored so far, in the order they arrived.
+        """
+        rows = sorted(repository.negotiation_results.find("job_id", job_id), key=lambda row: row["seq"])
+        return [{key: value for key, value in row.items() if key not in ("result_id", "job_id", "seq")} for row in rows]
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        Returns a job row with its results, or None if there is no such job.
+        """
+        row = repository.negotiation_jobs.get(job_id)
+        if row is None:
+            return None
+        return {**row, "results": self.results(job_id)}
+
+    async def _run(self, job_id: str, pairs: Optional[List[Tuple[str, str]]], event_ids: Optional[List[str]], strategy: Optional[str]) -> Dict[str, Any]:
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            # Storage writes wait for fsync; keep them off the loop
+            await loop.run_in_executor(None, lambda: self._update(job_id, status=RUNNING, started_at=time.time()))
+            orchestrator = None
+            try:
+                orchestrator = await loop.run_in_executor(
+                    None, lambda: NegotiationOrchestrator(pairs=pairs, event_ids=event_ids, strategy=strategy)
+                )
+                seq = 0
+                async for result in orchestrator.stream():
+                    await loop.run_in_executor(None, self._append_result, job_id, seq, result)
+                    seq += 1
+                fields = {"status": COMPLETED, "stats": orchestrator.stats()}
+            except Exception as e:
+                logger.exception(f"Negotiation job {job_id} failed")
+                fields = {"status": FAILED, "error": repr(e), "stats": orchestrator.stats() if orchestrator else None}
+            fields["finished_at"] = time.time()
+            await loop.run_in_executor(None, lambda: self._update(job_id, **fields))
+            return self.get(job_id)
+
+    def _start(self, row: dict) -> None:
+        loop = self._ensure_started()
+        request = row["request"]
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(row["job_id"], request["pairs"], request["event_ids"], request["strategy"]), loop
+        )
+        with self._lock:
+            self._futures[row["job_id"]] = future
+        future.add_done_callback(lambda _: self._forget(row["job_id"]))
+
+    def _forget(self, job_id: str) -> None:
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def submit(
+        self,
+        pairs: Optional[Iterable[Tuple[str, str]]] = None,
+        event_ids: Optional[Iterable[str]] = None,
+        strategy: Optional[str] = None,
+    ) -> dict:
+        """
+        Stores a queued job and starts it in the background. Returns the
+        job row; pairs default to the stored search results. Raises
+        ValueError for an unknown strategy.
+        """
+        check_strategy(strategy)
+        row = {
+            "job_id": str(uuid.uuid4()),
+            "status": QUEUED,
+            "owner": _owner(),
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "request": {
+                "pairs": [list(pair) for pair in pairs] if pairs is not None else None,
+                "event_ids": list(event_ids) if event_ids is not None else None,
+                "strategy": strategy,
+            },
+            "stats": None,
+            "error": None,
+        }
+        repository.negotiation_jobs.put(row)
+        self._start(row)
+        return row
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        """
+        Waits up to timeout seconds for a job started by this process to
+        finish, without cancelling it, and returns its current row with
+        its results.
+        """
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.get(job_id)
+
+    def recover(self) -> None:
+        """
+        Takes over the jobs of processes on this host that have exited:
+        queued ones are started again, running ones are marked failed.
+        """
+        for row in repository.negotiation_jobs.find("status", RUNNING):
+            if self._owned_elsewhere(row):
+                continue
+            self._update(row["job_id"], status=FAILED, error="interrupted by a restart", finished_at=time.time())
+        for row in repository.negotiation_jobs.find("status", QUEUED):
+            if self._owned_elsewhere(row):
+                continue
+            logger.info(f"Resuming queued negotiation job {row['job_id']}")
+            row = {**row, "owner": _owner()}
+            repository.negotiation_jobs.put(row)
+            self._start(row)
+
+    def _owned_elsewhere(self, row: dict) -> bool:
+        with self._lock:
+            if row["job_id"] in self._futures:
+                return True
+        return not _orphaned(row)
+
+    def stop(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+job_runner = NegotiationJobRunner()
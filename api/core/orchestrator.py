@@ -0,0 +1,221 @@
+"""
+Contains the orchestrator that clears whole events or the whole catalog.
+
+Search result pairs are grouped by the (event_id, group_id) of their
+ticket, every submarket snapshot is taken once from the registry, and
+all submarkets negotiate concurrently under one global budget of pair
+negotiations in flight. Results are streamed per submarket as they
+finish. Once every submarket of an event is done, the event's agreements
+are committed through the transaction resolver and an event result
+follows.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from api.core.agents.strategies import check_strategy
+from api.core.market_negotiate import MarketNegotiator
+from api.core.submarket_registry import submarket_registry
+from api.core.transaction_resolver import Agreement, TransactionResolver
+from api.services import repository
+from configs import ORCHESTRATOR_MAX_CONCURRENCY, ORCHESTRATOR_RESOLVE
+
+logger = logging.getLogger(__name__)
+
+Pair = Tuple[str, str]
+
+
+class SubmarketResult(NamedTuple):
+    event_id: str
+    group_id: str
+    pairs: int
+    agreements: List[Agreement]
+    seconds: float
+
+
+class EventResult(NamedTuple):
+    event_id: str
+    submarkets: int
+    agreements: List[Agreement]
+    # Allocations committed by the resolver; None if it gave up or did not run
+    committed: Optional[List[Agreement]]
+    seconds: float
+
+
+Result = Union[SubmarketResult, EventResult]
+
+
+class _RunTotals:
+    """
+    Process-wide throughput counters across orchestrated runs.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.submarkets = 0
+        self.pairs = 0
+        self.agreements = 0
+        self.tickets_committed = 0
+        self.seconds = 0.0
+
+    def record(self, submarkets: int, pairs: int, agreements: int, tickets_committed: int, seconds: float) -> None:
+        with self._lock:
+            self.runs += 1
+            self.submarkets += submarkets
+            self.pairs += pairs
+            self.agreements += agreements
+            self.tickets_committed += tickets_committed
+            self.seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "submarkets": self.submarkets,
+                "pairs": self.pairs,
+                "agreements": self.agreements,
+                "tickets_committed": self.tickets_committed,
+                "seconds": self.seconds,
+                "pairs_per_second": self.pairs / self.seconds if self.seconds else 0.0,
+            }
+
+
+run_totals = _RunTotals()
+
+
+class NegotiationOrchestrator:
+    """
+    Runs every submarket of a set of search results concurrently.
+    """
+
+    def __init__(
+        self,
+        pairs: Optional[Iterable[Pair]] = None,
+        event_ids: Optional[Iterable[str]] = None,
+        max_concurrency: int = ORCHESTRATOR_MAX_CONCURRENCY,
+        resolve: bool = ORCHESTRATOR_RESOLVE,
+        strategy: Optional[str] = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.resolve = resolve
+        self.strategy = check_strategy(strategy)
+        self.negotiator = MarketNegotiator(pairs=list(pairs) if pairs is not None else None)
+        self.submarkets = self.group_pairs(self.negotiator.pairs, set(event_ids) if event_ids is not None else None)
+
+        self.results: List[Result] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @staticmethod
+    def group_pairs(pairs: Iterable[Pair], event_ids: Optional[set] = None) -> Dict[Tuple[str, str], List[Pair]]:
+        """
+        Groups pairs by the submarket of their ticket, skipping unknown
+        tickets and events outside event_ids.
+        """
+        grouped: Dict[Tuple[str, str], List[Pair]] = defaultdict(list)
+        for bid_id, ticket_id in pairs:
+            ticket = repository.tickets.get(ticket_id)
+            if ticket is None or (event_ids is not None and ticket["event_id"] not in event_ids):
+                continue
+            grouped[(ticket["event_id"], ticket["group_id"])].append((bid_id, ticket_id))
+        return dict(grouped)
+
+    async def _run_submarket(self, event_id: str, group_id: str, pairs: List[Pair]) -> SubmarketResult:
+        started = time.monotonic()
+        submarket = submarket_registry.get(event_id, group_id, self.strategy)
+        agreements = await self.negotiator.negotiate_pairs_submarket(submarket, pairs)
+        return SubmarketResult(
+            event_id, group_id, len(pairs), [a for a in agreements if a is not None], time.monotonic() - started
+        )
+
+    async def _resolve_event(self, event_id: str, results: List[SubmarketResult]) -> EventResult:
+        started = time.monotonic()
+        agreements = [a for result in results for a in result.agreements]
+        committed = None
+        if self.resolve and agreements:
+            resolver = TransactionResolver(agreements)
+            # The commit writes to storage, keep it off the event loop
+            committed = await asyncio.get_running_loop().run_in_executor(None, resolver.process_transactions)
+        elif not agreements:
+            committed = []
+        return EventResult(event_id, len(results), agreements, committed, time.monotonic() - started)
+
+    async def stream(self) -> AsyncIterator[Result]:
+        """
+        Yields each SubmarketResult as soon as the submarket is done, and an
+        EventResult once all submarkets of its event are.
+        """
+        self.started_at = time.monotonic()
+        self.results = []
+        # Budgets are loop-bound, so one is made per run
+        self.negotiator.budget = asyncio.Semaphore(self.max_concurrency)
+
+        remaining: Dict[str, int] = defaultdict(int)
+        for event_id, _ in self.submarkets:
+            remaining[event_id] += 1
+        finished: Dict[str, List[SubmarketResult]] = defaultdict(list)
+
+        tasks = [
+            asyncio.create_task(self._run_submarket(event_id, group_id, pairs))
+            for (event_id, group_id), pairs in self.submarkets.items()
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                self.results.append(result)
+                yield result
+
+                finished[result.event_id].append(result)
+                remaining[result.event_id] -= 1
+                if remaining[result.event_id] == 0:
+                    event_result = await self._resolve_event(result.event_id, finished.pop(result.event_id))
+                    self.results.append(event_result)
+                    yield event_result
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.finished_at = time.monotonic()
+            stats = self.stats()
+            run_totals.record(stats["submarkets"], stats["pairs"], stats["agreements"], stats["tickets_committed"], stats["seconds"])
+            logger.info(f"Orchestrated run finished: {stats}")
+
+    async def run(self) -> List[Result]:
+        """
+        Runs to completion and returns every streamed result.
+        """
+        async for _ in self.stream():
+            pass
+        return self.results
+
+    def stats(self) -> Dict[str, Any]:
+        submarket_results = [r for r in self.results if isinstance(r, SubmarketResult)]
+        event_results = [r for r in self.results if isinstance(r, EventResult)]
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        seconds = end - self.started_at if self.started_at is not None else 0.0
+        pairs = sum(r.pairs for r in submarket_results)
+        agreements = sum(len(r.agreements) for r in submarket_results)
+        return {
+            "submarkets": len(submarket_results),
+            "submarkets_total": len(self.submarkets),
+            "events": len(event_results),
+            "pairs": pairs,
+            "agreements": agreements,
+            "tickets_committed": sum(a[3] for r in event_results for a in r.committed or []),
+            "seconds": seconds,
+            "pairs_per_second": pairs / seconds if seconds else 0.0,
+            "max_submarket_seconds": max((r.seconds for r in submarket_results), default=0.0),
+            "outcomes": dict(self.negotiator.outcome_counts),
+        }
+
+
+async def negotiate(pairs: Optional[Iterable[Pair]] = None, event_ids: Optional[Iterable[str]] = None, **kwargs) -> List[Result]:
+    """
+    Negotiates and commits the given pairs (the stored search results by
+    default), limited to event_ids if given.
+    """
+    return await NegotiationOrchestrator(pairs=pairs, event_ids=event_ids, **kwargs).run()
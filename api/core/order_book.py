@@ -0,0 +1,439 @@
+"""
+Contains the in-memory limit order books that match crossing orders instantly.
+
+There is one book per (event_id, group_id). Tickets rest as asks at
+their list price, and bids rest as bids at their price in the book of
+every group they allow. Bids that accept any group rest in a per-event
+book under group None, which every group of the event also matches
+against. Orders are kept in heaps with price-time priority and removed
+lazily.
+
+A new order trades immediately when it crosses: the bid's price reaches
+the ask price, or the listing is marked immediate_sale and the bid's
+max_price reaches it. Trades execute at the ticket's list price. What
+does not fill rests for the negotiation path. Orders that are already
+stored when a book is first built rest without being matched.
+place_bid() and place_ticket() store a new order together with its
+fills, the counterparties' reduced quantities and a trades row per fill
+in one atomic commit.
+
+The books listen to the tickets and bids tables, so rows changed by any
+writer, including other processes, reach the resting orders. Listeners
+only queue the change; it is applied under the books' lock at the start
+of the next operation.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from api.services import buyer_service, repository, ticket_service
+from configs import ORDER_BOOK_DEPTH_LEVELS, ORDER_BOOK_ENABLED
+
+BID = "bid"
+ASK = "ask"
+
+
+class Trade(NamedTuple):
+    bid_id: str
+    ticket_id: str
+    price: float
+    quantity: int
+    event_id: str
+    group_id: str
+
+
+class _Order:
+    __slots__ = ("order_id", "side", "event_id", "groups", "price", "max_price", "remaining", "seq", "immediate")
+
+    def __init__(self, order_id: str, side: str, event_id: str, groups: List[Optional[str]], price: float,
+                 max_price: float, remaining: int, seq: int, immediate: bool = False) -> None:
+        self.order_id = order_id
+        self.side = side
+        self.event_id = event_id
+        self.groups = groups
+        self.price = price
+        self.max_price = max_price
+        self.remaining = remaining
+        self.seq = seq
+        self.immediate = immediate
+
+
+class OrderBook:
+    """
+    Resting orders of one submarket. Heaps hold (key, seq, order) entries
+    whose order may have been filled or cancelled since; those are skipped
+    and dropped when they reach the top.
+    """
+
+    def __init__(self, event_id: str, group_id: Optional[str]) -> None:
+        self.event_id = event_id
+        self.group_id = group_id
+        self.asks: List[Tuple[float, int, _Order]] = []
+        # Immediate-sale asks, matched against a bid's max_price as well
+        self.immediate_asks: List[Tuple[float, int, _Order]] = []
+        self.bids: List[Tuple[float, int, _Order]] = []
+        # Bids by max_price, for incoming immediate-sale asks
+        self.bid_reserves: List[Tuple[float, int, _Order]] = []
+
+    @staticmethod
+    def _head(heap: List[Tuple[float, int, _Order]]) -> Optional[_Order]:
+        while heap and heap[0][2].remaining <= 0:
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def add(self, order: _Order) -> None:
+        if order.side == ASK:
+            heapq.heappush(self.asks, (order.price, order.seq, order))
+            if order.immediate:
+                heapq.heappush(self.immediate_asks, (order.price, order.seq, order))
+        else:
+            heapq.heappush(self.bids, (-order.price, order.seq, order))
+            heapq.heappush(self.bid_reserves, (-order.max_price, order.seq, order))
+
+    def best_ask(self) -> Optional[_Order]:
+        return self._head(self.asks)
+
+    def best_immediate_ask(self) -> Optional[_Order]:
+        return self._head(self.immediate_asks)
+
+    def best_bid(self) -> Optional[_Order]:
+        return self._head(self.bids)
+
+    def best_bid_reserve(self) -> Optional[_Order]:
+        return self._head(self.bid_reserves)
+
+    def levels(self, side: str, limit: int) -> List[Tuple[float, int]]:
+        """
+        Aggregated (price, quantity) levels, best first.
+        """
+        heap = self.asks if side == ASK else self.bids
+        totals: Dict[float, int] = {}
+        for _, _, order in heap:
+            if order.remaining > 0:
+                totals[order.price] = totals.get(order.price, 0) + order.remaining
+        return sorted(totals.items(), reverse=side == BID)[:limit]
+
+
+class MarketBooks:
+    """
+    All order books, built lazily per event from the repository.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._books: Dict[Tuple[str, Optional[str]], OrderBook] = {}
+        self._event_groups: Dict[str, Set[str]] = {}
+        self._orders: Dict[Tuple[str, str], _Order] = {}
+        self._seq = itertools.count()
+        self._attached = False
+        # (side, old_row, new_row) changes heard from the tables, not yet applied
+        self._changes: deque = deque()
+
+        self.orders_submitted = 0
+        self.trades = 0
+        self.quantity_traded = 0
+        self.match_seconds = 0.0
+        self.max_match_seconds = 0.0
+
+    # Book maintenance, all called with the lock held
+
+    def _book(self, event_id: str, group_id: Optional[str]) -> OrderBook:
+        book = self._books.get((event_id, group_id))
+        if book is None:
+            book = OrderBook(event_id, group_id)
+            self._books[(event_id, group_id)] = book
+            if group_id is not None:
+                self._event_groups.setdefault(event_id, set()).add(group_id)
+        return book
+
+    def _attach(self) -> None:
+        if self._attached:
+            return
+        self._attached = True
+        repository.tickets.add_listener(lambda old_row, new_row: self._changes.append((ASK, old_row, new_row)))
+        repository.bids.add_listener(lambda old_row, new_row: self._changes.append((BID, old_row, new_row)))
+        # The replayed rows belong to events with no book yet, which read them when built
+        self._changes.clear()
+
+    def _apply_changes(self) -> None:
+        """
+        Brings resting orders in line with queued row changes. Rows of
+        events whose books are not built yet are read when they are.
+        """
+        while self._changes:
+            side, old_row, new_row = self._changes.popleft()
+            if new_row is None:
+                key = old_row["ticket_id"] if side == ASK else old_row["bid_id"]
+                order = self._orders.pop((side, key), None)
+                if order is not None:
+                    order.remaining = 0
+            elif new_row["event_id"] in self._event_groups:
+                order = self._ticket_order(new_row) if side == ASK else self._bid_order(new_row)
+                if (side, order.order_id) in self._orders:
+                    self._sync(order)
+                else:
+                    self._rest(order)
+
+    def _ensure_event(self, event_id: str) -> None:
+        if event_id in self._event_groups:
+            return
+        self._attach()
+        self._event_groups[event_id] = set()
+        for row in repository.tickets.find("event_id", event_id):
+            self._rest(self._ticket_order(row))
+        for row in repository.bids.find("event_id", event_id):
+            self._rest(self._bid_order(row))
+
+    def _ticket_order(self, row: dict) -> _Order:
+        return _Order(row["ticket_id"], ASK, row["event_id"], [row["group_id"]], float(row["price"]),
+                      float(row["price"]), int(row.get("quantity", 0)), next(self._seq), bool(row.get("immediate_sale")))
+
+    def _bid_order(self, row: dict) -> _Order:
+        # Bids built from an extracted intent may leave fields empty
+        groups = list(row.get("allowed_groups") or []) or [None]
+        price = float(row.get("price") or 0)
+        return _Order(row["bid_id"], BID, row["event_id"], groups, price,
+                      float(row.get("max_price") or price), int(row.get("num_tickets") or 0), next(self._seq))
+
+    def _rest(self, order: _Order) -> None:
+        if order.remaining <= 0:
+            return
+        self._orders[(order.side, order.order_id)] = order
+        for group_id in order.groups:
+            self._book(order.event_id, group_id).add(order)
+
+    def _sync(self, order: _Order) -> None:
+        """
+        Replaces the resting order with order's id by order. A smaller
+        quantity keeps its place in the queue; more quantity or any other
+        change re-rests it behind the orders already at its price, as an
+        exchange would.
+        """
+        current = self._orders.get((order.side, order.order_id))
+        if current is None:
+            return
+        same_terms = (current.price, current.max_price, current.groups, current.immediate) == (
+            order.price, order.max_price, order.groups, order.immediate)
+        if same_terms and order.remaining <= current.remaining:
+            current.remaining = order.remaining
+            return
+        current.remaining = 0
+        del self._orders[(order.side, order.order_id)]
+        self._rest(order)
+
+    @staticmethod
+    def _better(candidate: Optional[_Order], best: Optional[_Order], side: str) -> bool:
+        if candidate is None:
+            return False
+        if best is None:
+            return True
+        if candidate.price != best.price:
+            return candidate.price < best.price if side == ASK else candidate.price > best.price
+        return candidate.seq < best.seq
+
+    def _match_bid(self, ask: _Order) -> Optional[_Order]:
+        """
+        Best resting bid an incoming ask trades with, if any.
+        """
+        books = [self._books.get((ask.event_id, ask.groups[0])), self._books.get((ask.event_id, None))]
+        best = None
+        for book in books:
+            if book is not None and self._better(book.best_bid(), best, BID):
+                best = book.best_bid()
+        if best is not None and best.price >= ask.price:
+            return best
+        if ask.immediate:
+            best = None
+            for book in books:
+                candidate = book.best_bid_reserve() if book is not None else None
+                if candidate is not None and (best is None or (candidate.max_price, -candidate.seq) > (best.max_price, -best.seq)):
+                    best = candidate
+            if best is not None and best.max_price >= ask.price:
+                return best
+        return None
+
+    def _match_ask(self, bid: _Order) -> Optional[_Order]:
+        """
+        Best resting ask an incoming bid trades with, if any.
+        """
+        groups = self._event_groups.get(bid.event_id, set()) if bid.groups == [None] else bid.groups
+        best = None
+        for group_id in groups:
+            book = self._books.get((bid.event_id, group_id))
+            if book is None:
+                continue
+            candidate = book.best_ask()
+            if candidate is not None and candidate.price <= bid.price and self._better(candidate, best, ASK):
+                best = candidate
+            candidate = book.best_immediate_ask()
+            if candidate is not None and candidate.price <= bid.max_price and self._better(candidate, best, ASK):
+                best = candidate
+        return best
+
+    def _submit(self, order: _Order) -> List[Trade]:
+        started = time.perf_counter()
+        self._ensure_event(order.event_id)
+        trades: List[Trade] = []
+        while order.remaining > 0:
+            other = self._match_bid(order) if order.side == ASK else self._match_ask(order)
+            if other is None:
+                break
+            ask, bid = (order, other) if order.side == ASK else (other, order)
+            quantity = min(ask.remaining, bid.remaining)
+            ask.remaining -= quantity
+            bid.remaining -= quantity
+            trades.append(Trade(bid.order_id, ask.order_id, ask.price, quantity, ask.event_id, ask.groups[0]))
+        self._rest(order)
+
+        elapsed = time.perf_counter() - started
+        self.orders_submitted += 1
+        self.trades += len(trades)
+        self.quantity_traded += sum(trade.quantity for trade in trades)
+        self.match_seconds += elapsed
+        self.max_match_seconds = max(self.max_match_seconds, elapsed)
+        return trades
+
+    # Public API
+
+    def _refresh(self) -> None:
+        """
+        Picks up other processes' writes; the tables queue them through the
+        listeners. Called without the books' lock.
+        """
+        if self._attached:
+            repository.tickets.refresh()
+            repository.bids.refresh()
+
+    def submit_ticket(self, row: dict) -> List[Trade]:
+        """
+        Matches a new listing against resting bids; the rest of its quantity
+        rests as an ask.
+        """
+        self._refresh()
+        with self._lock:
+            self._apply_changes()
+            return self._submit(self._ticket_order(row))
+
+    def submit_bid(self, row: dict) -> List[Trade]:
+        """
+        Matches a new bid against resting asks; the rest of its quantity
+        rests as a bid.
+        """
+        self._refresh()
+        with self._lock:
+            self._apply_changes()
+            return self._submit(self._bid_order(row))
+
+    def reset_event(self, event_id: str) -> None:
+        """
+        Drops an event's books so they are rebuilt from the repository.
+        """
+        with self._lock:
+            for key in [key for key in self._books if key[0] == event_id]:
+                del self._books[key]
+            for key in [key for key, order in self._orders.items() if order.event_id == event_id]:
+                del self._orders[key]
+            self._event_groups.pop(event_id, None)
+
+    def depth(self, event_id: str, group_id: str, levels: int = ORDER_BOOK_DEPTH_LEVELS) -> Dict[str, Any]:
+        """
+        Aggregated bid and ask levels of a submarket, including bids open
+        to any group, with the best prices and the spread between them.
+        Unknown events and groups have empty depth; looking them up creates
+        no book.
+        """
+        known = repository.events.get(event_id) is not None
+        self._refresh()
+        with self._lock:
+            self._apply_changes()
+            if known:
+                self._ensure_event(event_id)
+            book = self._books.get((event_id, group_id))
+            any_group = self._books.get((event_id, None))
+            bid_levels: Dict[float, int] = {}
+            for source in (book, any_group):
+                for price, quantity in source.levels(BID, levels) if source is not None else []:
+                    bid_levels[price] = bid_levels.get(price, 0) + quantity
+            bids = sorted(bid_levels.items(), reverse=True)[:levels]
+            asks = book.levels(ASK, levels) if book is not None else []
+        best_bid = bids[0][0] if bids else None
+        best_ask = asks[0][0] if asks else None
+        return {
+            "event_id": event_id,
+            "group_id": group_id,
+            "bids": [{"price": price, "quantity": quantity} for price, quantity in bids],
+            "asks": [{"price": price, "quantity": quantity} for price, quantity in asks],
+            "best_bid": best_bid,
+            "best_ask": best_ask,
+            "spread": best_ask - best_bid if best_bid is not None and best_ask is not None else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "books": len(self._books),
+                "resting_orders": sum(1 for order in self._orders.values() if order.remaining > 0),
+                "pending_changes": len(self._changes),
+                "orders_submitted": self.orders_submitted,
+                "trades": self.trades,
+                "quantity_traded": self.quantity_traded,
+                "avg_match_microseconds": self.match_seconds / self.orders_submitted * 1e6 if self.orders_submitted else 0.0,
+                "max_match_microseconds": self.max_match_seconds * 1e6,
+            }
+
+
+market_books = MarketBooks()
+
+
+def _place(side: str, row: dict, trades: List[Trade]) -> List[dict]:
+    """
+    Commits a new order with the fills the books gave it. If a counterparty
+    changed after the books last saw it, the order is stored whole and the
+    event's books are rebuilt.
+    """
+    records = [dict(trade._asdict(), trade_id=str(uuid.uuid4()), executed_at=time.time()) for trade in trades]
+    filled = sum(trade.quantity for trade in trades)
+    amounts: Dict[str, int] = defaultdict(int)
+    if side == BID:
+        for trade in trades:
+            amounts[trade.ticket_id] += trade.quantity
+        placed = dict(row, num_tickets=(row.get("num_tickets") or 0) - filled)
+        settled = ticket_service.settle(dict(amounts), {}, new_bids=[placed], new_trades=records)
+    else:
+        for trade in trades:
+            amounts[trade.bid_id] += trade.quantity
+        placed = dict(row, quantity=(row.get("quantity") or 0) - filled)
+        settled = ticket_service.settle({}, dict(amounts), new_tickets=[placed], new_trades=records)
+    if settled is None:
+        market_books.reset_event(row["event_id"])
+        (repository.bids if side == BID else repository.tickets).put(row)
+        return []
+    row.update(placed)
+    return records
+
+
+def place_bid(row: dict) -> List[dict]:
+    """
+    Stores a new bid, first filling it from resting tickets it crosses;
+    row's num_tickets is reduced by what filled. Returns the trades made.
+    """
+    if not ORDER_BOOK_ENABLED:
+        buyer_service.append_bid(row)
+        return []
+    return _place(BID, row, market_books.submit_bid(row))
+
+
+def place_ticket(row: dict) -> List[dict]:
+    """
+    Stores a new listing, first filling resting bids it crosses; row's
+    quantity is reduced by what sold. Returns the trades made.
+    """
+    if not ORDER_BOOK_ENABLED:
+        repository.tickets.put(row)
+        return []
+    return _place(ASK, row, market_books.submit_ticket(row))
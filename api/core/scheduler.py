@@ -0,0 +1,220 @@
+"""
+Contains the scheduler that admits negotiations under per-model budgets.
+
+Instead of starting every negotiation of a submarket at once, jobs wait
+in a priority queue and are admitted while the model has a free
+concurrency slot and its token bucket has capacity. Pairs closest to
+agreement go first, and every job carries a deadline after which it is
+dropped from the queue or abandoned. Admission state is shared by every
+event loop in the process, and a slot is held until the negotiation's
+thread has really finished, even after its caller stopped waiting.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from api.services.rate_limit import get_bucket
+from configs import NEGOTIATION_MAX_CONCURRENCY, NEGOTIATION_MODEL, NEGOTIATION_TIMEOUT
+
+
+_QUEUED = "queued"
+_ADMITTED = "admitted"
+_CANCELLED = "cancelled"
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "deadline", "enqueued_at", "state", "loop", "admitted")
+
+    def __init__(self, priority: float, seq: int, deadline: float) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.state = _QUEUED
+        # Resolved from whichever thread frees a slot
+        self.loop = asyncio.get_running_loop()
+        self.admitted: asyncio.Future = self.loop.create_future()
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class NegotiationScheduler:
+    """
+    Priority- and deadline-aware admission control for negotiations that
+    share one model's rate limit.
+    """
+
+    def __init__(
+        self,
+        model: str = NEGOTIATION_MODEL,
+        max_concurrency: int = NEGOTIATION_MAX_CONCURRENCY,
+        timeout: float = NEGOTIATION_TIMEOUT,
+    ) -> None:
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._queue: List[_Job] = []
+        self._seq = itertools.count()
+        self._running = 0
+
+        self.submitted = 0
+        self.admitted = 0
+        self.completed = 0
+        self.expired = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def _admit(job: _Job) -> None:
+        if not job.admitted.done():
+            job.admitted.set_result(None)
+
+    def _dispatch(self) -> None:
+        """
+        Admits queued jobs into free slots. Called with the lock held.
+        """
+        while self._running < self.max_concurrency and self._queue:
+            job = heapq.heappop(self._queue)
+            if job.state != _QUEUED:
+                continue
+            job.state = _ADMITTED
+            self._running += 1
+            try:
+                job.loop.call_soon_threadsafe(self._admit, job)
+            except RuntimeError:
+                # Its loop is closed, so nobody will use the slot
+                job.state = _CANCELLED
+                self._running -= 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
+
+    def _call(self, fn: Callable[[float], Any], deadline: float) -> Any:
+        try:
+            return fn(deadline)
+        finally:
+            self._release()
+
+    async def run(
+        self,
+        fn: Callable[[float], Any],
+        priority: float = 0.0,
+        timeout: Optional[float] = None,
+    ) -> Optional[Any]:
+        """
+        Queues fn and runs it in the default executor once admitted. fn is
+        called with its absolute deadline (time.monotonic() based) so it can
+        stop early. Lower priority values are admitted first. Returns fn's
+        result, or None if the deadline passed first.
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        job = _Job(priority, next(self._seq), deadline)
+        with self._lock:
+            self.submitted += 1
+            heapq.heappush(self._queue, job)
+            self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(job.admitted), timeout=max(0.0, deadline - time.monotonic()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                queued = job.state == _QUEUED
+                job.state = _CANCELLED
+                if queued:
+                    self.expired += 1
+            if not queued:
+                # Admitted just as the wait ended; hand the slot on
+                self._release()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.logger.warning(f"Negotiation expired in queue after {time.monotonic() - job.enqueued_at:.2f}s")
+            return None
+
+        wait = time.monotonic() - job.enqueued_at
+        with self._lock:
+            self.admitted += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        started = False
+        try:
+            # Hold the slot until the model can take another request
+            delay = get_bucket(self.model).time_until_available()
+            if delay > 0:
+                await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+
+            # The thread releases the slot when it finishes, so a negotiation
+            # that outlives its deadline keeps counting against the cap
+            future = asyncio.get_running_loop().run_in_executor(None, self._call, fn, deadline)
+            started = True
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.timed_out += 1
+                self.logger.warning("Negotiation abandoned after missing its deadline")
+                return None
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                raise
+            with self._lock:
+                self.completed += 1
+            return result
+        finally:
+            if not started:
+                self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {
+                "model": self.model,
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": sum(1 for job in self._queue if job.state == _QUEUED),
+                "running": self._running,
+                "submitted": self.submitted,
+                "admitted": self.admitted,
+                "completed": self.completed,
+                "expired": self.expired,
+                "timed_out": self.timed_out,
+                "failed": self.failed,
+                "avg_wait_seconds": self.total_wait / self.admitted if self.admitted else 0.0,
+                "max_wait_seconds": self.max_wait,
+            }
+        return dict(counts, rate_limit=get_bucket(self.model).stats())
+
+
+_schedulers: Dict[str, NegotiationScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(model: str = NEGOTIATION_MODEL) -> NegotiationScheduler:
+    """
+    Returns the process-wide scheduler for model.
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(model)
+        if scheduler is None:
+            scheduler = NegotiationScheduler(model=model)
+            _schedulers[model] = scheduler
+        return scheduler
+
+
+def scheduler_stats() -> Dict[str, Dict[str, Any]]:
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {model: scheduler.stats() for model, scheduler in schedulers.items()}
@@ -4,36 +4,80 @@ Class for keeping track of a submarket context.
 
 from api.models.ticket import Ticket
 from api.models.bid import Bid
-from typing import List
+import uuid
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
 from api.models.event import Event
-from configs import TICKETS_JSON, BIDS_JSON
-import json
-import numpy as np
+from api.core.market_stats import GroupSummary, market_stats
+from api.services import repository
 
 class SubMarket:
     """
-    Represents a submarket within the larger marketplace.
+    Represents a submarket within the larger marketplace. Instances are
+    read-only snapshots, shared through api.core.submarket_registry.
     """
-    def __init__(self, event: Event, group_id: str) -> None:
+    def __init__(
+        self,
+        event: Event,
+        group_id: str,
+        strategy: Optional[str] = None,
+        tickets: Optional[Iterable[Ticket]] = None,
+        bids: Optional[Iterable[Bid]] = None,
+        snapshot_id: Optional[str] = None,
+        market_summary: Optional[Iterable[GroupSummary]] = None,
+    ) -> None:
         self.event = event
         self.event_id = event.event_id
         self.group_id = group_id
-        self.tickets = self._load_tickets()
-        self.bids = self._load_bids()
+        # Negotiation strategy name for every agent in this submarket, None to choose per sensitivity
+        self.strategy = strategy
+        self.snapshot_id = snapshot_id or uuid.uuid4().hex
+        self._snapshot: Optional[Dict[str, Any]] = None
+        # Per-group market stats; given when rebuilt from a snapshot, so a
+        # worker reports the stats of the process that took it
+        self._market_summary: Optional[Tuple[GroupSummary, ...]] = (
+            tuple(market_summary) if market_summary is not None else None
+        )
+        self.tickets: Tuple[Ticket, ...] = tuple(tickets if tickets is not None else self._load_tickets())
+        self.bids: Tuple[Bid, ...] = tuple(bids if bids is not None else self._load_bids())
+        self.tickets_by_id: Mapping[str, Ticket] = MappingProxyType({ticket.ticket_id: ticket for ticket in self.tickets})
+        self.bids_by_id: Mapping[str, Bid] = MappingProxyType({bid.bid_id: bid for bid in self.bids})
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        """
+        Plain-data copy of this submarket for other processes; see from_snapshot.
+        """
+        if self._snapshot is None:
+            self._snapshot = {
+                "snapshot_id": self.snapshot_id,
+                "event": self.event.model_dump(),
+                "group_id": self.group_id,
+                "strategy": self.strategy,
+                "tickets": [ticket.model_dump() for ticket in self.tickets],
+                "bids": [bid.model_dump() for bid in self.bids],
+                "market_summary": [group._asdict() for group in self.market_summary()],
+            }
+        return self._snapshot
+
+    @classmethod
+    def from_snapshot(cls, data: Dict[str, Any]) -> "SubMarket":
+        return cls(
+            Event(**data["event"]),
+            data["group_id"],
+            strategy=data["strategy"],
+            tickets=[Ticket(**ticket) for ticket in data["tickets"]],
+            bids=[Bid(**bid) for bid in data["bids"]],
+            snapshot_id=data["snapshot_id"],
+            market_summary=[GroupSummary(**group) for group in data["market_summary"]],
+        )
 
     def _load_tickets(self) -> List[Ticket]:
         """
         Loads tickets from json that match this submarket's criteria.
         """
-        with open(TICKETS_JSON, "r") as f:
-            all_tickets = json.load(f)
-        
-        # Filter tickets matching this submarket (event_id and group_id)
         matching_tickets = [
             Ticket(**ticket_data)
-            for ticket_data in all_tickets
-            if ticket_data["event_id"] == self.event_id
-            and ticket_data["group_id"] == self.group_id
+            for ticket_data in repository.find_submarket_tickets(self.event_id, self.group_id)
         ]
         
         return matching_tickets
@@ -45,55 +89,38 @@ class SubMarket:
         - event_id matches
         - allowed_groups is empty (accepts all groups) OR group_id is in allowed_groups
         """
-        with open(BIDS_JSON, "r") as f:
-            all_bids = json.load(f)
-        
-        # Filter bids matching this submarket
         matching_bids = [
             Bid(**bid_data)
-            for bid_data in all_bids
-            if bid_data["event_id"] == self.event_id
-            and (len(bid_data["allowed_groups"]) == 0 or self.group_id in bid_data["allowed_groups"])
+            for bid_data in repository.find_submarket_bids(self.event_id, self.group_id)
         ]
         
         return matching_bids
     
+    def market_summary(self) -> Tuple[GroupSummary, ...]:
+        """
+        Price statistics of every group of the event, read from market_stats
+        on first use unless the snapshot carried them.
+        """
+        if self._market_summary is None:
+            self._market_summary = tuple(market_stats.event_summary(self.event_id, self.event.get_group_ids()))
+        return self._market_summary
+
     def _summarize_market(self) -> str:
         """
         Generates a summary of the submarket state.
         """
+        def fmt(value):
+            return value if value is not None else "N/A"
 
-        ticket_prices = {}
-        bid_prices = {}
-        group_ids = self.event.get_group_ids()
-        for gid in group_ids:
-            ticket_prices[gid] = [
-                ticket.get_ticket_price()
-                for ticket in self.tickets
-                if ticket.get_group_id() == gid
-                for _ in range(ticket.quantity)
-            ]
-            bid_prices[gid] = [
-                bid.get_bid_price()
-                for bid in self.bids
-                if gid in bid.allowed_groups or len(bid.allowed_groups) == 0
-                for _ in range(bid.get_bid_quantity())
-            ]
-        
         lines = []
-        for gid in group_ids:
-            tickets = ticket_prices.get(gid)
-            bids = bid_prices.get(gid)
-            num_tick, num_bids = len(tickets), len(bids)
-            avg_tick = sum(tickets) / num_tick if num_tick > 0 else "N/A"
-            avg_bid = sum(bids) / num_bids if num_bids > 0 else "N/A"
-            median_tick = np.median(tickets) if num_tick > 0 else "N/A"
-            median_bid = np.median(bids) if num_bids > 0 else "N/A"
-            lines.append(f"Group ID: {gid} -> num_tickets: {num_tick} avg_ticket_price: {avg_tick} median_ticket_price: {median_tick} num_bids: {num_bids} avg_bid_price: {avg_bid} median_bid_price: {median_bid}")
-
-            summary = "\n".join(lines)
+        for group in self.market_summary():
+            lines.append(
+                f"Group ID: {group.group_id} -> num_tickets: {group.num_tickets} avg_ticket_price: {fmt(group.avg_ticket_price)} "
+                f"median_ticket_price: {fmt(group.median_ticket_price)} num_bids: {group.num_bids} "
+                f"avg_bid_price: {fmt(group.avg_bid_price)} median_bid_price: {fmt(group.median_bid_price)}"
+            )
 
-        return summary
+        return "\n".join(lines)
     
     def get_reference_values(self) -> dict[str, float]:
         """
@@ -0,0 +1,143 @@
+"""
+Contains the registry that shares SubMarket snapshots between negotiations.
+
+Building a SubMarket loads its tickets and bids, and every negotiation
+used to build and hold its own. The registry keeps one snapshot per
+(event_id, group_id, strategy) and hands the same object to every
+caller. Snapshots are never modified: when a ticket or bid of the
+submarket, or its event or venue, changes, the registry only marks it
+stale, and the next get() builds a fresh snapshot while negotiations
+already holding the old one keep a consistent view.
+"""
+
+import threading
+from typing import Dict, Optional, Tuple
+
+from api.core.sub_market import SubMarket
+from api.models.event import Event
+from api.services import repository
+
+Key = Tuple[str, str, Optional[str]]
+
+
+class SubMarketRegistry:
+    """
+    Hands out shared, immutable SubMarket snapshots, rebuilt copy-on-write.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._attach_lock = threading.Lock()
+        self._attached = False
+        # Change counters per (event_id, group_id), and per event for bids open to any group
+        self._group_versions: Dict[Tuple[str, str], int] = {}
+        self._event_versions: Dict[str, int] = {}
+        self._snapshots: Dict[Key, Tuple[Tuple[int, int], SubMarket]] = {}
+        self._events: Dict[str, Event] = {}
+
+        self.builds = 0
+        self.hits = 0
+
+    def _ensure_attached(self) -> None:
+        if self._attached:
+            return
+        with self._attach_lock:
+            if not self._attached:
+                repository.tickets.add_listener(self._on_ticket)
+                repository.bids.add_listener(self._on_bid)
+                repository.events.add_listener(self._on_event)
+                repository.venues.add_listener(self._on_venue)
+                self._attached = True
+
+    def _bump_group(self, event_id: str, group_id: str) -> None:
+        key = (event_id, group_id)
+        self._group_versions[key] = self._group_versions.get(key, 0) + 1
+
+    def _on_ticket(self, old_row: Optional[dict], new_row: Optional[dict]) -> None:
+        with self._lock:
+            for row in (old_row, new_row):
+                if row is not None:
+                    self._bump_group(row["event_id"], row["group_id"])
+
+    def _on_bid(self, old_row: Optional[dict], new_row: Optional[dict]) -> None:
+        with self._lock:
+            for row in (old_row, new_row):
+                if row is None:
+                    continue
+                groups = row.get("allowed_groups") or []
+                if not groups:
+                    self._event_versions[row["event_id"]] = self._event_versions.get(row["event_id"], 0) + 1
+                for group_id in groups:
+                    self._bump_group(row["event_id"], group_id)
+
+    def _bump_event(self, event_id: str) -> None:
+        # Reference values or venue details changed, so every group is stale
+        self._events.pop(event_id, None)
+        self._event_versions[event_id] = self._event_versions.get(event_id, 0) + 1
+
+    def _on_event(self, old_row: Optional[dict], new_row: Optional[dict]) -> None:
+        with self._lock:
+            for row in (old_row, new_row):
+                if row is not None:
+                    self._bump_event(row["event_id"])
+
+    def _on_venue(self, old_row: Optional[dict], new_row: Optional[dict]) -> None:
+        venue_ids = {row["venue_id"] for row in (old_row, new_row) if row is not None}
+        with self._lock:
+            for event_id in [event_id for event_id, event in self._events.items() if event.venue.venue_id in venue_ids]:
+                self._bump_event(event_id)
+
+    def _version(self, event_id: str, group_id: str) -> Tuple[int, int]:
+        return self._group_versions.get((event_id, group_id), 0), self._event_versions.get(event_id, 0)
+
+    def get(self, event_id: str, group_id: str, strategy: Optional[str] = None) -> SubMarket:
+        """
+        Returns the current snapshot of a submarket, building it if the
+        submarket changed since the last one.
+        """
+        self._ensure_attached()
+        repository.tickets.refresh()
+        repository.bids.refresh()
+        repository.events.refresh()
+        repository.venues.refresh()
+        key = (event_id, group_id, strategy)
+        with self._lock:
+            version = self._version(event_id, group_id)
+            cached = self._snapshots.get(key)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1]
+            event = self._events.get(event_id)
+
+        # Built outside the lock; a change meanwhile leaves the new snapshot
+        # under the old version, so the next get() builds again
+        if event is None:
+            event = Event.get_event_by_id(event_id)
+        submarket = SubMarket(event, group_id, strategy=strategy)
+        with self._lock:
+            if self._version(event_id, group_id) == version:
+                # Not cached if the event may have changed since it was read
+                self._events[event_id] = event
+            self._snapshots[key] = (version, submarket)
+            self.builds += 1
+        return submarket
+
+    def invalidate(self, event_id: Optional[str] = None) -> None:
+        """
+        Drops cached snapshots and event details, for one event or all.
+        """
+        with self._lock:
+            if event_id is None:
+                self._snapshots.clear()
+                self._events.clear()
+                return
+            for key in [key for key in self._snapshots if key[0] == event_id]:
+                del self._snapshots[key]
+            self._events.pop(event_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"snapshots": len(self._snapshots), "builds": self.builds, "hits": self.hits}
+
+
+submarket_registry = SubMarketRegistry()
@@ -0,0 +1,275 @@
+"""
+Contains the resolver that turns negotiated agreements into transactions.
+
+Negotiations run independently, so several bids can claim the same
+ticket's quantity and one bid can be filled by several tickets. The
+resolver treats a batch of agreements as a transportation problem: bids
+and tickets are nodes limited by their quantities, every agreement is an
+edge carrying up to its agreed quantity, and the allocation maximizing
+total weight (surplus by default) is found with a min-cost flow. The
+allocation is then committed to the ticket inventory and the bids in one
+atomic batch, so a filled bid stops resting in the order book.
+"""
+
+import heapq
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from api.services import repository, ticket_service
+from configs import RESOLVER_COMMIT_ATTEMPTS, RESOLVER_OBJECTIVE
+
+# (bid_id, ticket_id, price, quantity)
+Agreement = Tuple[str, str, float, int]
+
+# Per-ticket weight of an agreement given its bid and ticket rows
+WeightFn = Callable[[Agreement, dict, dict], float]
+
+_EPS = 1e-9
+
+
+def _surplus(agreement: Agreement, bid: dict, ticket: dict) -> float:
+    # Gains from trade: the buyer's and the seller's surplus together
+    return bid["max_price"] - ticket["min_price"]
+
+
+def _revenue(agreement: Agreement, bid: dict, ticket: dict) -> float:
+    return agreement[2]
+
+
+OBJECTIVES: Dict[str, WeightFn] = {"surplus": _surplus, "revenue": _revenue}
+
+
+def _min_cost_flow(num_bids: int, num_tickets: int, bid_caps: List[int], ticket_caps: List[int],
+                   edges: List[Tuple[int, int, int, float]]) -> List[int]:
+    """
+    Primal-dual min-cost flow. Edges are (bid, ticket, capacity, weight)
+    and weights are compared in whole cents. Each phase runs Dijkstra with
+    node potentials and then pushes a blocking flow through the edges of
+    zero reduced cost, i.e. along every shortest path at once. Stops once
+    the shortest path would decrease total weight; zero-weight agreements
+    are still filled, as they are when nothing competes. Returns the flow
+    on each edge.
+    """
+    source, sink = 0, 1
+    size = 2 + num_bids + num_tickets
+    to: List[int] = []
+    cap: List[int] = []
+    cost: List[int] = []
+    adjacency: List[List[int]] = [[] for _ in range(size)]
+
+    def add_edge(u: int, v: int, capacity: int, edge_cost: int) -> int:
+        adjacency[u].append(len(to))
+        to.append(v); cap.append(capacity); cost.append(edge_cost)
+        adjacency[v].append(len(to))
+        to.append(u); cap.append(0); cost.append(-edge_cost)
+        return len(to) - 2
+
+    for b in range(num_bids):
+        add_edge(source, 2 + b, bid_caps[b], 0)
+    edge_ids = [
+        add_edge(2 + b, 2 + num_bids + t, capacity, -round(weight * 100))
+        for b, t, capacity, weight in edges
+    ]
+    for t in range(num_tickets):
+        add_edge(2 + num_bids + t, sink, ticket_caps[t], 0)
+
+    # The initial graph is a DAG, so shortest distances give valid potentials
+    potential = [0] * size
+    for e in edge_ids:
+        t = to[e]
+        potential[t] = min(potential[t], cost[e])
+    potential[sink] = min((potential[2 + num_bids + t] for t in range(num_tickets)), default=0)
+
+    inf = float("inf")
+    while True:
+        dist = [inf] * size
+        dist[source] = 0
+        heap = [(0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if u == sink:
+                # Nodes settled later are no closer, and the potential update caps them at dist[sink]
+                break
+            pu = potential[u]
+            for e in adjacency[u]:
+                if cap[e] > 0:
+                    v = to[e]
+                    nd = d + cost[e] + pu - potential[v]
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        heapq.heappush(heap, (nd, v))
+        if dist[sink] == inf or dist[sink] + potential[sink] - potential[source] > 0:
+            break
+        limit = dist[sink]
+        for v in range(size):
+            potential[v] += min(dist[v], limit)
+
+        # Blocking flow over admissible (zero reduced cost) edges
+        pointer = [0] * size
+        while True:
+            path: List[int] = []
+            on_path = [False] * size
+            on_path[source] = True
+            u = source
+            while u != sink:
+                arcs = adjacency[u]
+                while pointer[u] < len(arcs):
+                    e = arcs[pointer[u]]
+                    v = to[e]
+                    if cap[e] > 0 and not on_path[v] and cost[e] + potential[u] - potential[v] == 0:
+                        break
+                    pointer[u] += 1
+                if pointer[u] == len(arcs):
+                    if u == source:
+                        break
+                    # Dead end: retreat and skip the arc that led here
+                    on_path[u] = False
+                    e = path.pop()
+                    u = to[e ^ 1]
+                    pointer[u] += 1
+                    continue
+                path.append(e)
+                u = to[e]
+                on_path[u] = True
+            if u != sink:
+                break
+            push = min(cap[e] for e in path)
+            for e in path:
+                cap[e] -= push
+                cap[e ^ 1] += push
+
+    return [cap[e ^ 1] for e in edge_ids]
+
+
+class TransactionResolver:
+    """
+    Allocates bid and ticket quantities across a batch of agreements and
+    commits the result.
+    """
+
+    def __init__(
+        self,
+        agreements: Iterable[Optional[Agreement]],
+        objective: str = RESOLVER_OBJECTIVE,
+        weight: Optional[WeightFn] = None,
+    ) -> None:
+        self.agreements: List[Agreement] = [a for a in agreements if a is not None and a[3] > 0]
+        if weight is None and objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective {objective!r}, expected one of {', '.join(OBJECTIVES)}")
+        self.weight = weight or OBJECTIVES[objective]
+        self.allocations: List[Agreement] = []
+        self.rejected: List[Agreement] = []
+
+        self.logger = logging.getLogger(__name__)
+        if not self.logger.handlers:
+            logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    @staticmethod
+    def _components(agreements: List[Agreement]) -> List[List[int]]:
+        """
+        Groups agreement indexes into independent sets that share no bid or ticket.
+        """
+        parent: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+        def find(node):
+            root = node
+            while parent.setdefault(root, root) != root:
+                root = parent[root]
+            while parent[node] != root:
+                parent[node], node = root, parent[node]
+            return root
+
+        for bid_id, ticket_id, _, _ in agreements:
+            a, b = find(("bid", bid_id)), find(("ticket", ticket_id))
+            if a != b:
+                parent[a] = b
+
+        groups: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        for i, (bid_id, _, _, _) in enumerate(agreements):
+            groups[find(("bid", bid_id))].append(i)
+        return list(groups.values())
+
+    def allocate(self) -> List[Agreement]:
+        """
+        Computes the allocation against current inventory. Returns the
+        agreements that go through, with quantities possibly reduced;
+        agreements left out entirely are kept in self.rejected.
+        """
+        bids: Dict[str, dict] = {}
+        tickets: Dict[str, dict] = {}
+        candidates: List[Tuple[Agreement, float]] = []
+        self.rejected = []
+        for agreement in self.agreements:
+            bid_id, ticket_id = agreement[0], agreement[1]
+            if bid_id not in bids:
+                bids[bid_id] = repository.bids.get(bid_id)
+            if ticket_id not in tickets:
+                tickets[ticket_id] = repository.tickets.get(ticket_id)
+            bid, ticket = bids[bid_id], tickets[ticket_id]
+            if bid is None or ticket is None:
+                self.rejected.append(agreement)
+                continue
+            weight = self.weight(agreement, bid, ticket)
+            if weight < 0:
+                self.rejected.append(agreement)
+                continue
+            candidates.append((agreement, weight))
+
+        allocations: List[Agreement] = []
+        for component in self._components([agreement for agreement, _ in candidates]):
+            items = [candidates[i] for i in component]
+            bid_index: Dict[str, int] = {}
+            ticket_index: Dict[str, int] = {}
+            for (bid_id, ticket_id, _, _), _ in items:
+                bid_index.setdefault(bid_id, len(bid_index))
+                ticket_index.setdefault(ticket_id, len(ticket_index))
+            bid_caps = [max(0, int(bids[b].get("num_tickets", 0))) for b in bid_index]
+            ticket_caps = [max(0, int(tickets[t].get("quantity", 0))) for t in ticket_index]
+            edges = [(bid_index[a[0]], ticket_index[a[1]], a[3], w) for a, w in items]
+
+            bid_demand = [0] * len(bid_caps)
+            ticket_demand = [0] * len(ticket_caps)
+            for b, t, capacity, _ in edges:
+                bid_demand[b] += capacity
+                ticket_demand[t] += capacity
+            if all(d <= c for d, c in zip(bid_demand, bid_caps)) and all(d <= c for d, c in zip(ticket_demand, ticket_caps)):
+                # No competing claims, every agreement fits as agreed
+                flows = [capacity for _, _, capacity, _ in edges]
+            else:
+                flows = _min_cost_flow(len(bid_caps), len(ticket_caps), bid_caps, ticket_caps, edges)
+
+            for (agreement, _), flow in zip(items, flows):
+                if flow > 0:
+                    allocations.append((agreement[0], agreement[1], agreement[2], flow))
+                else:
+                    self.rejected.append(agreement)
+
+        self.allocations = allocations
+        self.logger.info(f"Allocated {sum(a[3] for a in allocations)} tickets across {len(allocations)}/{len(self.agreements)} agreements")
+        return allocations
+
+    def process_transactions(self) -> Optional[List[Agreement]]:
+        """
+        Allocates and commits the batch by reducing ticket quantities and the
+        tickets their bids still want in one atomic update. If inventory changed in between, re-allocates and
+        retries. Returns the committed allocations, or None if it gave up.
+        """
+        for attempt in range(1, RESOLVER_COMMIT_ATTEMPTS + 1):
+            allocations = self.allocate()
+            amounts: Dict[str, int] = defaultdict(int)
+            bid_amounts: Dict[str, int] = defaultdict(int)
+            for bid_id, ticket_id, _, quantity in allocations:
+                amounts[ticket_id] += quantity
+                bid_amounts[bid_id] += quantity
+            if not amounts:
+                return []
+            if ticket_service.settle(dict(amounts), dict(bid_amounts)) is not None:
+                self.logger.info(f"Committed {len(allocations)} transactions")
+                return allocations
+            self.logger.warning(f"Inventory changed while committing (attempt {attempt}), re-allocating")
+
+        self.logger.error(f"Could not commit transactions after {RESOLVER_COMMIT_ATTEMPTS} attempts")
+        return None
@@ -0,0 +1,351 @@
+"""
+Contains the negotiation workers and the pool that feeds them.
+
+In worker mode a negotiation is shipped as a NegotiationJob (bid, ticket
+and a plain-data submarket snapshot) over a JobQueue to worker
+processes, which run the Negotiation and send back a JobResult. Local
+workers are started by WorkerPool itself; with a broker, workers on any
+node join by running
+
+    python -m api.core.workers worker --broker HOST:PORT
+
+and a broker is started with
+
+    python -m api.core.workers broker --port PORT
+
+Broker, workers and API processes need the same WORKER_BROKER_AUTHKEY.
+The broker listens on 127.0.0.1 unless --host says otherwise.
+
+Each worker process has its own LLM cache and batcher. Rate limits are
+shared: every process takes tokens from buckets hosted by the broker, or
+in process mode by a private broker the pool starts for that purpose.
+Live negotiation events travel back with the results, as RelayedEvents
+the pool republishes on this process's negotiation bus.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from api.core.event_bus import negotiation_bus
+from api.core.sub_market import SubMarket
+from api.models.bid import Bid
+from api.models.ticket import Ticket
+from api.services.job_queue import BrokerJobQueue, JobQueue, LocalJobQueue, serve_broker, start_broker
+from api.services.rate_limit import use_remote_buckets
+from configs import NEGOTIATION_WORKERS, WORKER_BROKER_ADDRESS, WORKER_PROCESSES, WORKER_SNAPSHOT_CACHE
+
+logger = logging.getLogger(__name__)
+
+_POLL_SECONDS = 0.5
+
+
+class NegotiationJob(NamedTuple):
+    job_id: str
+    reply_to: str
+    bid: Dict[str, Any]
+    ticket: Dict[str, Any]
+    submarket: Dict[str, Any]
+    # Seconds the worker has to finish, counted from when it picks the job up
+    timeout: Optional[float]
+
+
+class JobResult(NamedTuple):
+    job_id: str
+    agreement: Optional[Tuple[str, str, float, int]]
+    error: Optional[str]
+    worker: str
+    seconds: float
+
+
+class RelayedEvent(NamedTuple):
+    # A negotiation event published in a worker, sent on the result channel
+    job_id: str
+    topics: List[str]
+    event: Dict[str, Any]
+
+
+def run_job(job: NegotiationJob, submarkets: "OrderedDict[str, SubMarket]") -> JobResult:
+    """
+    Runs one negotiation, reusing submarkets already rebuilt by this worker.
+    """
+    # Imported here so the parent can load this module without the LLM stack
+    from api.core.agents.buyer_negotiator import BuyerNegotiator
+    from api.core.agents.seller_negotiator import SellerNegotiator
+    from api.core.negotiation import Negotiation
+
+    started = time.monotonic()
+    worker = f"{os.uname().nodename}:{os.getpid()}"
+    try:
+        snapshot_id = job.submarket["snapshot_id"]
+        submarket = submarkets.get(snapshot_id)
+        if submarket is None:
+            submarket = SubMarket.from_snapshot(job.submarket)
+            submarkets[snapshot_id] = submarket
+            if len(submarkets) > WORKER_SNAPSHOT_CACHE:
+                submarkets.popitem(last=False)
+        else:
+            submarkets.move_to_end(snapshot_id)
+
+        negotiation = Negotiation(
+            buyer_negotiator=BuyerNegotiator(bid=Bid(**job.bid), SubMarket=submarket),
+            seller_negotiator=SellerNegotiator(ticket=Ticket(**job.ticket), SubMarket=submarket),
+            submarket=submarket,
+            deadline=started + job.timeout if job.timeout is not None else None,
+        )
+        return JobResult(job.job_id, negotiation.simulate_negotiation(), None, worker, time.monotonic() - started)
+    except Exception as e:
+        logger.exception(f"Negotiation job {job.job_id} failed")
+        return JobResult(job.job_id, None, repr(e), worker, time.monotonic() - started)
+
+
+def _relay_to(job_queue: JobQueue, job: NegotiationJob):
+    def _relay(topics: List[str], event: Dict[str, Any]) -> None:
+        try:
+            job_queue.put_result(RelayedEvent(job.job_id, topics, event), job.reply_to)
+        except (EOFError, OSError) as e:
+            # Live events are best effort; the result still goes back
+            logger.warning(f"Could not relay a negotiation event of job {job.job_id}: {e!r}")
+    return _relay
+
+
+def run_worker(job_queue: JobQueue) -> None:
+    """
+    Takes jobs until it receives "stop".
+    """
+    submarkets: "OrderedDict[str, SubMarket]" = OrderedDict()
+    limiter = job_queue.rate_limiter()
+    if limiter is not None:
+        use_remote_buckets(limiter)
+    logger.info(f"Negotiation worker {os.getpid()} started")
+    while True:
+        job = job_queue.get_job(timeout=_POLL_SECONDS)
+        if job is None:
+            continue
+        if job == "stop":
+            break
+        negotiation_bus.set_relay(_relay_to(job_queue, job))
+        try:
+            result = run_job(job, submarkets)
+        finally:
+            negotiation_bus.set_relay(None)
+        job_queue.put_result(result, job.reply_to)
+    logger.info(f"Negotiation worker {os.getpid()} stopped")
+
+
+class WorkerPool:
+    """
+    Submits negotiations to workers and hands back their results.
+    """
+
+    def __init__(self, job_queue: JobQueue, processes: int = 0) -> None:
+        self.job_queue = job_queue
+        self.processes = processes
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        self._workers: List[multiprocessing.process.BaseProcess] = []
+        self._collector: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.events_relayed = 0
+        self.worker_seconds = 0.0
+        self.by_worker: Dict[str, int] = {}
+
+    def start(self) -> "WorkerPool":
+        """
+        Starts the result collector and the local worker processes.
+        """
+        with self._lock:
+            if self._collector is not None:
+                return self
+            context = multiprocessing.get_context("spawn")
+            for _ in range(self.processes):
+                process = context.Process(target=run_worker, args=(self.job_queue,), daemon=True)
+                process.start()
+                self._workers.append(process)
+            self._collector = threading.Thread(target=self._collect, name="negotiation-results", daemon=True)
+            self._collector.start()
+        return self
+
+    def _collect(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                result = self.job_queue.get_result(timeout=_POLL_SECONDS)
+            except (EOFError, OSError) as e:
+                if self._stopping.is_set():
+                    return
+                # The broker went away; pending callers run into their timeouts
+                logger.warning(f"Lost connection to the job queue: {e!r}")
+                time.sleep(_POLL_SECONDS)
+                continue
+            if result is None:
+                continue
+            if isinstance(result, RelayedEvent):
+                negotiation_bus.publish(result.topics, result.event)
+                with self._lock:
+                    self.events_relayed += 1
+                continue
+            with self._lock:
+                future = self._pending.pop(result.job_id, None)
+                self.worker_seconds += result.seconds
+                self.by_worker[result.worker] = self.by_worker.get(result.worker, 0) + 1
+                if result.error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            if future is None:
+                # Its caller already gave up
+                continue
+            if result.error is None:
+                future.set_result(result.agreement)
+            else:
+                future.set_exception(RuntimeError(f"Negotiation failed in worker {result.worker}: {result.error}"))
+
+    def submit(self, bid: Bid, ticket: Ticket, submarket: SubMarket, timeout: Optional[float] = None) -> Future:
+        return self._submit(bid, ticket, submarket, timeout)[1]
+
+    def _submit(self, bid: Bid, ticket: Ticket, submarket: SubMarket, timeout: Optional[float]) -> Tuple[str, Future]:
+        self.start()
+        job = NegotiationJob(
+            uuid.uuid4().hex, self.job_queue.client_id, bid.model_dump(), ticket.model_dump(),
+            submarket.to_snapshot(), timeout,
+        )
+        future: Future = Future()
+        with self._lock:
+            self._pending[job.job_id] = future
+            self.submitted += 1
+        self.job_queue.put_job(job)
+        return job.job_id, future
+
+    def negotiate(self, bid: Bid, ticket: Ticket, submarket: SubMarket, timeout: Optional[float] = None) -> Optional[Tuple[str, str, float, int]]:
+        """
+        Runs a negotiation on a worker and blocks for its agreement. Returns
+        None if no agreement was reached or the timeout passed first.
+        """
+        job_id, future = self._submit(bid, ticket, submarket, timeout)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(job_id, None)
+                self.timed_out += 1
+            return None
+
+    def stop(self) -> None:
+        self._stopping.set()
+        for _ in self._workers:
+            self.job_queue.put_job("stop")
+        for process in self._workers:
+            process.join(timeout=5)
+        self._workers = []
+        self.job_queue.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "local_processes": sum(1 for process in self._workers if process.is_alive()),
+                "submitted": self.submitted,
+                "pending": len(self._pending),
+                "completed": self.completed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "events_relayed": self.events_relayed,
+                "avg_worker_seconds": self.worker_seconds / (self.completed + self.failed) if self.completed + self.failed else 0.0,
+                "jobs_by_worker": dict(self.by_worker),
+            }
+
+
+_pool: Optional[WorkerPool] = None
+_pool_lock = threading.Lock()
+# Broker process hosting the shared rate limits in process mode
+_limiter_host: Optional[Any] = None
+
+
+def get_worker_pool() -> Optional[WorkerPool]:
+    """
+    Returns the process-wide pool for NEGOTIATION_WORKERS, or None when
+    negotiations run in this process's thread pool.
+    """
+    global _pool, _limiter_host
+    if NEGOTIATION_WORKERS == "thread":
+        return None
+    with _pool_lock:
+        if _pool is None:
+            if NEGOTIATION_WORKERS == "process":
+                # Reachable only from this machine with a key that never leaves this process tree
+                _limiter_host = start_broker(authkey=os.urandom(32))
+                job_queue: JobQueue = LocalJobQueue(limiter=_limiter_host.limiter())
+                _pool = WorkerPool(job_queue, processes=WORKER_PROCESSES)
+            elif NEGOTIATION_WORKERS == "broker":
+                job_queue = BrokerJobQueue(WORKER_BROKER_ADDRESS)
+                _pool = WorkerPool(job_queue)
+            else:
+                raise ValueError(f"Unknown NEGOTIATION_WORKERS {NEGOTIATION_WORKERS!r}, expected 'thread', 'process' or 'broker'")
+            # This process's own calls count against the same limits as the workers'
+            use_remote_buckets(job_queue.rate_limiter())
+        return _pool
+
+
+def stop_worker_pool() -> None:
+    """
+    Stops the process-wide pool, if any, and goes back to local rate limits.
+    """
+    global _pool, _limiter_host
+    with _pool_lock:
+        if _pool is None:
+            return
+        _pool.stop()
+        _pool = None
+        use_remote_buckets(None)
+        if _limiter_host is not None:
+            _limiter_host.shutdown()
+            _limiter_host = None
+
+
+def pool_stats() -> Optional[Dict[str, Any]]:
+    with _pool_lock:
+        return _pool.stats() if _pool is not None else None
+
+
+def _parse_address(value: str) -> Tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Negotiation broker and workers")
+    sub = parser.add_subparsers(dest="command", required=True)
+    broker_parser = sub.add_parser("broker", help="run a job broker")
+    # Anyone who can reach the broker with the authkey can run code on it
+    broker_parser.add_argument("--host", default="127.0.0.1")
+    broker_parser.add_argument("--port", type=int, default=WORKER_BROKER_ADDRESS[1])
+    worker_parser = sub.add_parser("worker", help="run workers taking jobs from a broker")
+    worker_parser.add_argument("--broker", default=f"{WORKER_BROKER_ADDRESS[0]}:{WORKER_BROKER_ADDRESS[1]}")
+    worker_parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    args = parser.parse_args()
+
+    if args.command == "broker":
+        serve_broker((args.host, args.port))
+    else:
+        broker = _parse_address(args.broker)
+        context = multiprocessing.get_context("spawn")
+        workers = [
+            context.Process(target=run_worker, args=(BrokerJobQueue(broker),))
+            for _ in range(args.processes)
+        ]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
@@ -6,15 +6,32 @@ and provides a basic root endpoint. It serves as the main bootstrap
 file for running the backend service.
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from dotenv import load_dotenv
 from api.routers import buyer
 from api.routers import ticket
+from api.routers import stats
+from api.routers import market
+from api.routers import negotiations
+from api.core.negotiation_jobs import job_runner
+from api.core.workers import stop_worker_pool
+from api.services import llm_transport
 from fastapi.middleware.cors import CORSMiddleware
 
 load_dotenv()
 
-app = FastAPI(title="Agentic Ticket Marketplace API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_runner.recover()
+    yield
+    job_runner.stop()
+    stop_worker_pool()
+    await llm_transport.aclose()
+
+
+app = FastAPI(title="Agentic Ticket Marketplace API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +43,9 @@ app.add_middleware(
 
 app.include_router(buyer.router)
 app.include_router(ticket.router)
+app.include_router(stats.router)
+app.include_router(market.router)
+app.include_router(negotiations.router)
 
 @app.get("/")
 def root():
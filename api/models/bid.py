@@ -3,8 +3,7 @@ Includes class for bid, representing a bid in the marketplace.
 """
 
 from pydantic import BaseModel
-from configs import BIDS_JSON
-import json
+from api.services import repository
 
 class Bid(BaseModel):
     bid_id: str
@@ -20,10 +19,7 @@ class Bid(BaseModel):
 
     @classmethod
     def get_bid_by_id(cls, bid_id: str):
-        # Implementation to load bid from JSON
-        with open(BIDS_JSON, "r") as f:
-            bids = json.load(f)
-        bid_data = next((b for b in bids if b["bid_id"] == bid_id), None)
+        bid_data = repository.bids.get(bid_id)
         if bid_data:
             return cls(**bid_data)
         else:
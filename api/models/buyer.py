@@ -4,8 +4,7 @@ Data model for a buyer in the ticket marketplace.
 
 from typing import Any, Dict, List, Union
 from pydantic import BaseModel
-from configs import BUYERS
-import json
+from api.services import repository
 
 class Buyer(BaseModel):
     buyer_id: str
@@ -13,12 +12,10 @@ class Buyer(BaseModel):
     
     @classmethod
     def get_buyer_by_id(cls, buyer_id: str) -> "Buyer":
-        with open(BUYERS, "r") as f:
-            buyers = json.load(f)
-        
-        buyer_data = next((b for b in buyers if b["buyer_id"] == buyer_id), None)
-        # TODO: Handle exception
-        return cls(buyer_id=buyer_data["buyer_id"], buyer_name=buyer_data["name"]) # type: ignore
+        buyer_data = repository.buyers.get(buyer_id)
+        if buyer_data is None:
+            raise ValueError(f"Buyer with id {buyer_id} not found")
+        return cls(buyer_id=buyer_data["buyer_id"], buyer_name=buyer_data["name"])
     
 
 class BuyerQuery(BaseModel):
@@ -5,8 +5,7 @@ Class managing for an event.
 from pydantic import BaseModel
 from pyparsing import Optional
 from api.models.venue import Venue
-import json
-from configs import EVENTS_JSON
+from api.services import repository
 
 
 class Event(BaseModel):
@@ -18,10 +17,9 @@ class Event(BaseModel):
 
     @classmethod
     def get_event_by_id(cls, event_id: str) -> "Event":
-        with open(EVENTS_JSON, "r") as f:
-            events = json.load(f)
-
-        event_data = next((e for e in events if e["event_id"] == event_id), None)
+        event_data = repository.events.get(event_id)
+        if event_data is None:
+            raise ValueError(f"Event with id {event_id} not found")
         # Load venue
         venue = Venue.get_venue_by_id(event_data["venue_id"])  # Assumes Venue has similar method
         
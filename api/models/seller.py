@@ -3,8 +3,7 @@ Data model for a seller in the ticket marketplace.
 """
 
 from pydantic import BaseModel
-from configs import SELLERS
-import json
+from api.services import repository
 
 
 class Seller(BaseModel):
@@ -13,10 +12,9 @@ class Seller(BaseModel):
 
     @classmethod
     def get_seller_by_id(cls, seller_id: str) -> "Seller":
-        with open(SELLERS, "r") as f:
-            sellers = json.load(f)
-
-        seller_data = next((s for s in sellers if s["seller_id"] == seller_id), None)
+        seller_data = repository.sellers.get(seller_id)
+        if seller_data is None:
+            raise ValueError(f"Seller with id {seller_id} not found")
 
         return cls(seller_id=seller_data["seller_id"], seller_name=seller_data["name"])
     
\ No newline at end of file
@@ -7,8 +7,7 @@ handling across the service and routing layers.
 """
 
 from pydantic import BaseModel
-from configs import TICKETS_JSON
-import json
+from api.services import repository
 
 class Ticket(BaseModel):
     ticket_id: str | None = None
@@ -24,10 +23,7 @@ class Ticket(BaseModel):
 
     @classmethod
     def get_ticket_by_id(cls, ticket_id: str):
-        # Implementation to load ticket from JSON
-        with open(TICKETS_JSON, "r") as f:
-            tickets = json.load(f)
-        ticket_data = next((t for t in tickets if t["ticket_id"] == ticket_id), None)
+        ticket_data = repository.tickets.get(ticket_id)
         if ticket_data:
             return cls(**ticket_data)
         else:
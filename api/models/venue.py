@@ -3,8 +3,7 @@ Represents a venue where events take place.
 """
 
 from pydantic import BaseModel
-import json
-from configs import VENUES_JSON
+from api.services import repository
 
 class Venue(BaseModel):
     venue_id: str
@@ -14,12 +13,10 @@ class Venue(BaseModel):
 
     @classmethod
     def get_venue_by_id(cls, venue_id: str) -> "Venue":
+        venue_data = repository.venues.get(venue_id)
+        if venue_data is None:
+            raise ValueError(f"Venue with id {venue_id} not found")
 
-        with open("api/data/venues.json", "r") as f:
-            venues = json.load(f)
-
-        venue_data = next((v for v in venues if v["venue_id"] == venue_id), None)
-        
         return cls(
             venue_id=venue_data["venue_id"],
             name=venue_data["name"],
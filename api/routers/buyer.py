@@ -1,18 +1,27 @@
+import asyncio
 import json
-from typing import List
+from typing import List, Optional
 import uuid
 from fastapi import APIRouter
-from api.core.market_negotiate import negotiate
+from api.core.event_bus import negotiation_bus
+from api.core.intent_parser import intent_parser
+from api.core.negotiation_jobs import COMPLETED, job_runner
+from api.core.matcher import match_tickets
+from api.core.order_book import place_bid
 from api.core.sub_market import SubMarket
 from api.models.buyer import BuyerQuery
 from api.models.event import Event
-from api.services.buyer_service import append_bid, write_search_results
-from api.services.event_service import get_event_by_id, get_events, get_venues
-from api.services.openrouter_client import call_openrouter
-from api.services.ticket_service import list_tickets
+from api.services.buyer_service import write_search_results
+from api.services.event_service import get_candidate_catalog, get_event_by_id
+from api.services.json_stream import IncrementalJSONParser
+from api.services.openrouter_client import call_openrouter_async, stream_openrouter_async
+from configs import INTENT_FAST_PATH_ENABLED, INTENT_STREAMING, NEGOTIATION_JOB_WAIT
 
 router = APIRouter(prefix="/buyer", tags=["buyer"])
 
+# Intent fields sent to the websocket client as soon as the model has written them
+PARTIAL_INTENT_FIELDS = ("extracted", "missing", "question")
+
 @router.post("/intent")
 async def get_buyer_intent(payload: BuyerQuery):
     """
@@ -74,14 +83,18 @@ async def get_buyer_intent(payload: BuyerQuery):
     if isinstance(payload.query, List) and len(payload.query) > 0:
         messages = payload.query
     else:
+        # Only the events the request points at, not the whole catalog
+        events, venues = get_candidate_catalog(str(payload.query))
         messages = [
             {"role": "system", "content": system_prompt},
-            {"role": "system", "content": f"Events data: {json.dumps(get_events())}"},
-            {"role": "system", "content": f"Venues data: {json.dumps(get_venues())}"},
+            {"role": "system", "content": f"Events data: {json.dumps(events)}"},
+            {"role": "system", "content": f"Venues data: {json.dumps(venues)}"},
             {"role": "user", "content": f"Buyer request: {payload.query}. Please extract the information"}
         ]
 
-    response = call_openrouter(messages).replace('```json', '').replace('```', '')
+    response = _fast_path_intent(payload.query)
+    if response is None:
+        response = (await call_openrouter_async(messages)).replace('```json', '').replace('```', '')
     missing = json.loads(response)["missing"]
     if len(missing) > 0:
         messages.append({"role": "assistant", "content": response})
@@ -91,18 +104,12 @@ async def get_buyer_intent(payload: BuyerQuery):
         bid = json.loads(response)["results"]
         bid["bid_id"] = str(uuid.uuid4())
         bid["buyer_id"] = str(uuid.uuid4())
-        append_bid(bid)
+        place_bid(bid)
         event = get_event_by_id(bid["event_id"])
-        messages.pop(0)
-        messages.append({"role": "user", "content": f"Bid parameters: {str(bid)}. Now the task has changed where you need to filter the tickets and return in the same list of JSON objects."})
-        messages.append({"role": "system", "content": f"Tickets data: {json.dumps(list_tickets())}"})
-        messages.append({"role": "system", "content": f"Find the list of tickets that match the criteria provided by the user. List the top 5 based on price and seat's group_id. The seat groups are prioritized base on this relationship: {event["reference_values"]}"})
-        messages.append({"role": "assistant", "content": "I'll now filter the available tickets and prove output in clean JSON format..."})
-        response = call_openrouter(messages).replace('```json', '').replace('```', '')
-        tickets = json.loads(response)
+        tickets = match_tickets(bid, event)
         search_results = [{"bid_id": bid["bid_id"], "ticket_id": t["ticket_id"]} for t in tickets]
         write_search_results(search_results)
-        messages.append({"role": "assistant", "content": response})
+        messages.append({"role": "assistant", "content": json.dumps(tickets)})
         return messages
 
 
@@ -177,10 +184,12 @@ async def ws_buyer_intent(websocket: WebSocket):
             payload.query.insert(0, {"role": "system", "content": system_prompt})
             messages = payload.query
         else:
+            # Only the events the request points at, not the whole catalog
+            events, venues = get_candidate_catalog(str(payload.query))
             messages = [
                 {"role": "system", "content": system_prompt},
-                {"role": "system", "content": f"Events data: {json.dumps(get_events())}"},
-                {"role": "system", "content": f"Venues data: {json.dumps(get_venues())}"},
+                {"role": "system", "content": f"Events data: {json.dumps(events)}"},
+                {"role": "system", "content": f"Venues data: {json.dumps(venues)}"},
                 {"role": "user", "content": f"Buyer request: {payload.query}. Please extract the information"}
             ]
 
@@ -190,10 +199,15 @@ async def ws_buyer_intent(websocket: WebSocket):
             "messages": messages
         }))
 
-        print("Calling OpenRouter...")
-
-        # 2) First LLM call
-        response = call_openrouter(messages).replace("```json", "").replace("```", "")
+        # 2) First LLM call, unless the request parses confidently without it
+        response = _fast_path_intent(payload.query)
+        if response is None:
+            print("Calling OpenRouter...")
+            if INTENT_STREAMING:
+                response = await _stream_intent(websocket, messages)
+            else:
+                response = await call_openrouter_async(messages)
+            response = response.replace("```json", "").replace("```", "")
 
         print("LLM response:", response[:1024])
 
@@ -211,8 +225,13 @@ async def ws_buyer_intent(websocket: WebSocket):
         bid = safe_json_loads(response)["results"]
         bid["bid_id"] = str(uuid.uuid4())
         bid["buyer_id"] = str(uuid.uuid4())
-        bid["event_id"] = 'event_001'
-        append_bid(bid)
+        trades = place_bid(bid)
+        if trades:
+            # Listings that already met the bid were bought outright
+            await websocket.send_text(json.dumps({
+                "phase": "instant_match",
+                "trades": trades
+            }))
 
         # 3) Filtering tickets
         messages.pop(0)
@@ -223,17 +242,7 @@ async def ws_buyer_intent(websocket: WebSocket):
         }))
 
         event = get_event_by_id(bid["event_id"])
-
-        messages.append({"role": "user", "content": f"Bid parameters: {str(bid)}. Now the task has changed where you need to filter the tickets and return in the same list of tickets JSON objects."})
-
-        messages.append({"role": "system", "content": f"Tickets data: {json.dumps(list_tickets())}"})
-        messages.append({"role": "system", "content": f"Seat priority: Find the list of tickets that match the criteria provided by the user. List the top 5 based on price and seat's group_id. The seat groups are prioritized base on this relationship: {event['reference_values']}"})
-        messages.append({"role": "system", "content": f"Rules: - Only respond in the given JSON format. - Don't show reasoning"})
-        messages.append({"role": "assistant", "content": "I'll now filter the available tickets and prove output in clean JSON format..."})
-        messages.append({"role": "assistant", "content": "Filtering tickets..."})
-
-        response = call_openrouter(messages).replace("```json", "").replace("```", "")
-        tickets = safe_json_loads(response)
+        tickets = match_tickets(bid, event)
 
         search_results = [{"bid_id": bid["bid_id"], "ticket_id": t["ticket_id"]} for t in tickets]
         write_search_results(search_results)
@@ -243,54 +252,133 @@ async def ws_buyer_intent(websocket: WebSocket):
             "tickets": tickets
         }))
 
-        await websocket.send_text(json.dumps({
-            "phase": "final_transaction_start",
-            "best_order": {
-                "status": "In progress",
-                "message": "Negotiating..."
-            }
-        }))
-
+        # Subscribe first so the opening offers are not missed
+        events = negotiation_bus.subscribe([f"bid:{bid['bid_id']}"])
         try:
-            results = await negotiate()
-        except:
-            pass
+            # Negotiation runs as a background job, so it outlives this connection
+            job = job_runner.submit(
+                pairs=[(r["bid_id"], r["ticket_id"]) for r in search_results],
+                event_ids=[bid["event_id"]],
+            )
+            await websocket.send_text(json.dumps({
+                "phase": "final_transaction_start",
+                "job_id": job["job_id"],
+                "best_order": {
+                    "status": "In progress",
+                    "message": "Negotiating..."
+                }
+            }))
 
-        await websocket.send_text(json.dumps({
-            "phase": "final_transaction",
-            "best_order": {
+            forwarder = asyncio.create_task(_forward_negotiation_events(websocket, events))
+            waiter = asyncio.create_task(job_runner.wait(job["job_id"], timeout=NEGOTIATION_JOB_WAIT))
+            disconnect = asyncio.create_task(_wait_disconnect(websocket))
+            try:
+                await asyncio.wait({waiter, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                # Ends the forwarder once it has sent what is still buffered
+                events.close()
+                disconnect.cancel()
+                abandoned = not waiter.done()
+                if abandoned:
+                    # Only the wait ends; the job keeps running and its results stay at /negotiations/{job_id}
+                    waiter.cancel()
+                    forwarder.cancel()
+            if abandoned:
+                print("Client disconnected during negotiation")
+                return
+            job = waiter.result()
+            await forwarder
+        finally:
+            events.close()
+        committed = [
+            agreement
+            for result in job["results"] if result["type"] == "event"
+            for agreement in result["committed"] or []
+        ]
+        deal = next((a for a in committed if a[0] == bid["bid_id"]), None)
+
+        if job["status"] != COMPLETED:
+            best_order = {
+                "status": "pending" if job["status"] in ("queued", "running") else "failed",
+                "message": f"Negotiation {job['status']}, see /negotiations/{job['job_id']}"
+            }
+        elif deal is None:
+            best_order = {
                 "status": "failed",
                 "message": "failed to reach a deal."
             }
+        else:
+            best_order = {
+                "status": "success",
+                "message": {
+                    "ticket_id": deal[1],
+                    "price": str(deal[2]),
+                    "quantity": deal[3]
+                }
+            }
+        await websocket.send_text(json.dumps({
+            "phase": "final_transaction",
+            "job_id": job["job_id"],
+            "best_order": best_order
         }))
 
-        # if not results[0]:
-        #     await websocket.send_text(json.dumps({
-        #         "phase": "final_transaction",
-        #         "best_order": {
-        #             "status": "failed",
-        #             "message": "failed to reach a deal."
-        #         }
-        #     }))
-        # else:
-        #     
-        #     await websocket.send_text(json.dumps({
-        #         "phase": "final_transaction",
-        #         "best_order": {
-        #             "status": "failed",
-        #             "message": {
-        #                 "ticket_id": results[0]["ticket_id"],
-        #                 "price": str(results[0]["price"])
-        #             }
-        #         }}
-        #     }))
-
         await websocket.close()
 
     except WebSocketDisconnect:
         print("Client disconnected")
 
 
+def _fast_path_intent(query) -> Optional[str]:
+    """
+    The intent response built by the rule-based parser for a first-turn
+    request, or None when the request needs the LLM.
+    """
+    if not INTENT_FAST_PATH_ENABLED or not isinstance(query, str):
+        return None
+    parsed = intent_parser.try_parse(query)
+    return json.dumps(parsed) if parsed is not None else None
+
+
+async def _stream_intent(websocket: WebSocket, messages) -> str:
+    """
+    Streams the intent completion, sending each of PARTIAL_INTENT_FIELDS to
+    the client as soon as it is complete. Returns the whole completion.
+    """
+    parser = IncrementalJSONParser()
+    async for chunk in stream_openrouter_async(messages):
+        for field, value in parser.feed(chunk):
+            if field in PARTIAL_INTENT_FIELDS:
+                await websocket.send_text(json.dumps({
+                    "phase": "partial_extraction",
+                    "field": field,
+                    "value": value
+                }))
+    return parser.text
+
+
+async def _wait_disconnect(websocket: WebSocket) -> None:
+    """
+    Returns once the client disconnects. The client sends nothing while a
+    negotiation runs, so anything else it sends is ignored.
+    """
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+
+async def _forward_negotiation_events(websocket: WebSocket, events):
+    """
+    Sends live negotiation events as they arrive. A slow client only slows
+    this task; the bus drops stale offers for it instead of queueing them.
+    """
+    async for event in events:
+        await websocket.send_text(json.dumps({
+            "phase": "negotiation_event",
+            "event": event
+        }))
+
+
 import json  # if allowed, or write a simple fixer
 
 def safe_json_loads(s: str):
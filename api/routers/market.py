@@ -0,0 +1,31 @@
+"""
+Defines the API routes exposing the order books.
+
+These endpoints report the resting bids and asks of a submarket, its
+best prices and spread, so the frontend can show market depth, along
+with seat-weighted price statistics per group of an event.
+"""
+
+from fastapi import APIRouter, HTTPException, Query
+from api.core.market_stats import market_stats
+from api.core.order_book import market_books
+from api.services import repository
+from configs import ORDER_BOOK_DEPTH_LEVELS
+
+router = APIRouter(prefix="/market", tags=["market"])
+
+@router.get("/{event_id}/{group_id}/depth")
+def get_depth(event_id: str, group_id: str, levels: int = Query(ORDER_BOOK_DEPTH_LEVELS, ge=1)):
+    return market_books.depth(event_id, group_id, levels)
+
+@router.get("/{event_id}/{group_id}/spread")
+def get_spread(event_id: str, group_id: str):
+    depth = market_books.depth(event_id, group_id, 1)
+    return {key: depth[key] for key in ("event_id", "group_id", "best_bid", "best_ask", "spread")}
+
+@router.get("/{event_id}/summary")
+def get_summary(event_id: str):
+    event = repository.events.get(event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return [group._asdict() for group in market_stats.event_summary(event_id, list(event["reference_values"]))]
@@ -0,0 +1,46 @@
+"""
+Defines the API routes for background negotiation jobs.
+
+Starting a negotiation returns a job id immediately; the job runs in the
+background and its status and streamed results are read back by id.
+"""
+
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, field_validator
+from api.core.agents.strategies import check_strategy
+from api.core.negotiation_jobs import job_runner
+from api.services import repository
+
+router = APIRouter(prefix="/negotiations", tags=["negotiations"])
+
+
+class NegotiationRequest(BaseModel):
+    # (bid_id, ticket_id) pairs; the stored search results when omitted
+    pairs: Optional[List[Tuple[str, str]]] = None
+    event_ids: Optional[List[str]] = None
+    strategy: Optional[str] = None
+
+    @field_validator("strategy")
+    @classmethod
+    def known_strategy(cls, value: Optional[str]) -> Optional[str]:
+        # Rejected with a 422 here rather than failing inside the job
+        return check_strategy(value)
+
+
+@router.post("/", status_code=202)
+def start_negotiation(request: NegotiationRequest):
+    job = job_runner.submit(request.pairs, request.event_ids, request.strategy)
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+@router.get("/")
+def list_negotiations(status: Optional[str] = None):
+    jobs = repository.negotiation_jobs.find("status", status) if status else repository.negotiation_jobs.all()
+    return [{key: job[key] for key in ("job_id", "status", "created_at", "finished_at")} for job in jobs]
+
+@router.get("/{job_id}")
+def get_negotiation(job_id: str):
+    job = job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Negotiation job not found")
+    return job
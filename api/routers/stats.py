@@ -0,0 +1,80 @@
+"""
+Defines read-only API routes exposing runtime counters.
+
+These endpoints report the internal state of the LLM and negotiation
+machinery (caches, schedulers) for monitoring and load testing.
+"""
+
+from fastapi import APIRouter
+from api.core.agents.history import history_stats
+from api.core.agents.offer_protocol import parse_stats
+from api.core.catalog_index import catalog_index
+from api.core.event_bus import negotiation_bus
+from api.core.intent_parser import intent_parser
+from api.core.matcher import matcher_cache
+from api.core.order_book import market_books
+from api.core.orchestrator import run_totals
+from api.core.scheduler import scheduler_stats
+from api.core.submarket_registry import submarket_registry
+from api.core.workers import pool_stats
+from api.services.llm_batch import batcher_stats
+from api.services.llm_cache import llm_cache
+from api.services.rate_limit import bucket_stats
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+@router.get("/llm-cache")
+def get_llm_cache_stats():
+    return llm_cache.stats()
+
+@router.get("/llm-batch")
+def get_llm_batch_stats():
+    return batcher_stats()
+
+@router.get("/prompt-history")
+def get_prompt_history_stats():
+    return history_stats.stats()
+
+@router.get("/offer-parsing")
+def get_offer_parsing_stats():
+    return parse_stats.stats()
+
+@router.get("/scheduler")
+def get_scheduler_stats():
+    return scheduler_stats()
+
+@router.get("/rate-limits")
+def get_rate_limit_stats():
+    return bucket_stats()
+
+@router.get("/order-book")
+def get_order_book_stats():
+    return market_books.stats()
+
+@router.get("/submarkets")
+def get_submarket_stats():
+    return submarket_registry.stats()
+
+@router.get("/orchestrator")
+def get_orchestrator_stats():
+    return run_totals.stats()
+
+@router.get("/workers")
+def get_worker_stats():
+    return pool_stats()
+
+@router.get("/event-bus")
+def get_event_bus_stats():
+    return negotiation_bus.stats()
+
+@router.get("/catalog-index")
+def get_catalog_index_stats():
+    return catalog_index.stats()
+
+@router.get("/intent-parser")
+def get_intent_parser_stats():
+    return intent_parser.stats()
+
+@router.get("/matcher")
+def get_matcher_stats():
+    return matcher_cache.stats()
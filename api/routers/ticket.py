@@ -7,8 +7,9 @@ operations and returns structured responses to clients.
 """
 
 from fastapi import APIRouter, HTTPException
+from api.core.order_book import place_ticket
 from api.models.ticket import Ticket
-from api.services.ticket_service import delete_ticket, list_tickets, create_ticket
+from api.services.ticket_service import delete_ticket, list_tickets, new_ticket
 
 router = APIRouter(prefix="/ticket", tags=["ticket"])
 
@@ -18,7 +19,10 @@ def get_tickets():
 
 @router.post("/create")
 def post_ticket(ticket: Ticket):
-    return create_ticket(ticket)
+    # Bids the listing crosses are filled right away, the rest is listed
+    ticket_dict = new_ticket(ticket)
+    trades = place_ticket(ticket_dict)
+    return dict(ticket_dict, trades=trades)
 
 @router.delete("/{ticket_id}")
 def remove_ticket(ticket_id: str):
@@ -1,32 +1,22 @@
-import json
-from typing import Optional
-import uuid
-from pathlib import Path
+from api.core.catalog_index import catalog_index
+from api.services import repository
 
-from api.models.event import Event
-
-
-EVENT_PATH = Path(__file__).parents[1] / 'data' / 'events.json'
-VENUE_PATH = Path(__file__).parents[1] / 'data' / 'venues.json'
-
-def load_json(path: Path):
-    data = {}
-    with open(path, 'r') as f:
-        data = json.load(f)
-    return data
 
 def get_events():
-    return load_json(EVENT_PATH)
+    return repository.events.all()
 
 def get_venues():
-    return load_json(VENUE_PATH)
+    return repository.venues.all()
 
-def get_event_by_id(id: str):
-    with open(EVENT_PATH, "r") as f:
-        events = json.load(f)
-
-    for event in events:
-        if event.get("event_id") == id:
-            return event
+def get_candidate_catalog(text: str):
+    """
+    Returns the events the buyer's text most likely refers to, and their
+    venues, for the intent prompt.
+    """
+    return catalog_index.candidates(text)
 
-    raise ValueError(f"Event with id {id} not found")
\ No newline at end of file
+def get_event_by_id(id: str):
+    event = repository.events.get(id)
+    if event is None:
+        raise ValueError(f"Event with id {id} not found")
+    return event
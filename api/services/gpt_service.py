@@ -1,16 +1,44 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
 import os
 
+from api.services.llm_batch import get_batcher
+from api.services.llm_cache import cached_call, cached_call_async, discard_cached
+from api.services.llm_transport import get_async_client, get_sync_client
+from api.services.rate_limit import get_bucket
+from configs import LLM_BATCH_ENABLED, LLM_MAX_RETRIES
+
 load_dotenv()
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 
 client = OpenAI(
-  base_url="https://openrouter.ai/api/v1",
+  base_url=OPENROUTER_BASE_URL,
   api_key=OPENROUTER_API_KEY,
+  http_client=get_sync_client(OPENROUTER_BASE_URL),
+  max_retries=LLM_MAX_RETRIES,
 )
 
-def call_gpt(messages, model="openai/gpt-5-nano"):
+_async_clients = {}
+
+def _get_async_client() -> AsyncOpenAI:
+    # AsyncOpenAI wraps a loop-bound httpx client, so keep one per pooled client
+    http_client = get_async_client(OPENROUTER_BASE_URL)
+    async_client = _async_clients.get(id(http_client))
+    if async_client is None:
+        async_client = AsyncOpenAI(
+          base_url=OPENROUTER_BASE_URL,
+          api_key=OPENROUTER_API_KEY,
+          http_client=http_client,
+          max_retries=LLM_MAX_RETRIES,
+        )
+        _async_clients.clear()
+        _async_clients[id(http_client)] = async_client
+    return async_client
+
+def _call_gpt(messages, model, response_format=None):
+    get_bucket(model).acquire()
+    extra = {"response_format": response_format} if response_format else {}
     completion = client.chat.completions.create(
       model=model,
       messages=[
@@ -18,6 +46,48 @@ def call_gpt(messages, model="openai/gpt-5-nano"):
           "role": "user",
           "content": messages
         }
-      ]
+      ],
+      **extra
+    )
+    return completion.choices[0].message.content
+
+async def _call_gpt_async(messages, model, response_format=None):
+    await get_bucket(model).acquire_async()
+    extra = {"response_format": response_format} if response_format else {}
+    completion = await _get_async_client().chat.completions.create(
+      model=model,
+      messages=[
+        {
+          "role": "user",
+          "content": messages
+        }
+      ],
+      **extra
+    )
+    return completion.choices[0].message.content
+
+def _cache_params(response_format):
+    return {"response_format": response_format} if response_format else None
+
+def call_gpt(messages, model="openai/gpt-5-nano", response_format=None, batch_key=None):
+    """
+    response_format, e.g. a json_schema spec, requests structured output.
+    Prompts given the same batch_key may share one packed request; prompts
+    without one are always sent alone.
+    """
+    params = _cache_params(response_format)
+    if LLM_BATCH_ENABLED and batch_key is not None and isinstance(messages, str):
+        batcher = get_batcher(model, _call_gpt, response_format)
+        return cached_call(model, messages, params, lambda: batcher.submit(messages, batch_key))
+    return cached_call(model, messages, params, lambda: _call_gpt(messages, model, response_format))
+
+async def call_gpt_async(messages, model="openai/gpt-5-nano", response_format=None):
+    return await cached_call_async(
+      model, messages, _cache_params(response_format), lambda: _call_gpt_async(messages, model, response_format)
     )
-    return completion.choices[0].message.content
\ No newline at end of file
+
+def forget_gpt_response(messages, model="openai/gpt-5-nano", response_format=None):
+    """
+    Drops a cached completion, e.g. one that turned out to be unusable.
+    """
+    discard_cached(model, messages, _cache_params(response_format))
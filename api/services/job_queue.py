@@ -0,0 +1,304 @@
+"""
+Job queues connecting the API process to negotiation workers.
+
+A JobQueue carries jobs to workers and results back to the process that
+submitted them. LocalJobQueue uses multiprocessing queues for worker
+processes on this machine. BrokerJobQueue talks to a broker process over
+TCP (a multiprocessing manager), so workers on other nodes can take jobs
+too; every client gets its own result queue on the broker, so several
+API processes can share one broker. A client's queue is dropped when it
+closes or stops polling for WORKER_BROKER_CLIENT_TTL seconds. The broker
+also hosts the LLM rate limit buckets every process shares.
+start_broker() runs a broker locally, which is also the stand-in used
+for testing.
+
+A manager unpickles whatever its clients send, so anyone holding the
+authkey can run code on the broker and the workers. The key comes from
+WORKER_BROKER_AUTHKEY and has no default; keep the broker off public
+interfaces.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, Optional, Tuple
+
+from api.services.rate_limit import BucketHost
+from configs import WORKER_BROKER_CLIENT_TTL
+
+Address = Tuple[str, int]
+
+
+def broker_authkey() -> bytes:
+    """
+    The shared secret between broker, workers and API processes.
+    """
+    authkey = os.getenv("WORKER_BROKER_AUTHKEY")
+    if not authkey:
+        raise RuntimeError("WORKER_BROKER_AUTHKEY must be set to use the negotiation broker")
+    return authkey.encode()
+
+
+class JobQueue:
+    """
+    Interface of a job queue. Jobs and results must be picklable.
+    """
+
+    client_id: str = ""
+
+    def put_job(self, job: Any) -> None:
+        raise NotImplementedError
+
+    def get_job(self, timeout: Optional[float] = None) -> Any:
+        """
+        Returns the next job, or None if none arrived within timeout.
+        """
+        raise NotImplementedError
+
+    def put_result(self, result: Any, reply_to: str) -> None:
+        raise NotImplementedError
+
+    def get_result(self, timeout: Optional[float] = None) -> Any:
+        """
+        Returns the next result for this client, or None if none arrived
+        within timeout.
+        """
+        raise NotImplementedError
+
+    def rate_limiter(self) -> Optional[Any]:
+        """
+        The BucketHost (or proxy of one) processes using this queue share,
+        if any.
+        """
+        return None
+
+    def close(self) -> None:
+        return None
+
+
+class LocalJobQueue(JobQueue):
+    """
+    Queues shared with worker processes started from this process.
+    """
+
+    def __init__(self, context: Optional[Any] = None, limiter: Optional[Any] = None) -> None:
+        context = context or multiprocessing.get_context("spawn")
+        self.client_id = "local"
+        self._jobs = context.Queue()
+        self._results = context.Queue()
+        self._limiter = limiter
+
+    def put_job(self, job: Any) -> None:
+        self._jobs.put(job)
+
+    def get_job(self, timeout: Optional[float] = None) -> Any:
+        try:
+            return self._jobs.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put_result(self, result: Any, reply_to: str) -> None:
+        self._results.put(result)
+
+    def get_result(self, timeout: Optional[float] = None) -> Any:
+        try:
+            return self._results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def rate_limiter(self) -> Optional[Any]:
+        return self._limiter
+
+
+# Broker side: the queues live in the broker process
+
+class _ResultBoxes:
+    """
+    Result queues per client, dropped when the client closes or goes quiet.
+    """
+
+    def __init__(self, ttl: float = WORKER_BROKER_CLIENT_TTL) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # client_id -> (queue, last time the client was heard from)
+        self._boxes: Dict[str, Tuple["queue.Queue[Any]", float]] = {}
+        self._swept = time.monotonic()
+
+    def _sweep(self, now: float) -> None:
+        if now - self._swept < self.ttl / 4:
+            return
+        self._swept = now
+        for client_id in [c for c, (_, seen) in self._boxes.items() if now - seen > self.ttl]:
+            del self._boxes[client_id]
+
+    def box(self, client_id: str) -> "queue.Queue[Any]":
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            box = self._boxes[client_id][0] if client_id in self._boxes else queue.Queue()
+            self._boxes[client_id] = (box, now)
+            return box
+
+    def touch(self, client_id: str) -> bool:
+        """
+        Marks the client as alive; False if its queue was already dropped.
+        """
+        with self._lock:
+            if client_id not in self._boxes:
+                return False
+            self._boxes[client_id] = (self._boxes[client_id][0], time.monotonic())
+            return True
+
+    def deliver(self, client_id: str, result: Any) -> bool:
+        """
+        Queues a result for its client; results for clients that are gone
+        are dropped.
+        """
+        with self._lock:
+            self._sweep(time.monotonic())
+            entry = self._boxes.get(client_id)
+        if entry is None:
+            return False
+        entry[0].put(result)
+        return True
+
+    def drop(self, client_id: str) -> None:
+        with self._lock:
+            self._boxes.pop(client_id, None)
+
+
+_broker_jobs: "queue.Queue[Any]" = queue.Queue()
+_broker_boxes = _ResultBoxes()
+_bucket_host = BucketHost()
+
+
+def _jobs() -> "queue.Queue[Any]":
+    return _broker_jobs
+
+
+def _results(client_id: str) -> "queue.Queue[Any]":
+    return _broker_boxes.box(client_id)
+
+
+def _boxes() -> _ResultBoxes:
+    return _broker_boxes
+
+
+def _limiter() -> BucketHost:
+    return _bucket_host
+
+
+class _BrokerServer(BaseManager):
+    pass
+
+
+_BrokerServer.register("jobs", callable=_jobs)
+_BrokerServer.register("results", callable=_results)
+_BrokerServer.register("boxes", callable=_boxes)
+_BrokerServer.register("limiter", callable=_limiter)
+
+
+class _BrokerClient(BaseManager):
+    pass
+
+
+_BrokerClient.register("jobs")
+_BrokerClient.register("results")
+_BrokerClient.register("boxes")
+_BrokerClient.register("limiter")
+
+
+def start_broker(address: Address = ("127.0.0.1", 0), authkey: Optional[bytes] = None) -> BaseManager:
+    """
+    Starts a broker in a child process and returns its manager; the bound
+    address is manager.address. Call manager.shutdown() to stop it.
+    """
+    manager = _BrokerServer(address=address, authkey=authkey or broker_authkey(), ctx=multiprocessing.get_context("spawn"))
+    manager.start()
+    return manager
+
+
+def serve_broker(address: Address, authkey: Optional[bytes] = None) -> None:
+    """
+    Runs a broker in this process until it is killed.
+    """
+    _BrokerServer(address=address, authkey=authkey or broker_authkey()).get_server().serve_forever()
+
+
+class BrokerJobQueue(JobQueue):
+    """
+    Client of a broker. Pickles to its address, so worker processes
+    reconnect on their own when handed one.
+    """
+
+    def __init__(self, address: Address, authkey: Optional[bytes] = None, client_id: Optional[str] = None) -> None:
+        self.address = tuple(address)
+        self.authkey = authkey or broker_authkey()
+        self.client_id = client_id or uuid.uuid4().hex
+        self._connect()
+
+    def _connect(self) -> None:
+        manager = _BrokerClient(address=self.address, authkey=self.authkey)
+        manager.connect()
+        self._manager = manager
+        self._jobs = manager.jobs()
+        self._boxes = manager.boxes()
+        # Opened on first use by a submitter, so workers hold no queue of their own
+        self._results: Optional[Any] = None
+        self._touched = 0.0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"address": self.address, "authkey": self.authkey, "client_id": self.client_id}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.address = state["address"]
+        self.authkey = state["authkey"]
+        self.client_id = state["client_id"]
+        self._connect()
+
+    def _open_results(self) -> None:
+        if self._results is None:
+            self._results = self._manager.results(self.client_id)
+            self._touched = time.monotonic()
+
+    def put_job(self, job: Any) -> None:
+        # Results for a client without a queue are dropped, so open it first
+        self._open_results()
+        self._jobs.put(job)
+
+    def get_job(self, timeout: Optional[float] = None) -> Any:
+        try:
+            return self._jobs.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put_result(self, result: Any, reply_to: str) -> None:
+        self._boxes.deliver(reply_to, result)
+
+    def get_result(self, timeout: Optional[float] = None) -> Any:
+        now = time.monotonic()
+        if self._results is None:
+            self._open_results()
+        elif now - self._touched > WORKER_BROKER_CLIENT_TTL / 4:
+            self._touched = now
+            if not self._boxes.touch(self.client_id):
+                # Dropped while this client was quiet; results sent meanwhile are lost
+                self._results = self._manager.results(self.client_id)
+        try:
+            return self._results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def rate_limiter(self) -> Optional[Any]:
+        return self._manager.limiter()
+
+    def close(self) -> None:
+        """
+        Drops this client's result queue on the broker.
+        """
+        self._boxes.drop(self.client_id)
+        self._results = None
@@ -0,0 +1,259 @@
+"""
+Append-only journaled storage for the frequently written tables.
+
+A JournaledTable keeps the regular JSON file as its snapshot and records
+every mutation as one line in a JSONL journal next to it. Concurrent
+writers are group-committed: one of them writes and fsyncs the whole
+pending batch while the others wait for it. Once the journal holds more
+records than the table has rows it is folded back into the snapshot, so
+writes cost O(1) amortized instead of rewriting the whole file.
+
+Records are full-row puts and deletes, or a batch of them written as one
+line, so replaying a record that is already reflected in the snapshot is
+harmless.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Iterable, List, Optional, Tuple
+
+from api.services.json_table import IndexSpec, JsonTable
+from configs import JOURNAL_COMPACT_MIN_RECORDS, JOURNAL_GROUP_COMMIT_DELAY, REPOSITORY_STAT_INTERVAL
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+
+class JournaledTable(JsonTable):
+    """
+    JsonTable whose writes are appended to a journal instead of rewriting
+    the snapshot file.
+    """
+
+    def __init__(self, path: str, primary_key: str, indexes: Iterable[IndexSpec] = ()) -> None:
+        super().__init__(path, primary_key, indexes)
+        self.journal_path = f"{os.path.splitext(path)[0]}.journal.jsonl"
+
+        self._journal_offset = 0
+        self._journal_records = 0
+        self._fd: Optional[int] = None
+
+        # Group commit state, guarded by _commit_cond. Lock order is always
+        # table lock -> _commit_cond, never the reverse.
+        self._commit_cond = threading.Condition()
+        self._pending: List[bytes] = []
+        self._next_seq = 1
+        self._durable_seq = 0
+        self._flushing = False
+
+    # Loading
+
+    def _journal_size(self) -> int:
+        try:
+            return os.stat(self.journal_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _apply(self, record: dict) -> None:
+        if record["op"] == "put":
+            self._insert(record["row"])
+        elif record["op"] == "delete":
+            self._remove(record["key"])
+        elif record["op"] == "batch":
+            for item in record["records"]:
+                self._apply(item)
+
+    def _replay(self, start: int) -> None:
+        """
+        Applies journal records from byte offset start. A trailing record
+        without its newline is still being written and is left for later.
+        """
+        if not os.path.exists(self.journal_path):
+            self._journal_offset = 0
+            return
+        with open(self.journal_path, "rb") as f:
+            f.seek(start)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn record left behind by a crashed writer
+                continue
+            self._apply(record)
+            self._journal_records += 1
+        self._journal_offset = start + end
+
+    def _load(self) -> None:
+        super()._load()
+        self._journal_records = 0
+        self._replay(0)
+
+    def _has_unflushed(self) -> bool:
+        with self._commit_cond:
+            return self._flushing or bool(self._pending)
+
+    def _ensure_fresh(self) -> None:
+        """
+        Rebuilds from snapshot plus journal on first use. Afterwards only the
+        journal tail written by other processes is replayed, unless the
+        snapshot itself was replaced by a compaction.
+        """
+        if not self._loaded:
+            self._load()
+            return
+        now = time.monotonic()
+        if now - self._last_check < REPOSITORY_STAT_INTERVAL:
+            return
+        self._last_check = now
+        if self._has_unflushed():
+            # Our own records are not on disk yet; the tail would be misread
+            return
+        size = self._journal_size()
+        if self._file_mtime() != self._mtime or size < self._journal_offset:
+            self._load()
+        elif size > self._journal_offset:
+            self._replay(self._journal_offset)
+
+    # Journal file
+
+    def _open_journal(self) -> int:
+        if self._fd is None:
+            self._fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _lock_file(self, fd: int) -> None:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_file(self, fd: int) -> None:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _append(self, fd: int, data: bytes) -> int:
+        """
+        Appends data and fsyncs it. Must be called with the file lock held.
+        Returns the journal size before the write.
+        """
+        before = os.fstat(fd).st_size
+        if before > 0:
+            with open(self.journal_path, "rb") as f:
+                f.seek(before - 1)
+                if f.read(1) != b"\n":
+                    # Terminate a torn record so ours starts on a fresh line
+                    data = b"\n" + data
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        os.fsync(fd)
+        if before == self._journal_offset:
+            self._journal_offset = before + len(data)
+        return before
+
+    # Writes
+
+    @staticmethod
+    def _record(op: str, key: str, row: Optional[dict]) -> dict:
+        record = {"op": op, "key": key}
+        if row is not None:
+            record["row"] = row
+        return record
+
+    def _persist(self, op: str, key: str, row: Optional[dict]) -> Any:
+        return self._enqueue(self._record(op, key, row))
+
+    def _persist_batch(self, records: List[Tuple[str, str, Optional[dict]]]) -> Any:
+        # One journal line, so a crash can never leave half of the batch applied
+        return self._enqueue({"op": "batch", "records": [self._record(*record) for record in records]})
+
+    def _enqueue(self, record: dict) -> Any:
+        line = (json.dumps(record) + "\n").encode()
+        self._journal_records += 1
+        with self._commit_cond:
+            self._pending.append(line)
+            seq = self._next_seq
+            self._next_seq += 1
+        return seq
+
+    def _wait_durable(self, token: Any) -> None:
+        """
+        Waits until the record with sequence number token is fsynced. The
+        first waiter to find no flush in progress becomes the leader and
+        commits everything pending on behalf of the others.
+        """
+        with self._commit_cond:
+            while self._durable_seq < token:
+                if self._flushing:
+                    self._commit_cond.wait()
+                    continue
+                self._flushing = True
+                if JOURNAL_GROUP_COMMIT_DELAY > 0:
+                    # Give concurrent writers a moment to join this batch
+                    self._commit_cond.wait(JOURNAL_GROUP_COMMIT_DELAY)
+                batch, self._pending = self._pending, []
+                last_seq = self._next_seq - 1
+                self._commit_cond.release()
+                try:
+                    fd = self._open_journal()
+                    self._lock_file(fd)
+                    try:
+                        self._append(fd, b"".join(batch))
+                    finally:
+                        self._unlock_file(fd)
+                except BaseException:
+                    self._commit_cond.acquire()
+                    self._pending = batch + self._pending
+                    self._flushing = False
+                    self._commit_cond.notify_all()
+                    raise
+                self._commit_cond.acquire()
+                self._durable_seq = max(self._durable_seq, last_seq)
+                self._flushing = False
+                self._commit_cond.notify_all()
+
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        with self._lock:
+            if self._journal_records >= max(JOURNAL_COMPACT_MIN_RECORDS, len(self._rows)):
+                self.compact()
+
+    def compact(self) -> None:
+        """
+        Folds the journal into a fresh snapshot and truncates the journal.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            with self._commit_cond:
+                while self._flushing:
+                    self._commit_cond.wait()
+                batch, self._pending = self._pending, []
+                last_seq = self._next_seq - 1
+
+                fd = self._open_journal()
+                self._lock_file(fd)
+                try:
+                    if batch:
+                        self._append(fd, b"".join(batch))
+                    # Pick up records other processes appended before snapshotting
+                    if os.fstat(fd).st_size > self._journal_offset:
+                        self._replay(self._journal_offset)
+                    self._write_file()
+                    os.ftruncate(fd, 0)
+                    os.fsync(fd)
+                finally:
+                    self._unlock_file(fd)
+
+                self._journal_offset = 0
+                self._journal_records = 0
+                self._durable_seq = max(self._durable_seq, last_seq)
+                self._commit_cond.notify_all()
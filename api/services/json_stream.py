@@ -0,0 +1,121 @@
+"""
+Incremental parser for a JSON object arriving in chunks.
+
+Models wrap their JSON in code fences or prose, and stream it a few
+characters at a time. IncrementalJSONParser skips everything before the
+first "{" and reports each top-level field of that object as soon as its
+value is complete, so callers can act on early fields before the rest of
+the completion arrives. Each character is scanned once.
+"""
+
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# What the parser expects next at the top level of the object
+_KEY = "key"
+_COLON = "colon"
+_VALUE = "value"
+_COMMA = "comma"
+
+
+class IncrementalJSONParser:
+    """
+    Feeds on text chunks and yields completed top-level (key, value) fields.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = _KEY
+        self._key: Optional[str] = None
+        self._key_start = 0
+        self._value_start: Optional[int] = None
+
+    def _complete(self, end: int) -> Optional[Tuple[str, Any]]:
+        raw = self.text[self._value_start:end].strip()
+        self._value_start = None
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            # Left to the caller's parse of the full text
+            logger.debug(f"Skipping unparseable value for {self._key!r}: {raw[:80]!r}")
+            return None
+        self.fields[self._key] = value
+        return self._key, value
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Adds a chunk and returns the fields it completed, in order.
+        """
+        self.text += chunk
+        completed: List[Tuple[str, Any]] = []
+        text = self.text
+        i = self._pos
+        while i < len(text) and not self.done:
+            c = text[i]
+            if self._depth == 0:
+                if c == "{":
+                    self._depth = 1
+                    self._expect = _KEY
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == _KEY:
+                        self._key = json.loads(text[self._key_start:i + 1])
+                        self._expect = _COLON
+                    elif self._depth == 1 and self._expect == _VALUE:
+                        field = self._complete(i + 1)
+                        if field is not None:
+                            completed.append(field)
+                        self._expect = _COMMA
+            elif c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect == _KEY:
+                    self._key_start = i
+                elif self._depth == 1 and self._expect == _VALUE:
+                    self._value_start = i
+            elif c in "{[":
+                if self._depth == 1 and self._expect == _VALUE:
+                    self._value_start = i
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._expect == _VALUE:
+                    field = self._complete(i + 1)
+                    if field is not None:
+                        completed.append(field)
+                    self._expect = _COMMA
+                elif self._depth == 0:
+                    # A scalar closing the object
+                    if self._expect == _VALUE and self._value_start is not None:
+                        field = self._complete(i)
+                        if field is not None:
+                            completed.append(field)
+                    self.done = True
+            elif self._depth == 1:
+                if c == ":" and self._expect == _COLON:
+                    self._expect = _VALUE
+                elif c == ",":
+                    if self._expect == _VALUE and self._value_start is not None:
+                        field = self._complete(i)
+                        if field is not None:
+                            completed.append(field)
+                    self._expect = _KEY
+                elif self._expect == _VALUE and self._value_start is None and not c.isspace():
+                    # Numbers, true, false and null
+                    self._value_start = i
+            i += 1
+        self._pos = i
+        return completed
@@ -0,0 +1,341 @@
+"""
+In-memory table over a JSON list-of-objects file with dict indexes.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from configs import REPOSITORY_STAT_INTERVAL
+
+IndexSpec = Union[str, Tuple[str, ...]]
+
+# Called with (old_row, new_row) for every row change; None on either side
+# means the row did not exist before or no longer exists
+Listener = Callable[[Optional[dict], Optional[dict]], None]
+
+
+class JsonTable:
+    """
+    A JSON list-of-objects file loaded into memory with dict indexes.
+
+    Secondary indexes are declared either as a single field name or as a
+    tuple of field names (a composite index). List-valued fields are
+    indexed once per element, and an empty list is indexed under None.
+    Listeners are told about every row change, including reloads.
+    """
+
+    def __init__(self, path: str, primary_key: str, indexes: Iterable[IndexSpec] = ()) -> None:
+        self.path = path
+        self.primary_key = primary_key
+        self.index_specs: List[IndexSpec] = list(indexes)
+
+        self._lock = threading.RLock()
+        self._rows: Dict[str, dict] = {}
+        self._indexes: Dict[IndexSpec, Dict[Any, Dict[str, dict]]] = {}
+        self._listeners: List[Listener] = []
+        self._loaded = False
+        self._mtime: Optional[float] = None
+        self._last_check = 0.0
+
+    # Loading and invalidation
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _read_rows(self) -> List[dict]:
+        """
+        Reads every row from the backing file.
+        """
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return []
+
+    def _load(self) -> None:
+        self._mtime = self._file_mtime()
+        if self._listeners:
+            for row in self._rows.values():
+                self._notify(row, None)
+        self._rows = {}
+        self._indexes = {spec: {} for spec in self.index_specs}
+        for row in self._read_rows():
+            self._insert(row)
+        self._loaded = True
+        self._last_check = time.monotonic()
+
+    def _ensure_fresh(self) -> None:
+        """
+        Loads the table on first use and reloads it when the file changed.
+        The file is stat'ed at most once every REPOSITORY_STAT_INTERVAL seconds.
+        """
+        if not self._loaded:
+            self._load()
+            return
+        now = time.monotonic()
+        if now - self._last_check < REPOSITORY_STAT_INTERVAL:
+            return
+        self._last_check = now
+        if self._file_mtime() != self._mtime:
+            self._load()
+
+    def invalidate(self) -> None:
+        """
+        Drops the in-memory copy so the next access reloads from disk.
+        """
+        with self._lock:
+            self._loaded = False
+
+    def refresh(self) -> None:
+        """
+        Picks up changes made on disk, as any read would.
+        """
+        with self._lock:
+            self._ensure_fresh()
+
+    # Change listeners
+
+    def add_listener(self, listener: Listener) -> None:
+        """
+        Registers listener and replays the current rows to it as inserts.
+        Listeners run with the table lock held and must not call back into
+        the table.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            self._listeners.append(listener)
+            for row in self._rows.values():
+                listener(None, row)
+
+    def _notify(self, old_row: Optional[dict], new_row: Optional[dict]) -> None:
+        for listener in self._listeners:
+            listener(old_row, new_row)
+
+    # Index maintenance
+
+    @staticmethod
+    def _field_values(row: dict, field: str) -> List[Any]:
+        value = row.get(field)
+        if isinstance(value, list):
+            return list(value) if value else [None]
+        return [value]
+
+    def _index_keys(self, spec: IndexSpec, row: dict) -> List[Any]:
+        if isinstance(spec, str):
+            return self._field_values(row, spec)
+        keys: List[Any] = [()]
+        for field in spec:
+            keys = [key + (v,) for key in keys for v in self._field_values(row, field)]
+        return keys
+
+    def _unindex(self, key: str, row: dict) -> None:
+        for spec in self.index_specs:
+            index = self._indexes[spec]
+            for index_key in self._index_keys(spec, row):
+                bucket = index.get(index_key)
+                if bucket is not None:
+                    bucket.pop(key, None)
+                    if not bucket:
+                        del index[index_key]
+
+    def _insert(self, row: dict) -> None:
+        # Replacing an existing row keeps its position in file order
+        key = row[self.primary_key]
+        old_row = self._rows.get(key)
+        if old_row is not None:
+            self._unindex(key, old_row)
+        self._rows[key] = row
+        for spec in self.index_specs:
+            for index_key in self._index_keys(spec, row):
+                self._indexes[spec].setdefault(index_key, {})[key] = row
+        if self._listeners:
+            self._notify(old_row, row)
+
+    def _remove(self, key: str) -> Optional[dict]:
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._unindex(key, row)
+            if self._listeners:
+                self._notify(row, None)
+        return row
+
+    # Reads
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns the row with the given primary key, or None.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            return self._rows.get(key)
+
+    def all(self) -> List[dict]:
+        """
+        Returns every row in file order.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            return list(self._rows.values())
+
+    def find(self, index: IndexSpec, value: Any) -> List[dict]:
+        """
+        Returns the rows whose indexed field (or composite fields) equal value.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            if index not in self._indexes:
+                raise KeyError(f"No index {index!r} on {self.path}")
+            return list(self._indexes[index].get(value, {}).values())
+
+    # Writes
+
+    def _write_file(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(list(self._rows.values()), f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._mtime = self._file_mtime()
+
+    def _persist(self, op: str, key: str, row: Optional[dict]) -> Any:
+        """
+        Persists a mutation that was just applied in memory. Called with the
+        table lock held; the return value is handed to _wait_durable once the
+        lock is released.
+        """
+        self._write_file()
+        return None
+
+    def _persist_batch(self, records: List[Tuple[str, str, Optional[dict]]]) -> Any:
+        """
+        Persists several mutations as one unit; same contract as _persist.
+        """
+        self._write_file()
+        return None
+
+    def _wait_durable(self, token: Any) -> None:
+        """
+        Blocks until the mutation identified by token is on disk.
+        """
+        return None
+
+    def put(self, row: dict) -> dict:
+        """
+        Inserts or replaces a row and persists the table.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            self._insert(row)
+            token = self._persist("put", row[self.primary_key], row)
+        self._wait_durable(token)
+        return row
+
+    def delete(self, key: str) -> Optional[dict]:
+        """
+        Removes a row and persists the table. Returns the removed row or None.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            row = self._remove(key)
+            if row is None:
+                return None
+            token = self._persist("delete", key, None)
+        self._wait_durable(token)
+        return row
+
+    def update(self, key: str, fn: Callable[[dict], Optional[dict]]) -> Optional[dict]:
+        """
+        Atomically replaces a row with fn(row). If fn returns None the row is
+        left untouched. Returns the new row, or None if nothing was written.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            new_row = fn(dict(row))
+            if new_row is None:
+                return None
+            self._insert(new_row)
+            token = self._persist("put", key, new_row)
+        self._wait_durable(token)
+        return new_row
+
+    def _prepare_many(
+        self, fns: Dict[str, Callable[[dict], Optional[dict]]], puts: Iterable[dict] = ()
+    ) -> Optional[List[dict]]:
+        """
+        Computes the new rows of update_many without writing them, followed
+        by puts as given, or None if any row is missing or any fn returns
+        None. Called with the lock held.
+        """
+        self._ensure_fresh()
+        new_rows = []
+        for key, fn in fns.items():
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            new_row = fn(dict(row))
+            if new_row is None:
+                return None
+            new_rows.append(new_row)
+        return new_rows + list(puts)
+
+    def _apply_many(self, new_rows: List[dict]) -> Any:
+        """
+        Writes rows computed by _prepare_many; called with the lock held and
+        returns the token for _wait_durable.
+        """
+        for new_row in new_rows:
+            self._insert(new_row)
+        return self._persist_batch([("put", row[self.primary_key], row) for row in new_rows])
+
+    def update_many(self, fns: Dict[str, Callable[[dict], Optional[dict]]]) -> Optional[List[dict]]:
+        """
+        Atomically replaces several rows, each with its fn(row). If any row is
+        missing or any fn returns None, nothing is written and None is
+        returned; otherwise returns the new rows.
+        """
+        with self._lock:
+            new_rows = self._prepare_many(fns)
+            if new_rows is None:
+                return None
+            token = self._apply_many(new_rows)
+        self._wait_durable(token)
+        return new_rows
+
+
+def update_many_tables(
+    updates: List[Tuple[JsonTable, Dict[str, Callable[[dict], Optional[dict]]], Iterable[dict]]]
+) -> Optional[List[List[dict]]]:
+    """
+    update_many over several tables as one unit, each with rows to put
+    alongside: either every fn applies and every row is put, or nothing is
+    written. The table locks are taken in the order given, so callers must
+    list tables in a consistent order.
+    """
+    tokens = []
+    with contextlib.ExitStack() as stack:
+        for table, _, _ in updates:
+            stack.enter_context(table._lock)
+        results = []
+        for table, fns, puts in updates:
+            new_rows = table._prepare_many(fns, puts)
+            if new_rows is None:
+                return None
+            results.append(new_rows)
+        for (table, _, _), new_rows in zip(updates, results):
+            tokens.append((table, table._apply_many(new_rows)))
+    for table, token in tokens:
+        table._wait_durable(token)
+    return results
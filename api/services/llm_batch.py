@@ -0,0 +1,298 @@
+"""
+Packs concurrent LLM prompts into one multi-item request.
+
+Negotiation turns are issued from many threads at once, each as its own
+small completion request. Prompts submitted to the same model with the
+same group key are gathered and sent as a single structured request that
+asks for one JSON-encoded answer per item; the answers are then handed
+back to the waiting callers. The group key names one side of the market
+("buyer" or "seller"), so the two sides of a negotiation never share a
+packed request and neither sees the other's reserve price. An idle batcher sends a prompt at once; prompts are only
+held, for up to a short window, while earlier packs are in flight. If the
+packed response does not validate, every caller falls back to its own
+single request. Prompts that ask for structured output are packed under a
+schema wrapping the item schema.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from configs import LLM_BATCH_MAX_IN_FLIGHT, LLM_BATCH_MAX_ITEMS, LLM_BATCH_WINDOW
+
+logger = logging.getLogger(__name__)
+
+PACKED_PROMPT = """You are answering {count} independent requests in one reply. Treat every request as if it were the only one you received: do not let the content of one request influence the answer to another.
+
+Return ONLY a JSON object of the form {{"responses": [{{"id": <request id>, "response": "<your complete reply to that request>"}}]}} with exactly one entry for every request id below.
+
+Requests:
+{requests}"""
+
+_fence = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def pack_prompts(prompts: List[str]) -> str:
+    requests = json.dumps([{"id": i, "request": prompt} for i, prompt in enumerate(prompts)], indent=1)
+    return PACKED_PROMPT.format(count=len(prompts), requests=requests)
+
+
+def packed_response_format(response_format: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Wraps a json_schema response format so a packed reply holds one
+    schema-conforming object per request.
+    """
+    if not response_format or response_format.get("type") != "json_schema":
+        return None
+    item_schema = response_format["json_schema"]["schema"]
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "packed_responses",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "responses": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {"id": {"type": "integer"}, "response": item_schema},
+                            "required": ["id", "response"],
+                            "additionalProperties": False,
+                        },
+                    },
+                },
+                "required": ["responses"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def unpack_responses(content: Optional[str], count: int) -> Optional[List[str]]:
+    """
+    Returns the responses of a packed reply in request order, or None if the
+    reply is not valid JSON or does not answer every request exactly once.
+    """
+    if not content:
+        return None
+    try:
+        data = json.loads(_fence.sub("", content.strip()))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("responses"), list):
+        return None
+
+    responses: List[Optional[str]] = [None] * count
+    for item in data["responses"]:
+        if not isinstance(item, dict):
+            return None
+        index, response = item.get("id"), item.get("response")
+        if isinstance(response, dict):
+            # Structured items come back as objects; callers expect the JSON text
+            response = json.dumps(response)
+        if not isinstance(index, int) or not 0 <= index < count or responses[index] is not None:
+            return None
+        if not isinstance(response, str) or not response.strip():
+            return None
+        responses[index] = response
+    if any(response is None for response in responses):
+        return None
+    return responses
+
+
+class _Pending:
+    """
+    A submitted prompt waiting for its share of a packed response.
+    """
+
+    __slots__ = ("prompt", "group", "submitted_at", "done", "value", "error", "fallback")
+
+    def __init__(self, prompt: str, group: str) -> None:
+        self.prompt = prompt
+        self.group = group
+        self.submitted_at = time.monotonic()
+        self.done = threading.Event()
+        self.value: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        # Set when the caller should make its own single request
+        self.fallback = False
+
+
+class PromptBatcher:
+    """
+    Gathers prompts for one model and sends them through send() in packs of
+    up to max_items prompts of one group. While packs are in flight a prompt
+    waits at most window seconds for others of its group.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        send: Callable[[str, str, Optional[Dict[str, Any]]], str],
+        response_format: Optional[Dict[str, Any]] = None,
+        window: float = LLM_BATCH_WINDOW,
+        max_items: int = LLM_BATCH_MAX_ITEMS,
+        max_in_flight: int = LLM_BATCH_MAX_IN_FLIGHT,
+    ) -> None:
+        self.model = model
+        self.send = send
+        self.response_format = response_format
+        self.packed_format = packed_response_format(response_format)
+        self.window = window
+        self.max_items = max_items
+
+        self._cond = threading.Condition()
+        self._queue: List[_Pending] = []
+        self._in_flight = 0
+        self._worker: Optional[threading.Thread] = None
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm-batch")
+
+        self.submitted = 0
+        self.requests = 0
+        self.packed_requests = 0
+        self.packed_items = 0
+        self.fallbacks = 0
+
+    def submit(self, prompt: str, group: str) -> str:
+        """
+        Blocks until the response for prompt is available. Only prompts with
+        the same group are packed together.
+        """
+        pending = _Pending(prompt, group)
+        with self._cond:
+            self._queue.append(pending)
+            self.submitted += 1
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"llm-batcher-{self.model}", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+
+        pending.done.wait()
+        if pending.fallback:
+            with self._cond:
+                self.requests += 1
+            return self.send(pending.prompt, self.model, self.response_format)
+        if pending.error is not None:
+            raise pending.error
+        return pending.value
+
+    def _take(self) -> List[_Pending]:
+        """
+        Removes the oldest prompt and up to max_items - 1 more of its group
+        from the queue. Called with the lock held.
+        """
+        group = self._queue[0].group
+        batch = [pending for pending in self._queue if pending.group == group][:self.max_items]
+        taken = set(map(id, batch))
+        self._queue = [pending for pending in self._queue if id(pending) not in taken]
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                # Nothing to wait behind when idle; otherwise hold the window
+                # open unless the pack is already full
+                while self._in_flight:
+                    head = self._queue[0]
+                    if sum(1 for pending in self._queue if pending.group == head.group) >= self.max_items:
+                        break
+                    remaining = head.submitted_at + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take()
+                self._in_flight += 1
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[_Pending]) -> None:
+        try:
+            self._send_batch(batch)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify()
+
+    def _send_batch(self, batch: List[_Pending]) -> None:
+        if len(batch) == 1:
+            pending = batch[0]
+            try:
+                pending.value = self.send(pending.prompt, self.model, self.response_format)
+            except BaseException as e:
+                pending.error = e
+            with self._cond:
+                self.requests += 1
+            pending.done.set()
+            return
+
+        responses = None
+        try:
+            packed = self.send(pack_prompts([p.prompt for p in batch]), self.model, self.packed_format)
+            responses = unpack_responses(packed, len(batch))
+        except Exception as e:
+            logger.warning(f"Packed request of {len(batch)} prompts for {self.model} failed: {e!r}")
+
+        with self._cond:
+            self.requests += 1
+            self.packed_requests += 1
+            self.packed_items += len(batch)
+            if responses is None:
+                self.fallbacks += 1
+
+        if responses is None:
+            logger.warning(f"Packed response for {len(batch)} prompts did not validate, falling back to single requests")
+        for index, pending in enumerate(batch):
+            if responses is None:
+                pending.fallback = True
+            else:
+                pending.value = responses[index]
+            pending.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "model": self.model,
+                "submitted": self.submitted,
+                "queued": len(self._queue),
+                "in_flight": self._in_flight,
+                "requests": self.requests,
+                "packed_requests": self.packed_requests,
+                "avg_pack_size": self.packed_items / self.packed_requests if self.packed_requests else 0.0,
+                "fallbacks": self.fallbacks,
+                "requests_saved": self.submitted - self.requests,
+            }
+
+
+_batchers: Dict[Tuple[str, str], PromptBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(
+    model: str,
+    send: Callable[[str, str, Optional[Dict[str, Any]]], str],
+    response_format: Optional[Dict[str, Any]] = None,
+) -> PromptBatcher:
+    """
+    Returns the process-wide batcher for model and response format, sending
+    through send(prompt, model, response_format).
+    """
+    key = (model, json.dumps(response_format, sort_keys=True))
+    with _batchers_lock:
+        batcher = _batchers.get(key)
+        if batcher is None:
+            batcher = PromptBatcher(model, send, response_format)
+            _batchers[key] = batcher
+        return batcher
+
+
+def batcher_stats() -> List[Dict[str, Any]]:
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+    return [dict(batcher.stats(), structured=batcher.response_format is not None) for batcher in batchers]
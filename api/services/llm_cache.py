@@ -0,0 +1,407 @@
+"""
+Content-addressed cache for LLM completions.
+
+Completions are keyed on a hash of (model, normalized messages, sampling
+params). Lookups go to an in-memory LRU tier first and then to an
+optional on-disk tier; both honour a TTL and the memory tier is bounded
+by entry count and total bytes. Identical requests that are already in
+flight are coalesced onto the one upstream call, for both threaded
+(call_gpt) and async (call_*_async) callers.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from configs import (
+    LLM_CACHE_DIR,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_MAX_DISK_ENTRIES,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_TTL,
+)
+
+
+def normalize_messages(messages: Any) -> List[Dict[str, str]]:
+    """
+    Brings a prompt string or a chat message list into one canonical form.
+    """
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    normalized = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            content = content.strip()
+        normalized.append({"role": message.get("role"), "content": content})
+    return normalized
+
+
+def cache_key(model: str, messages: Any, params: Optional[Dict[str, Any]] = None) -> str:
+    payload = {
+        "model": model,
+        "messages": normalize_messages(messages),
+        "params": params or {},
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class _InFlight:
+    """
+    A threaded upstream call that later identical requests wait on.
+    """
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class LLMCache:
+    """
+    Two-tier LRU/disk cache with TTL, size-based eviction and coalescing.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        ttl: float = LLM_CACHE_TTL,
+        disk_dir: Optional[str] = LLM_CACHE_DIR,
+        max_disk_entries: int = LLM_CACHE_MAX_DISK_ENTRIES,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, _InFlight] = {}
+        self._inflight_async: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._disk_writes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # Memory tier
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, value) = self._entries.popitem(last=False)
+            self._bytes -= len(value)
+            self.evictions += 1
+
+    def _store(self, key: str, value: str, expires_at: float) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[1])
+        self._entries[key] = (expires_at, value)
+        self._bytes += len(value)
+        self._evict()
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """
+        Returns a live value from the memory tier and updates the hit
+        counters. Must be called with the lock held.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._entries.pop(key)
+            self._bytes -= len(value)
+        return None
+
+    def _lookup_disk(self, key: str) -> Optional[str]:
+        """
+        Returns a live value from the disk tier and promotes it to memory.
+        Reads the file without holding the lock.
+        """
+        disk_entry = self._disk_read(key)
+        if disk_entry is None or disk_entry[0] <= time.time():
+            return None
+        with self._lock:
+            self._store(key, disk_entry[1], disk_entry[0])
+            self.hits += 1
+            self.disk_hits += 1
+        return disk_entry[1]
+
+    # Disk tier
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_read(self, key: str) -> Optional[Tuple[float, str]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if data["expires_at"] <= time.time():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        return data["expires_at"], data["value"]
+
+    def _disk_write(self, key: str, value: str, expires_at: float) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"expires_at": expires_at, "value": value}, f)
+        os.replace(tmp_path, path)
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._disk_prune()
+
+    def _disk_prune(self) -> None:
+        """
+        Drops the least recently written files beyond max_disk_entries.
+        """
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    files.append((os.path.getmtime(path), path))
+        excess = len(files) - self.max_disk_entries
+        if excess > 0:
+            for _, path in sorted(files)[:excess]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    # Public API
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._lookup(key)
+        if value is None and self.disk_dir:
+            value = self._lookup_disk(key)
+        return value
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """
+        Like get, with the disk tier read on the default executor.
+        """
+        with self._lock:
+            value = self._lookup(key)
+        if value is None and self.disk_dir:
+            value = await asyncio.get_running_loop().run_in_executor(None, self._lookup_disk, key)
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        self._disk_write(key, value, expires_at)
+
+    async def put_async(self, key: str, value: str) -> None:
+        if self.disk_dir:
+            await asyncio.get_running_loop().run_in_executor(None, self.put, key, value)
+        else:
+            self.put(key, value)
+
+    def get_or_call(self, key: str, fn: Callable[[], str]) -> str:
+        """
+        Returns the cached value for key, or calls fn once for all threads
+        asking for the same key at the same time. The caller that calls fn
+        also does the disk lookup, outside the lock.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                inflight = _InFlight()
+                self._inflight[key] = inflight
+                leader = True
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.value
+
+        try:
+            value = self._lookup_disk(key) if self.disk_dir else None
+            if value is None:
+                with self._lock:
+                    self.misses += 1
+                value = fn()
+                if value is not None:
+                    self.put(key, value)
+            inflight.value = value
+            return value
+        except BaseException as e:
+            inflight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.done.set()
+
+    async def get_or_call_async(self, key: str, fn: Callable[[], Awaitable[str]]) -> str:
+        """
+        Async counterpart of get_or_call; coalesces callers on the same loop
+        and keeps file access off it. If the caller running fn is cancelled,
+        the callers waiting on it start over and one of them takes its place.
+        """
+        loop = asyncio.get_running_loop()
+        inflight_key = (key, id(loop))
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            future = self._inflight_async.get(inflight_key)
+            if future is None:
+                future = loop.create_future()
+                self._inflight_async[inflight_key] = future
+                leader = True
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # This caller was cancelled, not the one it waited on
+                    raise
+            return await self.get_or_call_async(key, fn)
+
+        try:
+            value = None
+            if self.disk_dir:
+                value = await loop.run_in_executor(None, self._lookup_disk, key)
+            if value is None:
+                with self._lock:
+                    self.misses += 1
+                value = await fn()
+                if value is not None:
+                    await self.put_async(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve it so an unawaited failure is not reported as never retrieved
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._inflight_async.pop(inflight_key, None)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= len(entry[1])
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": LLM_CACHE_ENABLED,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+llm_cache = LLMCache()
+
+
+def cached_call(model: str, messages: Any, params: Optional[Dict[str, Any]], fn: Callable[[], str]) -> str:
+    """
+    Runs fn through the shared cache unless caching is disabled.
+    """
+    if not LLM_CACHE_ENABLED:
+        return fn()
+    return llm_cache.get_or_call(cache_key(model, messages, params), fn)
+
+
+async def cached_call_async(
+    model: str, messages: Any, params: Optional[Dict[str, Any]], fn: Callable[[], Awaitable[str]]
+) -> str:
+    if not LLM_CACHE_ENABLED:
+        return await fn()
+    return await llm_cache.get_or_call_async(cache_key(model, messages, params), fn)
+
+
+def discard_cached(model: str, messages: Any, params: Optional[Dict[str, Any]]) -> None:
+    llm_cache.discard(cache_key(model, messages, params))
+
+
+def get_cached(model: str, messages: Any, params: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Looks a completion up without calling upstream, for streamed calls.
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+    return llm_cache.get(cache_key(model, messages, params))
+
+
+def put_cached(model: str, messages: Any, params: Optional[Dict[str, Any]], value: str) -> None:
+    if LLM_CACHE_ENABLED and value:
+        llm_cache.put(cache_key(model, messages, params), value)
+
+
+async def get_cached_async(model: str, messages: Any, params: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not LLM_CACHE_ENABLED:
+        return None
+    return await llm_cache.get_async(cache_key(model, messages, params))
+
+
+async def put_cached_async(model: str, messages: Any, params: Optional[Dict[str, Any]], value: str) -> None:
+    if LLM_CACHE_ENABLED and value:
+        await llm_cache.put_async(cache_key(model, messages, params), value)
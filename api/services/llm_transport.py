@@ -0,0 +1,216 @@
+"""
+Shared HTTP transport for the LLM providers.
+
+Keeps one keep-alive connection pool per provider host, for both the
+synchronous callers (negotiation threads) and the async API handlers,
+and applies the same timeouts and retry-with-backoff policy to both.
+Async clients are bound to the event loop that created them, so one is
+kept per (host, loop). Streamed responses are retried only until their
+first line arrives.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from configs import (
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_CONNECT_TIMEOUT,
+    LLM_MAX_CONNECTIONS_PER_HOST,
+    LLM_MAX_KEEPALIVE_PER_HOST,
+    LLM_MAX_RETRIES,
+    LLM_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+_sync_clients: Dict[str, httpx.Client] = {}
+_async_clients: Dict[Tuple[str, int], httpx.AsyncClient] = {}
+_clients_lock = threading.Lock()
+
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS_PER_HOST,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_PER_HOST,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def get_sync_client(url: str) -> httpx.Client:
+    """
+    Returns the pooled synchronous client for the host of url.
+    """
+    host = _host(url)
+    with _clients_lock:
+        client = _sync_clients.get(host)
+        if client is None:
+            client = httpx.Client(limits=_limits(), timeout=_timeout())
+            _sync_clients[host] = client
+        return client
+
+
+def get_async_client(url: str) -> httpx.AsyncClient:
+    """
+    Returns the pooled async client for the host of url on the running loop.
+    """
+    key = (_host(url), id(asyncio.get_running_loop()))
+    with _clients_lock:
+        client = _async_clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+            _async_clients[key] = client
+        return client
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    Seconds to wait before retry number attempt (starting at 1). Honours a
+    numeric Retry-After header, otherwise uses capped exponential backoff
+    with full jitter.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def _should_retry(response: Optional[httpx.Response], attempt: int) -> bool:
+    if attempt > LLM_MAX_RETRIES:
+        return False
+    return response is None or response.status_code in RETRY_STATUSES
+
+
+def post_json(url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """
+    POSTs a JSON payload over the pooled sync client, retrying transport
+    errors and retryable status codes with backoff.
+    """
+    client = get_sync_client(url)
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            response = client.post(url, json=payload, headers=headers)
+        except httpx.TransportError as e:
+            if not _should_retry(None, attempt):
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"LLM request to {url} failed ({e!r}), retry {attempt} in {delay:.2f}s")
+        else:
+            if not _should_retry(response, attempt):
+                return response
+            delay = backoff_delay(attempt, response.headers.get("retry-after"))
+            logger.warning(f"LLM request to {url} returned {response.status_code}, retry {attempt} in {delay:.2f}s")
+        time.sleep(delay)
+
+
+async def post_json_async(url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """
+    Async counterpart of post_json; never blocks the event loop.
+    """
+    client = get_async_client(url)
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            response = await client.post(url, json=payload, headers=headers)
+        except httpx.TransportError as e:
+            if not _should_retry(None, attempt):
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"LLM request to {url} failed ({e!r}), retry {attempt} in {delay:.2f}s")
+        else:
+            if not _should_retry(response, attempt):
+                return response
+            delay = backoff_delay(attempt, response.headers.get("retry-after"))
+            logger.warning(f"LLM request to {url} returned {response.status_code}, retry {attempt} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+def stream_lines(url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Iterator[str]:
+    """
+    POSTs a JSON payload and yields the response body line by line as it
+    arrives. Raises httpx.HTTPStatusError for a final non-2xx response.
+    """
+    client = get_sync_client(url)
+    attempt = 0
+    started = False
+    while True:
+        attempt += 1
+        try:
+            with client.stream("POST", url, json=payload, headers=headers) as response:
+                if _should_retry(response, attempt):
+                    delay = backoff_delay(attempt, response.headers.get("retry-after"))
+                    logger.warning(f"LLM stream from {url} returned {response.status_code}, retry {attempt} in {delay:.2f}s")
+                else:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        started = True
+                        yield line
+                    return
+        except httpx.TransportError as e:
+            if started or not _should_retry(None, attempt):
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"LLM stream from {url} failed ({e!r}), retry {attempt} in {delay:.2f}s")
+        time.sleep(delay)
+
+
+async def stream_lines_async(url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> AsyncIterator[str]:
+    """
+    Async counterpart of stream_lines; never blocks the event loop.
+    """
+    client = get_async_client(url)
+    attempt = 0
+    started = False
+    while True:
+        attempt += 1
+        try:
+            async with client.stream("POST", url, json=payload, headers=headers) as response:
+                if _should_retry(response, attempt):
+                    delay = backoff_delay(attempt, response.headers.get("retry-after"))
+                    logger.warning(f"LLM stream from {url} returned {response.status_code}, retry {attempt} in {delay:.2f}s")
+                else:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        started = True
+                        yield line
+                    return
+        except httpx.TransportError as e:
+            if started or not _should_retry(None, attempt):
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"LLM stream from {url} failed ({e!r}), retry {attempt} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+async def aclose() -> None:
+    """
+    Closes the async clients created on the running loop.
+    """
+    loop_id = id(asyncio.get_running_loop())
+    with _clients_lock:
+        keys = [key for key in _async_clients if key[1] == loop_id]
+        clients = [_async_clients.pop(key) for key in keys]
+    for client in clients:
+        await client.aclose()
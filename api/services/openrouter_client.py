@@ -1,40 +1,120 @@
 """
 Wrapper for calling OpenRouter LLM models.
 Handles headers, routing, rate limits, and errors.
+stream_openrouter* yield the completion as it is generated (SSE).
 """
 
+import json
 import os
+from typing import AsyncIterator, Iterator
 
-import requests
-import json
 from dotenv import load_dotenv
+from api.services.llm_cache import (
+    cached_call, cached_call_async, get_cached, get_cached_async, put_cached, put_cached_async,
+)
+from api.services.llm_transport import post_json, post_json_async, stream_lines, stream_lines_async
+from api.services.rate_limit import get_bucket
 
 load_dotenv()
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 
 
+def _headers():
+    return {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}"
+    }
 
-def call_openrouter(messages, model="google/gemma-3-27b-it:free") -> str:
-    response = requests.post(
-        url = OPENROUTER_URL,
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}"
-        },
-        data=json.dumps({
-            "model": model,
-            "messages": messages
-        })
-    )
+def _payload(messages, model, stream=False):
+    payload = {
+        "model": model,
+        "messages": messages
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+def _content(response) -> str:
     # if there is no response.json()['choices], print the response text for debugging
-    if 'choices' not in response.json():
+    body = response.json()
+    if 'choices' not in body:
         print("Error response from OpenRouter:", response.text)
         raise ValueError("Invalid response from OpenRouter API")
-    return response.json()['choices'][0]['message']['content']
+    return body['choices'][0]['message']['content']
+
+def _delta(line: str) -> str:
+    """
+    Returns the content delta of one SSE line; "" for keep-alive comments,
+    the final [DONE] and other lines without content.
+    """
+    if not line.startswith("data:"):
+        return ""
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return ""
+    body = json.loads(data)
+    if "error" in body:
+        print("Error response from OpenRouter:", data)
+        raise ValueError("Invalid response from OpenRouter API")
+    choices = body.get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content") or ""
+
+def call_openrouter(messages, model="google/gemma-3-27b-it:free") -> str:
+    def _call():
+        get_bucket(model).acquire()
+        response = post_json(OPENROUTER_URL, _payload(messages, model), headers=_headers())
+        return _content(response)
+    return cached_call(model, messages, None, _call)
+
+async def call_openrouter_async(messages, model="google/gemma-3-27b-it:free") -> str:
+    async def _call():
+        await get_bucket(model).acquire_async()
+        response = await post_json_async(OPENROUTER_URL, _payload(messages, model), headers=_headers())
+        return _content(response)
+    return await cached_call_async(model, messages, None, _call)
+
+def stream_openrouter(messages, model="google/gemma-3-27b-it:free") -> Iterator[str]:
+    """
+    Yields the completion in chunks as they arrive. A cached completion
+    comes back as one chunk; a finished stream is cached like call_openrouter.
+    """
+    cached = get_cached(model, messages, None)
+    if cached is not None:
+        yield cached
+        return
+    get_bucket(model).acquire()
+    parts = []
+    for line in stream_lines(OPENROUTER_URL, _payload(messages, model, stream=True), headers=_headers()):
+        delta = _delta(line)
+        if delta:
+            parts.append(delta)
+            yield delta
+    put_cached(model, messages, None, "".join(parts))
+
+async def stream_openrouter_async(messages, model="google/gemma-3-27b-it:free") -> AsyncIterator[str]:
+    cached = await get_cached_async(model, messages, None)
+    if cached is not None:
+        yield cached
+        return
+    await get_bucket(model).acquire_async()
+    parts = []
+    async for line in stream_lines_async(OPENROUTER_URL, _payload(messages, model, stream=True), headers=_headers()):
+        delta = _delta(line)
+        if delta:
+            parts.append(delta)
+            yield delta
+    await put_cached_async(model, messages, None, "".join(parts))
 
 def call_openrouter_with_prompt(prompt, model="google/gemma-3-27b-it:free"):
     messages = [{
         "role": "user",
         "content": prompt
     }]
-    return call_openrouter(messages, model=model)
\ No newline at end of file
+    return call_openrouter(messages, model=model)
+
+async def call_openrouter_with_prompt_async(prompt, model="google/gemma-3-27b-it:free"):
+    messages = [{
+        "role": "user",
+        "content": prompt
+    }]
+    return await call_openrouter_async(messages, model=model)
@@ -0,0 +1,214 @@
+"""
+Per-model token buckets that keep LLM traffic under provider rate limits.
+
+Every upstream LLM request takes one token from its model's bucket
+before it is sent, so bursts are smoothed to the configured requests
+per minute instead of being answered with 429s. When several processes
+call the same provider, e.g. negotiation workers, one process hosts the
+buckets (BucketHost) and the others take tokens from it through
+use_remote_buckets(), so the limit holds for all of them together.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from configs import LLM_DEFAULT_RATE_LIMIT, LLM_RATE_LIMITS
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at rate tokens/second.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.throttled = 0
+        self.throttle_seconds = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        Takes tokens if available and returns 0, otherwise returns the number
+        of seconds until they will be.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                self.acquired += 1
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def time_until_available(self, tokens: float = 1) -> float:
+        """
+        Seconds until tokens could be taken, without taking them.
+        """
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1) -> None:
+        """
+        Blocks the calling thread until tokens are taken.
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                break
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            self._record_throttle(waited)
+
+    async def acquire_async(self, tokens: float = 1) -> None:
+        """
+        Waits on the event loop until tokens are taken.
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                break
+            await asyncio.sleep(wait)
+            waited += wait
+        if waited:
+            self._record_throttle(waited)
+
+    def _record_throttle(self, waited: float) -> None:
+        with self._lock:
+            self.throttled += 1
+            self.throttle_seconds += waited
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            self._refill()
+            return {
+                "rate_per_second": self.rate,
+                "capacity": self.capacity,
+                "available": self._tokens,
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "throttle_seconds": self.throttle_seconds,
+            }
+
+
+def _local_bucket(model: str) -> TokenBucket:
+    limit = LLM_RATE_LIMITS.get(model, LLM_DEFAULT_RATE_LIMIT)
+    return TokenBucket(rate=limit["rpm"] / 60.0, capacity=limit["burst"])
+
+
+class BucketHost:
+    """
+    Hands out tokens from this process's buckets to other processes.
+    """
+
+    def try_acquire(self, model: str, tokens: float = 1) -> float:
+        return get_bucket(model).try_acquire(tokens)
+
+    def time_until_available(self, model: str, tokens: float = 1) -> float:
+        return get_bucket(model).time_until_available(tokens)
+
+
+class RemoteBucket(TokenBucket):
+    """
+    A model's bucket held by a BucketHost in another process, reached
+    through a proxy. If the host cannot be reached, tokens come from a
+    local bucket with the full limit until it can be again.
+    """
+
+    def __init__(self, model: str, host: Any) -> None:
+        self._fallback = _local_bucket(model)
+        super().__init__(rate=self._fallback.rate, capacity=self._fallback.capacity)
+        self.model = model
+        self.host = host
+        self.logger = logging.getLogger(__name__)
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        try:
+            wait = self.host.try_acquire(self.model, tokens)
+        except (EOFError, OSError) as e:
+            self.logger.warning(f"Rate limit host unreachable ({e!r}), using a local bucket for {self.model}")
+            wait = self._fallback.try_acquire(tokens)
+        if wait == 0:
+            with self._lock:
+                self.acquired += 1
+        return wait
+
+    def time_until_available(self, tokens: float = 1) -> float:
+        try:
+            return self.host.time_until_available(self.model, tokens)
+        except (EOFError, OSError):
+            return self._fallback.time_until_available(tokens)
+
+    async def acquire_async(self, tokens: float = 1) -> None:
+        # Each attempt is a round trip to the host, so keep it off the loop
+        loop = asyncio.get_running_loop()
+        waited = 0.0
+        while True:
+            wait = await loop.run_in_executor(None, self.try_acquire, tokens)
+            if wait == 0:
+                break
+            await asyncio.sleep(wait)
+            waited += wait
+        if waited:
+            self._record_throttle(waited)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "rate_per_second": self.rate,
+                "capacity": self.capacity,
+                "remote": True,
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "throttle_seconds": self.throttle_seconds,
+            }
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+_host: Optional[Any] = None
+
+
+def use_remote_buckets(host: Any) -> None:
+    """
+    Makes get_bucket take tokens from host, a BucketHost or a proxy of
+    one, from now on.
+    """
+    global _host
+    with _buckets_lock:
+        _host = host
+        _buckets.clear()
+
+
+def get_bucket(model: str) -> TokenBucket:
+    """
+    Returns the shared bucket for model, creating it from LLM_RATE_LIMITS
+    (or LLM_DEFAULT_RATE_LIMIT) on first use.
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(model)
+        if bucket is None:
+            bucket = RemoteBucket(model, _host) if _host is not None else _local_bucket(model)
+            _buckets[model] = bucket
+        return bucket
+
+
+def bucket_stats() -> Dict[str, Dict[str, float]]:
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    return {model: bucket.stats() for model, bucket in buckets.items()}
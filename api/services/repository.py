@@ -0,0 +1,77 @@
+"""
+Process-wide, indexed in-memory repository over the JSON data files.
+
+Each JSON file is parsed once into a table of rows with a primary key
+index and optional secondary indexes. Tables are reloaded lazily when
+the backing file changes on disk and are kept in sync directly when
+written through this module, so lookups on the hot path are O(1) dict
+accesses with no file I/O. Tickets, bids and trades are journaled (see
+api.services.journal) so their writes do not rewrite the whole file,
+or live in SQLite when STORAGE_BACKEND is "sqlite" (see
+api.services.sqlite_store).
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from api.services.journal import JournaledTable
+from api.services.json_table import JsonTable, update_many_tables
+from api.services.sqlite_store import SqliteBids, SqliteDatabase, SqliteTickets, SqliteTrades
+from configs import (
+    BIDS_JSON, BUYERS, EVENTS_JSON, NEGOTIATION_JOBS_JSON, NEGOTIATION_RESULTS_JSON, SELLERS, SQLITE_PATH, STORAGE_BACKEND, TICKETS_JSON,
+    TRADES_JSON, VENUES_JSON,
+)
+
+if STORAGE_BACKEND == "sqlite":
+    market_db = SqliteDatabase(SQLITE_PATH)
+    tickets = SqliteTickets(market_db, seed_path=TICKETS_JSON)
+    bids = SqliteBids(market_db, seed_path=BIDS_JSON)
+    trades = SqliteTrades(market_db, seed_path=TRADES_JSON)
+elif STORAGE_BACKEND == "json":
+    tickets = JournaledTable(TICKETS_JSON, "ticket_id", indexes=["event_id", ("event_id", "group_id"), "seller_id"])
+    bids = JournaledTable(BIDS_JSON, "bid_id", indexes=["event_id", "buyer_id", ("event_id", "allowed_groups")])
+    trades = JournaledTable(TRADES_JSON, "trade_id", indexes=["bid_id", "ticket_id"])
+else:
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}, expected 'json' or 'sqlite'")
+
+events = JsonTable(EVENTS_JSON, "event_id", indexes=["venue_id"])
+venues = JsonTable(VENUES_JSON, "venue_id")
+buyers = JsonTable(BUYERS, "buyer_id")
+sellers = JsonTable(SELLERS, "seller_id")
+# Negotiation jobs stay journaled JSON with either backend
+negotiation_jobs = JournaledTable(NEGOTIATION_JOBS_JSON, "job_id", indexes=["status"])
+# One row per streamed result, so appending one journals only that result
+negotiation_results = JournaledTable(NEGOTIATION_RESULTS_JSON, "result_id", indexes=["job_id"])
+
+
+def find_submarket_tickets(event_id: str, group_id: str) -> List[dict]:
+    """
+    Returns ticket rows listed for the given event and seating group.
+    """
+    return tickets.find(("event_id", "group_id"), (event_id, group_id))
+
+
+def find_submarket_bids(event_id: str, group_id: str) -> List[dict]:
+    """
+    Returns bid rows for the event that accept the given seating group,
+    including bids with an empty allowed_groups list (any group).
+    """
+    index = ("event_id", "allowed_groups")
+    return bids.find(index, (event_id, group_id)) + bids.find(index, (event_id, None))
+
+
+def update_tickets_and_bids(
+    ticket_fns: Dict[str, Callable[[dict], Optional[dict]]],
+    bid_fns: Dict[str, Callable[[dict], Optional[dict]]],
+    new_tickets: Iterable[dict] = (),
+    new_bids: Iterable[dict] = (),
+    new_trades: Iterable[dict] = (),
+) -> Optional[Tuple[List[dict], List[dict]]]:
+    """
+    Runs update_many on tickets and bids as one unit, e.g. to settle a
+    trade on both sides, putting the new_* rows in the same unit. Returns
+    the written (tickets, bids) rows, or None if either update was refused
+    and nothing was written.
+    """
+    updates = [(tickets, ticket_fns, new_tickets), (bids, bid_fns, new_bids), (trades, {}, new_trades)]
+    results = market_db.update_many(updates) if STORAGE_BACKEND == "sqlite" else update_many_tables(updates)
+    return (results[0], results[1]) if results is not None else None
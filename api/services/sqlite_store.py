@@ -0,0 +1,562 @@
+"""
+SQLite-backed market store for tickets, bids and trades.
+
+An optional alternative to the journaled JSON tables, selected with
+STORAGE_BACKEND = "sqlite" in configs.py. The database runs in WAL mode
+and holds no state in process memory, so several uvicorn workers can
+read and write it concurrently. Submarket loads are range scans over a
+covering (event_id, group_id) index for tickets and over the
+bid_allowed_groups join table for bids.
+
+The tables expose the same get/all/find/put/delete/update interface as
+JsonTable, so the models and services do not care which backend is in
+use. On first use each table is seeded from its JSON snapshot and journal.
+
+Every write also records the old and new row in a change log, in the
+same transaction. refresh() checks PRAGMA data_version and replays the
+changes other processes made to this process's listeners, so in-memory
+indexes built on the tables stay current across workers.
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from api.services.journal import JournaledTable
+from api.services.json_table import Listener
+from configs import REPOSITORY_STAT_INTERVAL, SQLITE_CHANGE_LOG_RETENTION
+
+logger = logging.getLogger(__name__)
+
+# Stays below SQLite's limit on host parameters in one statement
+_MAX_PARAMS = 500
+# Writes between prunes of the change log
+_PRUNE_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id TEXT PRIMARY KEY,
+    seller_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    price REAL NOT NULL,
+    min_price REAL NOT NULL,
+    date TEXT NOT NULL,
+    sensitivity TEXT NOT NULL,
+    immediate_sale INTEGER NOT NULL
+);
+
+-- Covers every ticket column so submarket loads never touch the table itself
+CREATE INDEX IF NOT EXISTS idx_tickets_event_group ON tickets (
+    event_id, group_id, ticket_id, seller_id, quantity, price, min_price, date, sensitivity, immediate_sale
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_seller ON tickets (seller_id);
+
+CREATE TABLE IF NOT EXISTS bids (
+    bid_id TEXT PRIMARY KEY,
+    buyer_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    num_tickets INTEGER NOT NULL,
+    max_price REAL NOT NULL,
+    price REAL NOT NULL,
+    sensitivity_to_price TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_bids_event ON bids (event_id);
+CREATE INDEX IF NOT EXISTS idx_bids_buyer ON bids (buyer_id);
+
+-- One row per allowed group; a NULL group_id means the bid accepts any group
+CREATE TABLE IF NOT EXISTS bid_allowed_groups (
+    bid_id TEXT NOT NULL REFERENCES bids (bid_id) ON DELETE CASCADE,
+    event_id TEXT NOT NULL,
+    group_id TEXT,
+    position INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_bid_groups_event_group ON bid_allowed_groups (event_id, group_id, bid_id);
+CREATE INDEX IF NOT EXISTS idx_bid_groups_bid ON bid_allowed_groups (bid_id);
+
+-- Instant order-book trades, written with the ticket and bid they settle
+CREATE TABLE IF NOT EXISTS trades (
+    trade_id TEXT PRIMARY KEY,
+    bid_id TEXT NOT NULL,
+    ticket_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    group_id TEXT,
+    price REAL NOT NULL,
+    quantity INTEGER NOT NULL,
+    executed_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_trades_bid ON trades (bid_id);
+CREATE INDEX IF NOT EXISTS idx_trades_ticket ON trades (ticket_id);
+
+-- Row changes, replayed to the listeners of other processes
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tbl TEXT NOT NULL,
+    writer TEXT NOT NULL,
+    old_row TEXT,
+    new_row TEXT,
+    at REAL NOT NULL
+);
+"""
+
+_writer: Optional[Tuple[int, str]] = None
+
+
+def _writer_id() -> str:
+    """
+    Identifies this process in the change log; forked children get their own.
+    """
+    global _writer
+    if _writer is None or _writer[0] != os.getpid():
+        _writer = (os.getpid(), f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+    return _writer[1]
+
+
+def _chunks(items: List[Any], size: int = _MAX_PARAMS) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class SqliteDatabase:
+    """
+    Hands out one connection per thread to a WAL-mode database file and
+    creates the schema on first use.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def transaction(self) -> "_Transaction":
+        """
+        Returns a context manager running a BEGIN IMMEDIATE transaction, which
+        takes the database write lock up front so read-modify-write sequences
+        are atomic across processes.
+        """
+        return _Transaction(self.connection())
+
+    def snapshot(self) -> "_Transaction":
+        """
+        Returns a context manager running a read transaction, so several
+        selects see the same state of the database.
+        """
+        return _Transaction(self.connection(), "BEGIN")
+
+    def changed(self, key: str) -> bool:
+        """
+        Whether another connection committed since this thread last asked
+        on behalf of key.
+        """
+        conn = self.connection()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        seen = getattr(self._local, "data_versions", None)
+        if seen is None:
+            seen = self._local.data_versions = {}
+        changed = version != seen.get(key)
+        seen[key] = version
+        return changed
+
+
+    def update_many(
+        self, updates: List[Tuple["SqliteTable", Dict[str, Callable[[dict], Optional[dict]]], Iterable[dict]]]
+    ) -> Optional[List[List[dict]]]:
+        """
+        update_many over several tables of this database in one
+        transaction, each with rows to put alongside: either every fn
+        applies and every row is put, or nothing is written.
+        """
+        for table, _, _ in updates:
+            table._ensure_seeded()
+        changes = []
+        try:
+            with self.transaction() as conn:
+                for table, fns, puts in updates:
+                    changes.append(table._update_rows(conn, fns, puts))
+        except _Rollback:
+            return None
+        for (table, _, _), table_changes in zip(updates, changes):
+            table._notify(table_changes)
+        return [[new_row for _, new_row in table_changes] for table_changes in changes]
+
+
+class _Rollback(Exception):
+    """
+    Raised inside a transaction to roll it back without an error.
+    """
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection, begin: str = "BEGIN IMMEDIATE") -> None:
+        self.conn = conn
+        self.begin = begin
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute(self.begin)
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+
+
+class SqliteTable:
+    """
+    Base class mapping a JsonTable-style interface onto one SQLite table.
+    Subclasses define the table, its columns and the row conversions.
+    """
+
+    table: str = ""
+    primary_key: str = ""
+    columns: Tuple[str, ...] = ()
+
+    def __init__(self, db: SqliteDatabase, seed_path: Optional[str] = None) -> None:
+        self.db = db
+        self.seed_path = seed_path
+        self._seed_lock = threading.Lock()
+        self._seeded = False
+        self._listeners: List[Listener] = []
+        self._listener_lock = threading.RLock()
+        # Last change log entry replayed to the listeners
+        self._last_seq = 0
+        self._last_check = 0.0
+        self._writes = 0
+
+    # Seeding
+
+    def _ensure_seeded(self) -> None:
+        if self._seeded:
+            return
+        with self._seed_lock:
+            if self._seeded:
+                return
+            with self.db.transaction() as conn:
+                marker = f"seeded:{self.table}"
+                if conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone() is None:
+                    if self.seed_path is not None:
+                        for row in JournaledTable(self.seed_path, self.primary_key).all():
+                            self._write(conn, row)
+                    conn.execute("INSERT INTO meta (key, value) VALUES (?, '1')", (marker,))
+            self._seeded = True
+
+    # Row conversion hooks
+
+    def _select(self, conn: sqlite3.Connection, where: str, params: tuple) -> List[dict]:
+        raise NotImplementedError
+
+    def _write(self, conn: sqlite3.Connection, row: dict) -> None:
+        raise NotImplementedError
+
+    def _where(self, index: Any, value: Any) -> Tuple[str, tuple]:
+        fields = (index,) if isinstance(index, str) else tuple(index)
+        values = (value,) if isinstance(index, str) else tuple(value)
+        for field in fields:
+            if field not in self.columns:
+                raise KeyError(f"No index {index!r} on {self.table}")
+        clause = " AND ".join(f"{field} = ?" for field in fields)
+        return clause, values
+
+    # Reads
+
+    def get(self, key: str) -> Optional[dict]:
+        self._ensure_seeded()
+        rows = self._select(self.db.connection(), f"{self.primary_key} = ?", (key,))
+        return rows[0] if rows else None
+
+    def all(self) -> List[dict]:
+        self._ensure_seeded()
+        return self._select(self.db.connection(), "1 = 1", ())
+
+    def find(self, index: Any, value: Any) -> List[dict]:
+        self._ensure_seeded()
+        clause, params = self._where(index, value)
+        return self._select(self.db.connection(), clause, params)
+
+    def invalidate(self) -> None:
+        # Nothing is cached in process memory
+        return None
+
+    def refresh(self) -> None:
+        """
+        Replays changes made by other processes to the listeners. Checks
+        at most once every REPOSITORY_STAT_INTERVAL seconds.
+        """
+        if not self._listeners:
+            return
+        now = time.monotonic()
+        if now - self._last_check < REPOSITORY_STAT_INTERVAL:
+            return
+        self._last_check = now
+        if not self.db.changed(self.table):
+            return
+        with self._listener_lock:
+            with self.db.snapshot() as conn:
+                self._catch_up(conn)
+
+    # Change listeners
+
+    def add_listener(self, listener: Listener) -> None:
+        """
+        Registers listener and replays the current rows to it as inserts.
+        Listeners also hear about writes made by other processes, on refresh().
+        """
+        self._ensure_seeded()
+        with self._listener_lock:
+            with self.db.snapshot() as conn:
+                # Existing listeners catch up to the snapshot the new one starts from
+                self._catch_up(conn)
+                rows = self._select(conn, "1 = 1", ())
+            self._listeners.append(listener)
+            for row in rows:
+                listener(None, row)
+
+    def _catch_up(self, conn: sqlite3.Connection) -> None:
+        """
+        Replays other processes' changes since the last replay; called with
+        the listener lock held, inside a read transaction.
+        """
+        if not self._listeners:
+            self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            return
+        oldest = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+        if oldest is not None and oldest > self._last_seq + 1 and self._last_seq:
+            logger.warning(
+                f"Change log of {self.table} was pruned past this process; "
+                f"changes older than {SQLITE_CHANGE_LOG_RETENTION}s were missed"
+            )
+        records = conn.execute(
+            "SELECT seq, writer, old_row, new_row FROM changes WHERE tbl = ? AND seq > ? ORDER BY seq",
+            (self.table, self._last_seq),
+        ).fetchall()
+        writer = _writer_id()
+        for seq, record_writer, old_row, new_row in records:
+            self._last_seq = seq
+            if record_writer == writer:
+                # Already told when it was written
+                continue
+            old = json.loads(old_row) if old_row is not None else None
+            new = json.loads(new_row) if new_row is not None else None
+            for listener in self._listeners:
+                listener(old, new)
+        if not records:
+            self._last_seq = max(self._last_seq, conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0])
+
+    def _log(self, conn: sqlite3.Connection, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> None:
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO changes (tbl, writer, old_row, new_row, at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (self.table, _writer_id(),
+                 json.dumps(old_row) if old_row is not None else None,
+                 json.dumps(new_row) if new_row is not None else None, now)
+                for old_row, new_row in changes
+            ],
+        )
+        self._writes += 1
+        if self._writes % _PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM changes WHERE at < ?", (now - SQLITE_CHANGE_LOG_RETENTION,))
+
+    def _notify(self, changes: List[Tuple[Optional[dict], Optional[dict]]]) -> None:
+        if not self._listeners:
+            return
+        with self._listener_lock:
+            for old_row, new_row in changes:
+                for listener in self._listeners:
+                    listener(old_row, new_row)
+
+    # Writes
+
+    def put(self, row: dict) -> dict:
+        self._ensure_seeded()
+        with self.db.transaction() as conn:
+            old_rows = self._select(conn, f"{self.primary_key} = ?", (row[self.primary_key],))
+            self._write(conn, row)
+            changes = [(old_rows[0] if old_rows else None, row)]
+            self._log(conn, changes)
+        self._notify(changes)
+        return row
+
+    def delete(self, key: str) -> Optional[dict]:
+        self._ensure_seeded()
+        with self.db.transaction() as conn:
+            rows = self._select(conn, f"{self.primary_key} = ?", (key,))
+            if not rows:
+                return None
+            conn.execute(f"DELETE FROM {self.table} WHERE {self.primary_key} = ?", (key,))
+            self._log(conn, [(rows[0], None)])
+        self._notify([(rows[0], None)])
+        return rows[0]
+
+    def update(self, key: str, fn: Callable[[dict], Optional[dict]]) -> Optional[dict]:
+        self._ensure_seeded()
+        with self.db.transaction() as conn:
+            rows = self._select(conn, f"{self.primary_key} = ?", (key,))
+            if not rows:
+                return None
+            new_row = fn(dict(rows[0]))
+            if new_row is None:
+                return None
+            self._write(conn, new_row)
+            self._log(conn, [(rows[0], new_row)])
+        self._notify([(rows[0], new_row)])
+        return new_row
+
+    def _update_rows(
+        self, conn: sqlite3.Connection, fns: Dict[str, Callable[[dict], Optional[dict]]], puts: Iterable[dict] = ()
+    ) -> List[Tuple[Optional[dict], dict]]:
+        """
+        Applies update_many's fns, then puts, inside an open write
+        transaction and returns the (old, new) changes; raises _Rollback if
+        any row is missing or any fn returns None.
+        """
+        changes: List[Tuple[Optional[dict], dict]] = []
+        for key, fn in fns.items():
+            rows = self._select(conn, f"{self.primary_key} = ?", (key,))
+            new_row = fn(dict(rows[0])) if rows else None
+            if new_row is None:
+                raise _Rollback()
+            self._write(conn, new_row)
+            changes.append((rows[0], new_row))
+        for row in puts:
+            old_rows = self._select(conn, f"{self.primary_key} = ?", (row[self.primary_key],))
+            self._write(conn, row)
+            changes.append((old_rows[0] if old_rows else None, row))
+        self._log(conn, changes)
+        return changes
+
+    def update_many(self, fns: Dict[str, Callable[[dict], Optional[dict]]]) -> Optional[List[dict]]:
+        results = self.db.update_many([(self, fns, ())])
+        return results[0] if results is not None else None
+
+
+class SqliteTickets(SqliteTable):
+    table = "tickets"
+    primary_key = "ticket_id"
+    columns = (
+        "ticket_id", "seller_id", "event_id", "group_id", "quantity",
+        "price", "min_price", "date", "sensitivity", "immediate_sale",
+    )
+
+    def _select(self, conn: sqlite3.Connection, where: str, params: tuple) -> List[dict]:
+        cursor = conn.execute(
+            f"SELECT {', '.join(self.columns)} FROM tickets WHERE {where} ORDER BY rowid", params
+        )
+        rows = []
+        for record in cursor:
+            row = dict(record)
+            row["immediate_sale"] = bool(row["immediate_sale"])
+            rows.append(row)
+        return rows
+
+    def _write(self, conn: sqlite3.Connection, row: dict) -> None:
+        values = [row.get(column) for column in self.columns]
+        values[self.columns.index("immediate_sale")] = int(bool(row.get("immediate_sale")))
+        assignments = ", ".join(f"{c} = excluded.{c}" for c in self.columns[1:])
+        conn.execute(
+            f"INSERT INTO tickets ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))}) "
+            f"ON CONFLICT (ticket_id) DO UPDATE SET {assignments}",
+            values,
+        )
+
+
+class SqliteBids(SqliteTable):
+    table = "bids"
+    primary_key = "bid_id"
+    columns = (
+        "bid_id", "buyer_id", "event_id", "num_tickets",
+        "max_price", "price", "sensitivity_to_price",
+    )
+
+    def _where(self, index: Any, value: Any) -> Tuple[str, tuple]:
+        if index == ("event_id", "allowed_groups"):
+            event_id, group_id = value
+            clause = "bid_id IN (SELECT bid_id FROM bid_allowed_groups WHERE event_id = ? AND group_id IS ?)"
+            return clause, (event_id, group_id)
+        return super()._where(index, value)
+
+    def _select(self, conn: sqlite3.Connection, where: str, params: tuple) -> List[dict]:
+        cursor = conn.execute(
+            f"SELECT {', '.join(self.columns)} FROM bids WHERE {where} ORDER BY rowid", params
+        )
+        rows: Dict[str, dict] = {}
+        for record in cursor:
+            row = dict(record)
+            row["allowed_groups"] = []
+            rows[row["bid_id"]] = row
+        for ids in _chunks(list(rows)):
+            placeholders = ", ".join("?" * len(ids))
+            groups = conn.execute(
+                f"SELECT bid_id, group_id FROM bid_allowed_groups "
+                f"WHERE bid_id IN ({placeholders}) AND group_id IS NOT NULL ORDER BY bid_id, position",
+                ids,
+            )
+            for bid_id, group_id in groups:
+                rows[bid_id]["allowed_groups"].append(group_id)
+        return list(rows.values())
+
+    def _write(self, conn: sqlite3.Connection, row: dict) -> None:
+        values = [row.get(column) for column in self.columns]
+        assignments = ", ".join(f"{c} = excluded.{c}" for c in self.columns[1:])
+        conn.execute(
+            f"INSERT INTO bids ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))}) "
+            f"ON CONFLICT (bid_id) DO UPDATE SET {assignments}",
+            values,
+        )
+        conn.execute("DELETE FROM bid_allowed_groups WHERE bid_id = ?", (row["bid_id"],))
+        groups = row.get("allowed_groups") or [None]
+        conn.executemany(
+            "INSERT INTO bid_allowed_groups (bid_id, event_id, group_id, position) VALUES (?, ?, ?, ?)",
+            [(row["bid_id"], row["event_id"], group_id, i) for i, group_id in enumerate(groups)],
+        )
+
+
+class SqliteTrades(SqliteTable):
+    table = "trades"
+    primary_key = "trade_id"
+    columns = ("trade_id", "bid_id", "ticket_id", "event_id", "group_id", "price", "quantity", "executed_at")
+
+    def _select(self, conn: sqlite3.Connection, where: str, params: tuple) -> List[dict]:
+        cursor = conn.execute(
+            f"SELECT {', '.join(self.columns)} FROM trades WHERE {where} ORDER BY rowid", params
+        )
+        return [dict(record) for record in cursor]
+
+    def _write(self, conn: sqlite3.Connection, row: dict) -> None:
+        assignments = ", ".join(f"{c} = excluded.{c}" for c in self.columns[1:])
+        conn.execute(
+            f"INSERT INTO trades ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))}) "
+            f"ON CONFLICT (trade_id) DO UPDATE SET {assignments}",
+            [row.get(column) for column in self.columns],
+        )
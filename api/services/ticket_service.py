@@ -7,62 +7,66 @@ tickets. It acts as the API's data layer in place of a database for
 demo purposes.
 """
 
-import json
 import uuid
-from pathlib import Path
+from typing import Dict, Iterable
 from api.models.ticket import Ticket
+from api.services import repository
 
 
-DATA_PATH = Path(__file__).parents[1] / 'data' / 'tickets.json'
-
-def load_json():
-    tickets = {}
-    with open(DATA_PATH, 'r') as f:
-        tickets = json.load(f)
-    return tickets
-
 def list_tickets():
-    return load_json()
+    return repository.tickets.all()
 
-def create_ticket(ticket: Ticket):
-    tickets = load_json()
-    new_id = str(uuid.uuid4())
+def new_ticket(ticket: Ticket):
+    """
+    The row of a new listing, with its id; not stored yet.
+    """
     ticket_dict = ticket.model_dump()
-    ticket_dict['ticket_id'] = new_id
-    tickets.append(ticket_dict)
-
-    with open(DATA_PATH, 'w') as f:
-        json.dump(tickets, f, indent=2)
-
+    ticket_dict['ticket_id'] = str(uuid.uuid4())
     return ticket_dict
 
 def delete_ticket(id: str):
-    tickets = load_json()
-    updated_tickets = [t for t in tickets if t.get('ticket_id') != id]
-    if len(updated_tickets) == len(tickets):
+    if repository.tickets.delete(id) is None:
         return None
-    with open(DATA_PATH, 'w') as f:
-        json.dump(updated_tickets, f, indent=2)
     return True
 
-def reduce_quantity(ticket_id: str, amount: int):
-    tickets = load_json()
-    updated_ticket = None
-
-    for ticket in tickets:
-        if ticket.get('ticket_id') == ticket_id:
-            current_qty = ticket.get('quantity', 0)
-            if amount <= 0 or amount > current_qty:
-                return None
+def _reducer(amount: int, field: str = 'quantity'):
+    def _reduce(row: dict):
+        current_qty = row.get(field) or 0
+        if amount <= 0 or amount > current_qty:
+            return None
+        row[field] = current_qty - amount
+        return row
+    return _reduce
 
-            ticket['quantity'] = current_qty - amount
-            updated_ticket = ticket
-            break
-
-    if updated_ticket is None:
-        return None
-
-    with open(DATA_PATH, 'w') as f:
-        json.dump(tickets, f, indent=2)
-
-    return updated_ticket
+def reduce_quantity(ticket_id: str, amount: int):
+    return repository.tickets.update(ticket_id, _reducer(amount))
+
+def reduce_quantities(amounts: Dict[str, int]):
+    """
+    Reduces several tickets at once, all or nothing. Returns the updated
+    tickets, or None if any ticket is missing or short of quantity.
+    """
+    return repository.tickets.update_many(
+        {ticket_id: _reducer(amount) for ticket_id, amount in amounts.items()}
+    )
+
+def settle(
+    ticket_amounts: Dict[str, int],
+    bid_amounts: Dict[str, int],
+    new_tickets: Iterable[dict] = (),
+    new_bids: Iterable[dict] = (),
+    new_trades: Iterable[dict] = (),
+):
+    """
+    Takes sold quantities off tickets and the bids that bought them, and
+    stores any new tickets, bids and trade records, in one atomic commit,
+    all or nothing. The order books follow through the table listeners.
+    Returns the written tickets, or None if any ticket or bid is missing
+    or short of quantity.
+    """
+    result = repository.update_tickets_and_bids(
+        {ticket_id: _reducer(amount) for ticket_id, amount in ticket_amounts.items()},
+        {bid_id: _reducer(amount, 'num_tickets') for bid_id, amount in bid_amounts.items()},
+        new_tickets, new_bids, new_trades,
+    )
+    return result[0] if result is not None else None
@@ -6,4 +6,143 @@ VENUES_JSON = "api/data/venues.json"
 BUYERS = "api/data/buyer_id.json"
 SELLERS = "api/data/seller_id.json"
 PROMPTS_DIR = "api/prompts/"
-SEARCH_RESULTS_JSON = "api/data/search_results.json"
\ No newline at end of file
+SEARCH_RESULTS_JSON = "api/data/search_results.json"
+
+# Seconds between mtime checks of the JSON files backing the in-memory repository
+REPOSITORY_STAT_INTERVAL = 1.0
+
+# Journaled tables (tickets, bids) fold their journal into the snapshot once it
+# holds at least this many records and at least as many records as the table has rows
+JOURNAL_COMPACT_MIN_RECORDS = 1000
+# Seconds a group-commit leader waits for concurrent writers before fsyncing
+JOURNAL_GROUP_COMMIT_DELAY = 0.002
+
+# Where tickets and bids live: "json" (journaled JSON files) or "sqlite"
+STORAGE_BACKEND = "json"
+SQLITE_PATH = "api/data/market.db"
+# Seconds SQLite keeps row changes for other processes to replay to their listeners
+SQLITE_CHANGE_LOG_RETENTION = 3600.0
+
+# Number of listings the matcher returns for a bid
+MATCH_TOP_K = 5
+
+# LLM transport: pooled keep-alive connections per provider host, timeouts (seconds)
+# and retry-with-backoff for transport errors, 429s and 5xx responses
+LLM_MAX_CONNECTIONS_PER_HOST = 100
+LLM_MAX_KEEPALIVE_PER_HOST = 20
+LLM_TIMEOUT = 60.0
+LLM_CONNECT_TIMEOUT = 10.0
+LLM_MAX_RETRIES = 3
+LLM_BACKOFF_BASE = 0.5
+LLM_BACKOFF_MAX = 8.0
+
+# LLM response cache: in-memory LRU bounded by entries and bytes, optional on-disk
+# tier (set LLM_CACHE_DIR to a directory), entries expire after LLM_CACHE_TTL seconds
+LLM_CACHE_ENABLED = True
+LLM_CACHE_MAX_ENTRIES = 2048
+LLM_CACHE_MAX_BYTES = 32 * 1024 * 1024
+LLM_CACHE_TTL = 3600.0
+LLM_CACHE_DIR = None
+LLM_CACHE_MAX_DISK_ENTRIES = 20000
+
+# Provider rate limits per model (requests per minute and burst size) enforced
+# with a token bucket before every upstream LLM request
+LLM_RATE_LIMITS = {
+    "openai/gpt-5-nano": {"rpm": 600, "burst": 20},
+}
+LLM_DEFAULT_RATE_LIMIT = {"rpm": 120, "burst": 5}
+
+# Model used by the negotiation agents
+NEGOTIATION_MODEL = "openai/gpt-5-nano"
+# Negotiations admitted concurrently per model, and seconds each may take
+NEGOTIATION_MAX_CONCURRENCY = 16
+NEGOTIATION_TIMEOUT = 180.0
+
+# Issue the buyer's and seller's LLM turns of a round concurrently
+CONCURRENT_TURNS = True
+TURN_EXECUTOR_WORKERS = 32
+
+# Negotiation strategies: "llm", or the rule-based "boulware", "conceder", "linear"
+# and "concession" (curve chosen by price sensitivity). A submarket can override
+# the strategy for all of its agents.
+DEFAULT_STRATEGY = "llm"
+STRATEGY_BY_SENSITIVITY = {}
+BOULWARE_BETA = 0.3
+CONCEDER_BETA = 3.0
+CONCESSION_BETAS = {"high": BOULWARE_BETA, "normal": 1.0, "low": CONCEDER_BETA}
+
+# Batching of concurrent call_gpt prompts of one side into one packed
+# request: how long a prompt may wait for others while packs are in flight
+# (seconds), the pack size limit and
+# how many packed requests may be outstanding per model
+LLM_BATCH_ENABLED = True
+LLM_BATCH_WINDOW = 0.05
+LLM_BATCH_MAX_ITEMS = 8
+LLM_BATCH_MAX_IN_FLIGHT = 16
+
+# Minimum seconds between checks of PROMPTS_DIR for changed prompt templates
+PROMPT_STAT_INTERVAL = 1.0
+
+# Negotiation prompt history: the most recent turns kept verbatim (older ones
+# are condensed into an offer ladder) and the token budget for a whole prompt
+HISTORY_KEEP_TURNS = 4
+PROMPT_TOKEN_BUDGET = 1500
+
+# Transaction resolver: what the allocation maximizes per ticket ("surplus",
+# i.e. bid max_price minus ticket min_price, or "revenue") and how often to
+# re-allocate when inventory changes while committing
+RESOLVER_OBJECTIVE = "surplus"
+RESOLVER_COMMIT_ATTEMPTS = 3
+
+# Order books: orders that cross on arrival trade immediately at the ticket's
+# list price; the rest wait for negotiation. Depth levels returned by default.
+ORDER_BOOK_ENABLED = True
+ORDER_BOOK_DEPTH_LEVELS = 10
+# Record of every instant trade (the trades table of SQLite with that backend)
+TRADES_JSON = "api/data/trades.json"
+
+# Relative accuracy of the per-submarket price quantile sketches
+MARKET_STATS_RELATIVE_ACCURACY = 0.005
+
+# Orchestrated runs over whole events or the catalog: pair negotiations in
+# flight across all submarkets at once, and whether each event's agreements
+# are committed through the transaction resolver
+ORCHESTRATOR_MAX_CONCURRENCY = 64
+ORCHESTRATOR_RESOLVE = True
+
+# Where blocking negotiations run: "thread" (this process's thread pool),
+# "process" (local worker processes) or "broker" (workers on any node taking
+# jobs from the broker at WORKER_BROKER_ADDRESS). Workers keep this many
+# submarket snapshots rebuilt.
+NEGOTIATION_WORKERS = "thread"
+WORKER_PROCESSES = 4
+WORKER_BROKER_ADDRESS = ("127.0.0.1", 50070)
+# Seconds after which the broker drops the result queue of a client that
+# stopped polling
+WORKER_BROKER_CLIENT_TTL = 300.0
+WORKER_SNAPSHOT_CACHE = 64
+
+# Background negotiation jobs: durable job table, jobs run at once per
+# process, and how long the buyer websocket waits for its job's result
+NEGOTIATION_JOBS_JSON = "api/data/negotiation_jobs.json"
+NEGOTIATION_RESULTS_JSON = "api/data/negotiation_results.json"
+NEGOTIATION_JOB_CONCURRENCY = 4
+NEGOTIATION_JOB_WAIT = 300.0
+
+# Live negotiation events buffered per subscriber before the oldest offers
+# and counters are dropped
+EVENT_BUS_QUEUE_SIZE = 64
+
+# Stream the buyer websocket's intent completion and send fields to the client
+# as soon as each is complete
+INTENT_STREAMING = True
+
+# Catalog retrieval for the intent prompt: events sent to the model per request,
+# and the trigram similarity at which an unknown word matches a catalog word
+INTENT_CANDIDATE_EVENTS = 5
+CATALOG_FUZZY_MIN_SIMILARITY = 0.5
+
+# Rule-based intent parsing: first-turn buyer requests whose fields are all
+# parsed with at least this confidence build the bid without the LLM
+INTENT_FAST_PATH_ENABLED = True
+INTENT_FAST_PATH_MIN_CONFIDENCE = 0.8